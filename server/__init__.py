@@ -23,7 +23,6 @@ from .models import (
     AnalysisResult,
     SystemStatus,
     HealthCheck,
-    ContextEntry,
     PacketEvent
 )
 
@@ -50,7 +49,6 @@ __all__ = [
     'AnalysisResult',
     'SystemStatus',
     'HealthCheck',
-    'ContextEntry',
     
     # Services
     'WebSocketManager',
@@ -20,17 +20,120 @@ class Settings(BaseModel):
     # MLX model settings
     WEIGHTS_DIR: Path = ROOT_DIR / "weights"
     LLM_MODEL_PATH: str = str(ROOT_DIR / "weights/gemma-3-1b-it-4bit/")
+    SUMMARY_LLM_MODEL_PATH: str = ""  # Smaller text model for frame summaries ("" sends them to LLM_MODEL_PATH)
     YOLO_MODEL_PATH: str = str(ROOT_DIR / "weights/yolov11n/yolo11n.mlpackage")
     FASTVLM_MODEL_PATH: str = str(ROOT_DIR / "weights/fastvlm-0.5b/")
     PROCESSING_MODE: str = "split"  # "split" (VLM on device, LLM on server) or "full" (VLM+LLM on server)
     
     # Memory settings
     MAX_MEMORY_FRAMES: int = 1000
-    MEMORY_CLEANUP_INTERVAL: int = 300  # 5 minutes
+    MEMORY_CLEANUP_INTERVAL: int = 10  # Seconds between incremental memory maintenance passes
+    MEMORY_CLEANUP_BATCH: int = 1000  # Scene analyses removed per pass at most
+    SCENE_ANALYSIS_MAX_AGE: float = 1800.0  # Seconds a scene analysis is kept (it also leaves with its frame)
+    CONTEXT_WINDOW_SIZE: int = 64  # Recent frames kept as ready-made context entries (caps get_recent_context limits)
+    CONTEXT_DEVICE_IDLE_TTL: float = 3600.0  # Seconds without frames after which a device's context is dropped (0 keeps it)
+    TRACK_TTL: float = 5.0  # Seconds a tracked object is kept after it was last seen
+    TRACK_TRAJECTORY_LENGTH: int = 32  # Boxes kept per tracked object, oldest overwritten first
+    TRACK_TRAJECTORY_STRIDE: int = 1  # Record the box of every n-th detection of an object
+    IMAGE_STORE_MAX_BYTES: int = 64 * 1024 * 1024  # Decoded frame images kept in memory, least recently used evicted first
+    IMAGE_STORE_SPILL_PATH: str = ""  # File that evicted images are written to ("" drops them)
+    IMAGE_STORE_SPILL_MAX_BYTES: int = 1024 * 1024 * 1024  # Spill file size at which it is emptied and starts over
+    IMAGE_STORE_SPILL_INTERVAL: float = 1.0  # Seconds between background writes of evicted images to the spill file
+    
+    # Context log (append-only on-disk log of context memory, replayed at startup)
+    CONTEXT_LOG_DIR: str = ""  # Directory of the log segments ("" disables the log)
+    CONTEXT_LOG_SEGMENT_BYTES: int = 64 * 1024 * 1024  # Size at which a segment is closed and a new one started
+    CONTEXT_LOG_MAX_SEGMENTS: int = 16  # Newest segments kept by compaction, older ones are deleted
+    CONTEXT_LOG_FLUSH_INTERVAL: float = 1.0  # Seconds between batched writes of queued records
+    CONTEXT_LOG_RECOVERY_FRAMES: int = 2000  # Frames replayed from the tail of the log at startup
     
     # Processing settings
     IMAGE_SIZE: int = 1024 # Changed from 224 to match FastVLM CoreML requirement
     MAX_TEXT_LENGTH: int = 100
+    STREAM_PROMPT_RESPONSES: bool = True  # Send answers to user prompts as token_chunk messages while generating
+    STREAM_SCENE_ANALYSIS: bool = True  # Same for LLM scene analysis of frames
+    FRAME_WORKERS: int = 4  # Concurrent frame workers; frames of one device are still processed in order
+    FRAME_QUEUE_MAX_PER_DEVICE: int = 4  # Frames buffered per device before the overflow policy applies
+    FRAME_QUEUE_OVERFLOW_POLICY: str = "latest_wins"  # "drop_oldest", "latest_wins" or "reject"
+    
+    # Full mode pipeline settings (detect -> describe -> reason)
+    PIPELINE_CHANNEL_SIZE: int = 2  # Frames buffered in front of each stage
+    PIPELINE_DETECT_CONCURRENCY: int = 1
+    PIPELINE_DESCRIBE_CONCURRENCY: int = 1
+    PIPELINE_REASON_CONCURRENCY: int = 1
+    
+    # Scene change gate (reuse the last LLM analysis while the scene looks the same)
+    SCENE_CHANGE_THRESHOLD: float = 0.25  # 0 disables the gate
+    SCENE_CHANGE_MAX_REUSE: int = 15  # Force a fresh analysis after this many reuses
+    SCENE_CHANGE_MAX_AGE: float = 10.0  # Seconds before a cached analysis goes stale
+    
+    # Latency budget (frames that cannot meet it are dropped or answered without LLM/VLM)
+    FRAME_LATENCY_BUDGET: float = 3.0  # Seconds per frame, 0 disables deadline checks
+    FRAME_DEADLINE_CLOCK: str = "server"  # "server" (age from receipt) or "client" (age from frame timestamp)
+    
+    # Superseded frames (cancel a device's scene analysis when it sends a newer frame)
+    CANCEL_SUPERSEDED_FRAMES: bool = True
+    SUPERSEDE_MAX_CONSECUTIVE: int = 3  # Let an analysis finish after this many in a row were cancelled (0 = no limit)
+    
+    # Inference scheduling (interactive prompts > scene analysis > background work)
+    INFERENCE_CONCURRENCY: int = 1  # Model calls running at once (raised to LLM_BATCH_MAX_SIZE when batching, else capped at the text threads)
+    INFERENCE_INTERACTIVE_QUEUE_SIZE: int = 16
+    INFERENCE_SCENE_QUEUE_SIZE: int = 8
+    INFERENCE_BACKGROUND_QUEUE_SIZE: int = 32
+    VISION_EXECUTOR_THREADS: int = 2  # Threads for image decoding and CoreML prediction
+    
+    # Inference backend
+    INFERENCE_BACKEND: str = "mlx"  # "mlx" (Gemma on MLX, YOLO/FastVLM on CoreML) or "standin" (CPU stand-in for load tests)
+    STANDIN_SEED: int = 0  # Seeds stand-in outputs and latency samples
+    STANDIN_LATENCY_DISTRIBUTION: str = "lognormal"  # "fixed", "normal" or "lognormal"
+    STANDIN_TEXT_LATENCY: float = 0.8  # Mean seconds per stand-in generation
+    STANDIN_TEXT_LATENCY_STDDEV: float = 0.2
+    STANDIN_DETECT_LATENCY: float = 0.03  # Mean seconds per stand-in detection
+    STANDIN_DETECT_LATENCY_STDDEV: float = 0.01
+    STANDIN_DESCRIBE_LATENCY: float = 0.3  # Mean seconds per stand-in description
+    STANDIN_DESCRIBE_LATENCY_STDDEV: float = 0.05
+    STANDIN_BATCH_STEP_OVERHEAD: float = 0.1  # Extra decode-step cost per additional batched sequence
+    STANDIN_SUMMARY_LATENCY_SCALE: float = 0.3  # Stand-in summary model latency relative to the main model
+    STANDIN_SUMMARY_FAILURE_RATE: float = 0.1  # Share of stand-in summary outputs that are degenerate
+    
+    # Continuous batching of text generation
+    LLM_BATCH_MAX_SIZE: int = 1  # Sequences decoded together (1 disables batching)
+    LLM_BATCH_WINDOW: float = 0.02  # Seconds to wait for more prompts before starting a batch
+    
+    # Model worker processes (0 keeps the models in the web process)
+    MODEL_WORKER_PROCESSES: int = 0  # Each worker loads its own copy of the models
+    MODEL_WORKER_SHM_SLOTS: int = 8  # Shared-memory buffers for passing images to workers
+    MODEL_WORKER_SHM_SLOT_BYTES: int = 4 * 1024 * 1024  # Larger images are sent inline
+    MODEL_WORKER_STARTUP_TIMEOUT: float = 300.0  # Seconds to wait for workers to load their models
+    
+    # Prompt prefix cache (reuses LLM attention state for shared prompt prefixes)
+    PROMPT_CACHE_ENABLED: bool = True
+    PROMPT_CACHE_MAX_ENTRIES: int = 8  # Cached prompts, least recently used evicted first
+    PROMPT_CACHE_MAX_BYTES: int = 256 * 1024 * 1024  # Memory cap for cached attention state
+    PROMPT_CACHE_MIN_PREFIX_TOKENS: int = 16  # Shorter shared prefixes are not worth reusing
+    
+    # LLM response cache (exact repeats of scene inputs or questions skip the model)
+    RESPONSE_CACHE_MAX_ENTRIES: int = 256  # 0 disables the cache
+    RESPONSE_CACHE_TTL: float = 30.0  # Seconds a cached response stays valid
+    RESPONSE_CACHE_SCOPE: str = "device"  # "device" or "global" (answers to questions are always cached per device)
+    
+    # Generation budgets (max tokens per request type, tightened as the inference queue grows)
+    SCENE_MAX_TOKENS: int = 40  # Scene summaries ask for at most 20 words and stop at the first sentence end
+    QUESTION_MAX_TOKENS: int = 120
+    TOKEN_BUDGET_MIN_FACTOR: float = 0.5  # Smallest share of a budget kept under load
+    TOKEN_BUDGET_QUEUE_DEPTH: int = 8  # Waiting requests at which budgets reach the minimum factor
+    TOKEN_BUDGET_FLOOR: int = 8  # Budgets never go below this many tokens
+    
+    # Model cascade (frame summaries on the summary model, escalated to the main model when they fail checks)
+    CASCADE_ESCALATION: bool = True
+    CASCADE_MIN_WORDS: int = 3  # Shorter summaries are escalated
+    CASCADE_MIN_DISTINCT_RATIO: float = 0.5  # Summaries repeating themselves more than this are escalated
+    
+    # Context packing (history added to prompts is capped in tokens, most relevant entries first)
+    SCENE_CONTEXT_TOKENS: int = 48  # History in scene analysis prompts
+    QUESTION_CONTEXT_TOKENS: int = 384  # History in question answering prompts
+    CONTEXT_CANDIDATES: int = 30  # Recent context entries considered for packing
+    CONTEXT_TOKEN_CACHE_SIZE: int = 4096  # Token counts of rendered context entries kept for reuse
     
     def __init__(self, **data: Dict[str, Any]):
         super().__init__(**data)
@@ -1,8 +1,9 @@
 """Orion Computer Vision Server using MLX."""
 import asyncio
+import json
 import logging
 from contextlib import asynccontextmanager
-from typing import Dict, Optional, Tuple
+from typing import Dict, List, Optional, Tuple, Union
 import time
 
 import uvicorn
@@ -18,8 +19,19 @@ from models import (
 from services.websocket_manager import WebSocketManager
 from services.llm_processor import LLMProcessor
 from services.context_memory import ContextMemory
-from services.model_manager import ModelManager
+from services.context_log import ContextLog
+from services.context_query import ContextQueryEngine
+from services.model_manager import ModelManager, TokenCallback
+from services.model_worker_pool import ModelWorkerPool
 from services.vision_processor import VisionProcessor # Import VisionProcessor
+from services.frame_dispatcher import FrameDispatcher, FrameQueueFullError
+from services.queue_state import QueueStateTracker
+from services.frame_pipeline import FrameJob, FramePipeline, PipelineStage
+from services.scene_change import SceneChangeGate
+from services.frame_deadline import FrameDeadline, DOWNGRADE, DROP
+from services.frame_supersession import FrameSupersession
+from services.cancellation import GenerationCancelled
+from services.inference_scheduler import InferenceScheduler
 from utils.logger import setup_logger, get_logger
 
 # Setup rich console and logging
@@ -30,9 +42,19 @@ logger = get_logger(__name__)
 websocket_manager: Optional[WebSocketManager] = None
 llm_processor: Optional[LLMProcessor] = None
 context_memory: Optional[ContextMemory] = None
-model_manager: Optional[ModelManager] = None
+context_query: Optional[ContextQueryEngine] = None
+model_manager: Optional[Union[ModelManager, ModelWorkerPool]] = None
 vision_processor: Optional[VisionProcessor] = None # Add vision_processor
-frame_queue: Optional[asyncio.Queue] = None # The new task queue
+frame_dispatcher: Optional[FrameDispatcher] = None # Worker pool for queued frames
+queue_state: Optional[QueueStateTracker] = None # Incremental queue view for dashboards
+frame_pipeline: Optional[FramePipeline] = None # Staged pipeline for full processing mode
+scene_change_gate: Optional[SceneChangeGate] = None # Skips LLM calls for unchanged scenes
+frame_deadline: Optional[FrameDeadline] = None # Per-frame latency budget checks
+frame_supersession: Optional[FrameSupersession] = None # Cancels analyses made obsolete by a newer frame
+inference_scheduler: Optional[InferenceScheduler] = None # Priority lanes in front of the model manager
+memory_maintenance_task: Optional[asyncio.Task] = None # Periodic incremental cleanup of context memory
+context_log_task: Optional[asyncio.Task] = None # Periodic batched writes of the context log
+image_spill_task: Optional[asyncio.Task] = None # Periodic writes of evicted frame images to the spill file
 
 def check_services() -> bool:
     """Check if all required services are initialized."""
@@ -40,64 +62,145 @@ def check_services() -> bool:
         websocket_manager is not None,
         llm_processor is not None,
         context_memory is not None,
+        context_query is not None,
         model_manager is not None,
         vision_processor is not None, # Check vision_processor
-        frame_queue is not None
+        frame_dispatcher is not None,
+        queue_state is not None,
+        frame_pipeline is not None,
+        scene_change_gate is not None,
+        frame_deadline is not None,
+        frame_supersession is not None,
+        inference_scheduler is not None
     ])
 
-async def frame_processor_worker():
-    """Worker that processes frames from the queue."""
-    logger.info("Frame processor worker started.")
+async def handle_queued_frame(job: FrameJob):
+    """Process a frame picked up by one of the dispatcher's workers."""
+    # Frames that waited out their whole latency budget in the queue are not worth processing
+    if frame_deadline.check(job, "admission") == DROP:
+        await notify_frames_dropped([job], "deadline_exceeded")
+        return
+
+    # Notify dashboard that an item is being processed
+    await queue_state.started(job.frame.frame_id)
+    outcome = "failed"
+    try:
+        await process_frame(job)
+        outcome = "superseded" if job.superseded else "processed"
+    finally:
+        await queue_state.finished(job.frame.frame_id, outcome)
+
+async def notify_frames_dropped(dropped: List[FrameJob], reason: str):
+    """Tell clients and dashboards about frames discarded before processing."""
+    if not websocket_manager or not dropped:
+        return
+    policy = frame_dispatcher.overflow_policy if frame_dispatcher and reason == "queue_overflow" else None
+    for job in dropped:
+        await websocket_manager.send_to_ios_client(job.client_id, {
+            "type": "frame_dropped",
+            "frame_id": job.frame.frame_id,
+            "reason": reason,
+            "overflow_policy": policy,
+            "age": frame_deadline.age(job) if frame_deadline else None
+        })
+        if queue_state:
+            await queue_state.finished(job.frame.frame_id, "dropped")
+    await websocket_manager.broadcast_event_to_dashboards("frames_dropped", {
+        "frame_ids": [job.frame.frame_id for job in dropped],
+        "reason": reason,
+        "overflow_policy": policy,
+        "queue_size": frame_dispatcher.qsize() if frame_dispatcher else 0
+    })
+
+async def run_memory_maintenance():
+    """Evict aged scene analyses and idle devices from context memory, a bounded batch at a time."""
     while True:
+        await asyncio.sleep(settings.MEMORY_CLEANUP_INTERVAL)
         try:
-            client_id, frame = await frame_queue.get()
-            
-            # Notify dashboard that an item is being processed
-            if websocket_manager and frame_queue:
-                queue_contents = []
-                for item in list(frame_queue._queue):
-                    client_id_in_queue, frame_in_queue = item
-                    queue_contents.append({
-                        "frame_id": frame_in_queue.frame_id,
-                        "timestamp": frame_in_queue.timestamp,
-                        "device_id": frame_in_queue.device_id,
-                        "status": "enqueued" # Indicate status in queue
-                    })
-                await websocket_manager.broadcast_event_to_dashboards(
-                    "frame_processing_started",
-                    {"queue_size": frame_queue.qsize(), "frame_id": frame.frame_id, "queue_contents": queue_contents}
-                )
-                
-            await process_frame(client_id, frame)
-            frame_queue.task_done()
-        except asyncio.CancelledError:
-            logger.info("Frame processor worker cancelled.")
-            break
+            result = context_memory.run_maintenance()
         except Exception as e:
-            logger.error(f"Error in frame processor worker: {e}")
+            logger.error(f"Context memory maintenance failed: {e}")
+            continue
+        if result["removed"] or result["devices_dropped"]:
+            logger.debug(
+                f"Context memory maintenance removed {result['removed']} analyses and "
+                f"{result['devices_dropped']} idle devices in {result['duration'] * 1000:.2f}ms"
+            )
+        if context_memory.log is not None:
+            context_memory.snapshot_objects()
+            try:
+                await asyncio.to_thread(context_memory.log.compact)
+            except Exception as e:
+                logger.error(f"Context log compaction failed: {e}")
+
+async def run_context_log_writer():
+    """Write the context log's queued records in batches, off the event loop."""
+    while True:
+        await asyncio.sleep(settings.CONTEXT_LOG_FLUSH_INTERVAL)
+        try:
+            await asyncio.to_thread(context_memory.log.flush)
+        except Exception as e:
+            logger.error(f"Writing context log failed: {e}")
+
+async def run_image_spill():
+    """Write images evicted from the image store to its spill file, off the event loop."""
+    while True:
+        await asyncio.sleep(settings.IMAGE_STORE_SPILL_INTERVAL)
+        try:
+            await asyncio.to_thread(context_memory.image_store.spill)
+        except Exception as e:
+            logger.error(f"Spilling frame images failed: {e}")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan manager for startup and shutdown."""
-    global websocket_manager, llm_processor, context_memory, model_manager, vision_processor, frame_queue
+    global websocket_manager, llm_processor, context_memory, context_query, model_manager, vision_processor, frame_dispatcher, queue_state, frame_pipeline, scene_change_gate, frame_deadline, frame_supersession, inference_scheduler, memory_maintenance_task, context_log_task, image_spill_task
     
     console.print("[bold green]🚀 Starting Orion Server (MLX)...[/bold green]")
     
     try:
         # Initialize model manager first
-        model_manager = ModelManager()
+        if settings.MODEL_WORKER_PROCESSES > 0:
+            model_manager = ModelWorkerPool()
+        else:
+            model_manager = ModelManager()
         await model_manager.initialize()
         
         # Initialize core services
-        context_memory = ContextMemory()
-        llm_processor = LLMProcessor(model_manager)
+        inference_scheduler = InferenceScheduler(model_manager)
+        await inference_scheduler.start()
+        context_memory = ContextMemory(log=ContextLog() if settings.CONTEXT_LOG_DIR else None)
+        if context_memory.log is not None:
+            restored = context_memory.restore()
+            logger.info(
+                f"Restored {restored['records']} context records of {restored['devices']} devices "
+                f"from {settings.CONTEXT_LOG_DIR} in {restored['duration'] * 1000:.1f}ms"
+            )
+        context_query = ContextQueryEngine(context_memory)
+        llm_processor = LLMProcessor(model_manager, inference_scheduler)
         vision_processor = VisionProcessor(model_manager) # Initialize vision_processor
+        scene_change_gate = SceneChangeGate()
+        frame_deadline = FrameDeadline()
+        frame_supersession = FrameSupersession()
         websocket_manager = WebSocketManager()
-        frame_queue = asyncio.Queue()
+        frame_dispatcher = FrameDispatcher(settings.FRAME_WORKERS)
+        queue_state = QueueStateTracker(websocket_manager.broadcast_event_to_dashboards, frame_dispatcher.overflow_policy)
         
-        # Start the background worker
-        worker_task = asyncio.create_task(frame_processor_worker())
+        frame_pipeline = FramePipeline([
+            PipelineStage("detect", pipeline_detect_stage, settings.PIPELINE_DETECT_CONCURRENCY, settings.PIPELINE_CHANNEL_SIZE),
+            PipelineStage("describe", pipeline_describe_stage, settings.PIPELINE_DESCRIBE_CONCURRENCY, settings.PIPELINE_CHANNEL_SIZE),
+            PipelineStage("reason", pipeline_reason_stage, settings.PIPELINE_REASON_CONCURRENCY, settings.PIPELINE_CHANNEL_SIZE)
+        ])
+        
+        # Start the background workers
+        await frame_dispatcher.start(handle_queued_frame)
+        await frame_pipeline.start()
+        memory_maintenance_task = asyncio.create_task(run_memory_maintenance())
+        if context_memory.log is not None:
+            context_log_task = asyncio.create_task(run_context_log_writer())
+        if context_memory.image_store.spill_path:
+            image_spill_task = asyncio.create_task(run_image_spill())
 
         # Initialize processors
         await llm_processor.initialize()
@@ -120,10 +223,31 @@ async def lifespan(app: FastAPI):
         # Cleanup on shutdown
         console.print("[bold yellow]🛑 Shutting down Orion Server...[/bold yellow]")
         
-        # Stop the worker
-        if 'worker_task' in locals() and not worker_task.done():
-            worker_task.cancel()
-            await asyncio.sleep(1) # Give it a moment to cancel
+        # Stop the workers
+        if memory_maintenance_task:
+            memory_maintenance_task.cancel()
+            try:
+                await memory_maintenance_task
+            except asyncio.CancelledError:
+                pass
+        if context_log_task:
+            context_log_task.cancel()
+            try:
+                await context_log_task
+            except asyncio.CancelledError:
+                pass
+        if image_spill_task:
+            image_spill_task.cancel()
+            try:
+                await image_spill_task
+            except asyncio.CancelledError:
+                pass
+        if frame_dispatcher:
+            await frame_dispatcher.shutdown()
+        if frame_pipeline:
+            await frame_pipeline.shutdown()
+        if inference_scheduler:
+            await inference_scheduler.shutdown()
 
         if websocket_manager:
             await websocket_manager.shutdown()
@@ -134,6 +258,8 @@ async def lifespan(app: FastAPI):
             await model_manager.cleanup()
         if vision_processor:
             await vision_processor.cleanup()
+        if context_memory:
+            context_memory.close()
             
         console.print("[bold green]✅ Shutdown completed successfully![/bold green]")
         logger.info("Server shutdown completed")
@@ -165,7 +291,10 @@ async def health_check():
             "llm_processor": llm_processor.is_healthy() if llm_processor else False,
             "websocket_manager": websocket_manager.is_healthy() if websocket_manager else False,
             "context_memory": context_memory.is_healthy() if context_memory else False,
-            "vision_processor": vision_processor.is_healthy() if vision_processor else False # Check vision_processor
+            "vision_processor": vision_processor.is_healthy() if vision_processor else False, # Check vision_processor
+            "frame_dispatcher": frame_dispatcher.is_healthy() if frame_dispatcher else False,
+            "frame_pipeline": frame_pipeline.is_healthy() if frame_pipeline else False,
+            "inference_scheduler": inference_scheduler.is_healthy() if inference_scheduler else False
         }
         
         all_healthy = all(services_status.values())
@@ -189,6 +318,13 @@ async def health_check():
             error=error_msg
         )
 
+@app.get("/queue")
+async def queue_snapshot():
+    """Full snapshot of queued and in-progress frames."""
+    if not queue_state:
+        raise HTTPException(status_code=503, detail="Server not ready")
+    return queue_state.snapshot()
+
 @app.websocket("/ios")
 async def ios_websocket(websocket: WebSocket):
     """WebSocket endpoint for iOS app connections."""
@@ -219,30 +355,31 @@ async def ios_websocket(websocket: WebSocket):
 
                 if message_type == "frame_data":
                     frame_data_message = FrameDataMessage.model_validate(message_json)
+                    job = FrameJob(client_id, frame_data_message)
                     if settings.PROCESSING_MODE == "full":
-                        # In full mode, process the frame directly and bypass the queue
-                        await process_frame(client_id, frame_data_message)
+                        # In full mode, hand the frame to the staged pipeline so the receive loop
+                        # only waits when the first stage's channel is full
+                        await frame_pipeline.submit(job)
                     else:
                         # In split mode, use the queue
-                        await frame_queue.put((client_id, frame_data_message))
-                        
+                        try:
+                            dropped = await frame_dispatcher.put(job)
+                        except FrameQueueFullError as e:
+                            logger.warning(f"Rejected frame {frame_data_message.frame_id} from {client_id}: {e}")
+                            await websocket_manager.send_to_ios_client(client_id, {
+                                "type": "error",
+                                "message": "Frame queue full",
+                                "details": str(e),
+                                "frame_id": frame_data_message.frame_id,
+                                "overflow_policy": frame_dispatcher.overflow_policy
+                            })
+                            continue
+
                         # Notify dashboard about the new item in queue
-                        if websocket_manager and frame_queue:
-                            # Get current queue contents without removing them
-                            queue_contents = []
-                            for item in list(frame_queue._queue):
-                                client_id_in_queue, frame_in_queue = item
-                                queue_contents.append({
-                                    "frame_id": frame_in_queue.frame_id,
-                                    "timestamp": frame_in_queue.timestamp,
-                                    "device_id": frame_in_queue.device_id,
-                                    "status": "enqueued" # Indicate status in queue
-                                })
-
-                            await websocket_manager.broadcast_event_to_dashboards(
-                                "frame_enqueued",
-                                {"queue_size": frame_queue.qsize(), "frame_id": frame_data_message.frame_id, "queue_contents": queue_contents}
-                            )
+                        await queue_state.added(frame_data_message)
+                        await notify_frames_dropped(dropped, "queue_overflow")
+                    # The new frame makes any scene analysis still running for the device obsolete
+                    frame_supersession.supersede(job.device_key, frame_data_message.frame_id)
                 elif message_type == "user_prompt":
                     user_prompt_message = UserPromptMessage.model_validate(message_json)
                     await process_user_prompt(client_id, user_prompt_message)
@@ -312,18 +449,24 @@ async def dashboard_websocket(websocket: WebSocket):
                 await websocket_manager.remove_dashboard_client(client_id)
             return
 
-        # Keep the connection alive, listen for potential messages (e.g., settings changes from dashboard)
-        # For now, it's mostly a one-way street (server to dashboard)
+        # Start the dashboard off with the full queue state; queue_delta events follow
+        await websocket.send_json({"type": "queue_snapshot", **queue_state.snapshot()})
+
+        # Keep the connection alive and answer control messages from the dashboard
         while True:
             try:
-                # Dashboards might not send data, or might send control messages in future
-                # Set a timeout to periodically check connection or allow server to send updates
-                # For now, just keep it open. If dashboard sends data, it would be received here.
-                # data = await websocket.receive_text()
-                # logger.debug(f"Received from dashboard {client_id}: {data}")
-                await asyncio.sleep(0.01) # Keep loop running, prevent tight loop if no receive_text
-                # This loop is mainly to keep the connection open from the server side.
-                # Actual data is broadcast from process_frame.
+                data = await websocket.receive_text()
+                try:
+                    message_type = json.loads(data).get("type")
+                except (ValueError, AttributeError):
+                    logger.debug(f"Ignoring non-JSON message from dashboard {client_id}")
+                    continue
+
+                if message_type == "request_queue_snapshot":
+                    # Dashboards ask for this when they notice a gap in queue_delta seq numbers
+                    await websocket.send_json({"type": "queue_snapshot", **queue_state.snapshot()})
+                else:
+                    logger.debug(f"Unhandled dashboard message type from {client_id}: {message_type}")
             except WebSocketDisconnect:
                 logger.info(f"Dashboard client {client_id} disconnected (explicitly by client or timeout).")
                 break # Exit loop on disconnect
@@ -346,8 +489,10 @@ async def dashboard_websocket(websocket: WebSocket):
             await websocket_manager.remove_dashboard_client(client_id)
 
 
-async def process_frame(client_id: str, frame: FrameDataMessage):
+async def process_frame(job: FrameJob):
     """Process incoming frame from iOS app."""
+    client_id = job.client_id
+    frame = job.frame
     if not check_services():
         if websocket_manager:
             await websocket_manager.send_to_ios_client(client_id, {
@@ -355,40 +500,16 @@ async def process_frame(client_id: str, frame: FrameDataMessage):
                 "message": "Server services not ready"
             })
         return
-        
-    packet_events = [] # Initialize list to store packet events
-    processing_start_time = time.time()
 
     try:
-        logger.info(f"Received frame {frame.frame_id} from {client_id} (Device: {frame.device_id}, Timestamp: {frame.timestamp}). Image data present: {frame.image_data is not None}. Detections count: {len(frame.detections) if frame.detections else 0}")
-
-        # Event: iOS Frame Received
-        packet_events.append(PacketEvent(
-            event_type="ios_frame_received",
-            timestamp=time.time(),
-            source="iOS Device",
-            destination="Server",
-            summary=f"Frame {frame.frame_id} received. Mode: {settings.PROCESSING_MODE}",
-            payload={
-                "frame_id": frame.frame_id,
-                "device_id": frame.device_id,
-                "image_data_present": frame.image_data is not None,
-                "detections_count": len(frame.detections) if frame.detections else 0
-            }
-        ).model_dump())
-        await websocket_manager.broadcast_event_to_dashboards("ios_frame_received", {"frame_id": frame.frame_id, "detections_count": len(frame.detections) if frame.detections else 0})
-
-        assert context_memory is not None
-        assert llm_processor is not None
-        assert websocket_manager is not None
-        assert vision_processor is not None # Assert vision_processor is not None
+        await begin_frame(job)
 
         # Process vision (YOLO + VLM) based on processing mode
         vision_analysis_start_time = time.time()
-        vision_analysis = await vision_processor.analyze_frame(frame)
+        job.vision_analysis = await vision_processor.analyze_frame(frame)
         
         # Ensure vision_analysis is not None or empty before proceeding
-        if not vision_analysis or not isinstance(vision_analysis, dict):
+        if not job.vision_analysis or not isinstance(job.vision_analysis, dict):
             logger.error(f"Vision analysis failed or returned invalid data for frame {frame.frame_id}")
             if websocket_manager:
                 await websocket_manager.send_to_ios_client(client_id, {
@@ -398,161 +519,347 @@ async def process_frame(client_id: str, frame: FrameDataMessage):
                 })
             return # Stop processing this frame
 
-        vision_analysis_duration = time.time() - vision_analysis_start_time
-
-        if settings.PROCESSING_MODE == "full":
-            packet_events.append(PacketEvent(
-                event_type="yolo_analysis_complete",
-                timestamp=time.time(),
-                source="Server",
-                destination="Server",
-                summary=f"YOLO analysis complete for frame {frame.frame_id}. Detections: {len(vision_analysis.get("detections", []))}",
-                payload={
-                    "frame_id": frame.frame_id,
-                    "detections_count": len(vision_analysis.get("detections", [])),
-                    "duration": vision_analysis_duration # This is actually vision_analysis duration, not just YOLO
-                }
-            ).model_dump())
+        job.vision_duration = time.time() - vision_analysis_start_time
+        # analyze_frame runs YOLO and VLM back to back, so only the combined duration is known
+        job.detection_duration = job.vision_duration
+        await record_vision_events(job)
 
-        packet_events.append(PacketEvent(
-            event_type="vlm_analysis_complete",
+        await run_scene_reasoning(job)
+        
+    except Exception as e:
+        await report_frame_error(job, e)
+
+async def begin_frame(job: FrameJob):
+    """Log and announce a newly received frame."""
+    frame = job.frame
+    logger.info(f"Received frame {frame.frame_id} from {job.client_id} (Device: {frame.device_id}, Timestamp: {frame.timestamp}). Image data present: {frame.image_data is not None}. Detections count: {len(frame.detections) if frame.detections else 0}")
+
+    # Event: iOS Frame Received
+    job.packet_events.append(PacketEvent(
+        event_type="ios_frame_received",
+        timestamp=time.time(),
+        source="iOS Device",
+        destination="Server",
+        summary=f"Frame {frame.frame_id} received. Mode: {settings.PROCESSING_MODE}",
+        payload={
+            "frame_id": frame.frame_id,
+            "device_id": frame.device_id,
+            "image_data_present": frame.image_data is not None,
+            "detections_count": len(frame.detections) if frame.detections else 0
+        }
+    ).model_dump())
+    await websocket_manager.broadcast_event_to_dashboards("ios_frame_received", {"frame_id": frame.frame_id, "detections_count": len(frame.detections) if frame.detections else 0})
+
+async def record_vision_events(job: FrameJob):
+    """Record YOLO/VLM packet events for a frame whose vision analysis is done."""
+    frame = job.frame
+    vision_analysis = job.vision_analysis
+
+    if settings.PROCESSING_MODE == "full":
+        job.packet_events.append(PacketEvent(
+            event_type="yolo_analysis_complete",
             timestamp=time.time(),
             source="Server",
             destination="Server",
-            summary=f"VLM analysis complete for frame {frame.frame_id}. Description: {vision_analysis.get("description", "N/A")[:50]}...",
+            summary=f"YOLO analysis complete for frame {frame.frame_id}. Detections: {len(vision_analysis.get('detections', []))}",
             payload={
                 "frame_id": frame.frame_id,
-                "description": vision_analysis.get("description"),
-                "confidence": vision_analysis.get("confidence"),
-                "duration": vision_analysis_duration
+                "detections_count": len(vision_analysis.get("detections", [])),
+                "duration": job.detection_duration
             }
         ).model_dump())
-        await websocket_manager.broadcast_event_to_dashboards("vlm_analysis_complete", {"frame_id": frame.frame_id, "vlm_description": vision_analysis.get("description", "N/A")})
-
-        # Store in context memory
-        # Note: context_memory.add_frame expects DetectionFrame, not FrameDataMessage directly
-        # We need to construct a DetectionFrame from the processed data or the original if split mode
-        processed_frame = DetectionFrame(
-            frame_id=frame.frame_id,
-            timestamp=frame.timestamp,
-            image_data=frame.image_data, # Keep original image data if present
-            detections=[Detection(**d) for d in vision_analysis.get("detections", [])], # Use processed detections
-            device_id=frame.device_id,
-            vlm_description=vision_analysis.get("description"),
-            vlm_confidence=vision_analysis.get("confidence")
-        )
-        context_memory.add_frame(processed_frame)
-
-        # Get context for LLM
-        context = context_memory.get_recent_context(frame.frame_id)
-
-        # Process with LLM
-        llm_reasoning_start_time = time.time()
-        llm_result = await llm_processor.analyze_scene(
-            processed_frame, # Pass the processed frame
-            vision_analysis,
-            context
-        )
-        logger.info(f"LLM analysis result for frame {frame.frame_id}: {llm_result.get('scene_description', 'N/A')}")
-        llm_reasoning_duration = time.time() - llm_reasoning_start_time
 
+    job.packet_events.append(PacketEvent(
+        event_type="vlm_analysis_complete",
+        timestamp=time.time(),
+        source="Server",
+        destination="Server",
+        summary=f"VLM analysis complete for frame {frame.frame_id}. Description: {(vision_analysis.get('description') or 'N/A')[:50]}...",
+        payload={
+            "frame_id": frame.frame_id,
+            "description": vision_analysis.get("description"),
+            "confidence": vision_analysis.get("confidence"),
+            "duration": job.vision_duration
+        }
+    ).model_dump())
+    await websocket_manager.broadcast_event_to_dashboards("vlm_analysis_complete", {"frame_id": frame.frame_id, "vlm_description": vision_analysis.get("description", "N/A")})
+
+async def run_scene_reasoning(job: FrameJob):
+    """Store a vision-analyzed frame, run LLM scene analysis and respond to client and dashboards."""
+    client_id = job.client_id
+    frame = job.frame
+    vision_analysis = job.vision_analysis
+    packet_events = job.packet_events
+    processing_start_time = job.received_at
+
+    assert context_memory is not None
+    assert llm_processor is not None
+    assert websocket_manager is not None
+    assert vision_processor is not None # Assert vision_processor is not None
+
+    # Store in context memory
+    # Note: context_memory.add_frame expects DetectionFrame, not FrameDataMessage directly
+    # We need to construct a DetectionFrame from the processed data or the original if split mode
+    processed_frame = DetectionFrame(
+        frame_id=frame.frame_id,
+        timestamp=frame.timestamp,
+        image_data=frame.image_data, # Keep original image data if present
+        detections=[Detection(**d) for d in vision_analysis.get("detections", [])], # Use processed detections
+        device_id=frame.device_id,
+        vlm_description=vision_analysis.get("description"),
+        vlm_confidence=vision_analysis.get("confidence")
+    )
+    context_memory.add_frame(processed_frame, job.device_key)
+
+    # Get context for LLM
+    context = context_memory.get_recent_context(frame.frame_id, device_id=job.device_key)
+
+    # Skip the LLM when the scene has not changed since the device's last analyzed frame
+    device_key = job.device_key
+    llm_reasoning_start_time = time.time()
+    llm_result, change_score = scene_change_gate.check(device_key, vision_analysis)
+
+    if llm_result is not None:
+        logger.info(f"Reusing previous scene analysis for frame {frame.frame_id} (change score {change_score:.2f})")
         packet_events.append(PacketEvent(
-            event_type="llm_reasoning_complete",
+            event_type="llm_reasoning_skipped",
             timestamp=time.time(),
             source="Server",
             destination="Server",
-            summary=f"LLM reasoning complete for frame {frame.frame_id}. Scene: {llm_result.get("scene_description", "N/A")[:50]}...",
+            summary=f"Scene unchanged for frame {frame.frame_id} (change score {change_score:.2f}). Reusing previous analysis.",
             payload={
                 "frame_id": frame.frame_id,
                 "scene_description": llm_result.get("scene_description"),
-                "duration": llm_reasoning_duration
+                "change_score": change_score
             }
         ).model_dump())
-        await websocket_manager.broadcast_event_to_dashboards("llm_reasoning_complete", {"frame_id": frame.frame_id, "scene_description": llm_result.get("scene_description", "N/A")})
-
-        # Create response
-        response = ServerResponse(
-            frame_id=frame.frame_id,
-            analysis=AnalysisResult(
-                scene_description=llm_result.get("scene_description", "No description available"),
-                contextual_insights=llm_result.get("contextual_insights", []),
-                enhanced_detections=llm_result.get("enhanced_detections", []),
-                confidence=llm_result.get("confidence", 0.0)
-            ),
+        await websocket_manager.broadcast_event_to_dashboards("llm_reasoning_skipped", {"frame_id": frame.frame_id, "scene_description": llm_result.get("scene_description", "N/A"), "change_score": change_score})
+    elif frame_deadline.check(job, "reason") == DOWNGRADE:
+        # Not enough budget left for the LLM: answer from detections and the VLM description
+        job.degraded = True
+        llm_result = llm_processor.summarize_without_llm(processed_frame, vision_analysis)
+        packet_events.append(PacketEvent(
+            event_type="llm_reasoning_skipped",
             timestamp=time.time(),
-            error=None
-        )
-
-        # Send response back to iOS
-        await websocket_manager.send_to_ios_client(client_id, response.model_dump())
+            source="Server",
+            destination="Server",
+            summary=f"Latency budget exhausted for frame {frame.frame_id}. Answering without LLM.",
+            payload={
+                "frame_id": frame.frame_id,
+                "scene_description": llm_result.get("scene_description"),
+                "reason": "deadline",
+                "remaining_budget": frame_deadline.remaining(job)
+            }
+        ).model_dump())
+        await websocket_manager.broadcast_event_to_dashboards("frame_downgraded", {"frame_id": frame.frame_id, "stage": "reason", "scene_description": llm_result.get("scene_description", "N/A")})
+    else:
+        # Process with LLM; a newer frame from the same device cancels the generation
+        cancel_token = frame_supersession.begin(device_key, frame.frame_id)
+        try:
+            llm_result = await llm_processor.analyze_scene(
+                processed_frame, # Pass the processed frame
+                vision_analysis,
+                context,
+                on_token=token_streamer(client_id, "scene", frame.frame_id) if settings.STREAM_SCENE_ANALYSIS else None,
+                cancel_token=cancel_token,
+                device_id=device_key
+            )
+        except GenerationCancelled as e:
+            await notify_frame_superseded(job, str(e), time.time() - llm_reasoning_start_time)
+            return
+        finally:
+            frame_supersession.end(device_key, frame.frame_id, cancel_token)
+        scene_change_gate.record(device_key, vision_analysis, llm_result)
+        logger.info(f"LLM analysis result for frame {frame.frame_id}: {llm_result.get('scene_description', 'N/A')}")
+        llm_reasoning_duration = time.time() - llm_reasoning_start_time
+        frame_deadline.observe("reason", llm_reasoning_duration)
 
-        # Send acknowledgment to iOS client to request next frame
         packet_events.append(PacketEvent(
-            event_type="response_sent_to_ios",
+            event_type="llm_reasoning_complete",
             timestamp=time.time(),
             source="Server",
-            destination="iOS Device",
-            summary=f"Response sent to iOS for frame {frame.frame_id}. Total processing time: {(time.time() - processing_start_time):.2f}s",
+            destination="Server",
+            summary=f"LLM reasoning complete for frame {frame.frame_id}. Scene: {llm_result.get('scene_description', 'N/A')[:50]}...",
             payload={
-                "frame_id": response.frame_id,
-                "scene_description": response.analysis.scene_description,
-                "total_processing_time": (time.time() - processing_start_time)
+                "frame_id": frame.frame_id,
+                "scene_description": llm_result.get("scene_description"),
+                "change_score": change_score,
+                "duration": llm_reasoning_duration
             }
         ).model_dump())
-        await websocket_manager.send_to_ios_client(client_id, {"type": "frame_processed", "frame_id": frame.frame_id})
-        
-        # Create a copy of packet_events before broadcasting to avoid "dictionary changed size during iteration"
-        # if the list is modified elsewhere or during asynchronous processing.
-        packet_events_copy = list(packet_events)
+        await websocket_manager.broadcast_event_to_dashboards("llm_reasoning_complete", {"frame_id": frame.frame_id, "scene_description": llm_result.get("scene_description", "N/A")})
 
-        await websocket_manager.broadcast_event_to_dashboards("response_sent_to_ios", {
+    # Keep the analysis the client gets with the frame's context
+    context_memory.add_analysis(frame.frame_id, llm_result, device_key)
+
+    # Create response
+    response = ServerResponse(
+        frame_id=frame.frame_id,
+        analysis=AnalysisResult(
+            scene_description=llm_result.get("scene_description", "No description available"),
+            contextual_insights=llm_result.get("contextual_insights", []),
+            enhanced_detections=llm_result.get("enhanced_detections", []),
+            confidence=llm_result.get("confidence", 0.0)
+        ),
+        timestamp=time.time(),
+        error=None,
+        degraded=job.degraded
+    )
+
+    # Send response back to iOS
+    await websocket_manager.send_to_ios_client(client_id, response.model_dump())
+
+    # Send acknowledgment to iOS client to request next frame
+    packet_events.append(PacketEvent(
+        event_type="response_sent_to_ios",
+        timestamp=time.time(),
+        source="Server",
+        destination="iOS Device",
+        summary=f"Response sent to iOS for frame {frame.frame_id}. Total processing time: {(time.time() - processing_start_time):.2f}s",
+        payload={
             "frame_id": response.frame_id,
             "scene_description": response.analysis.scene_description,
-            "llm_reasoning": llm_result, # Include LLM reasoning
-            "vlm_analysis": vision_analysis, # Include VLM analysis (contains detections)
-            "packet_events": packet_events_copy, # Use the copy
-            "final_ios_response_summary": {"error": response.error},
-            "server_status": {
-                "processing_mode": settings.PROCESSING_MODE,
-                "model_health": model_manager.get_model_health(),
-                "queue_size": frame_queue.qsize(),
-                "llm_processing_stats": llm_processor.get_stats(),
-                "vision_processing_stats": vision_processor.get_stats()
-            },
-            "context": context,
-            "image_data": frame.image_data, # Include image data for dashboard
-            "detections": frame.detections # Include detections for dashboard
+            "total_processing_time": (time.time() - processing_start_time)
+        }
+    ).model_dump())
+    await websocket_manager.send_to_ios_client(client_id, {"type": "frame_processed", "frame_id": frame.frame_id})
+    
+    # Create a copy of packet_events before broadcasting to avoid "dictionary changed size during iteration"
+    # if the list is modified elsewhere or during asynchronous processing.
+    packet_events_copy = list(packet_events)
+
+    await websocket_manager.broadcast_event_to_dashboards("response_sent_to_ios", {
+        "frame_id": response.frame_id,
+        "scene_description": response.analysis.scene_description,
+        "llm_reasoning": llm_result, # Include LLM reasoning
+        "vlm_analysis": vision_analysis, # Include VLM analysis (contains detections)
+        "packet_events": packet_events_copy, # Use the copy
+        "final_ios_response_summary": {"error": response.error},
+        "server_status": {
+            "processing_mode": settings.PROCESSING_MODE,
+            "model_health": model_manager.get_model_health(),
+            "queue_size": frame_dispatcher.qsize(),
+            "dispatcher_stats": frame_dispatcher.get_stats(),
+            "queue_state": queue_state.get_stats(),
+            "pipeline_stats": frame_pipeline.get_stats(),
+            "llm_processing_stats": llm_processor.get_stats(),
+            "context_memory_stats": context_memory.get_stats(),
+            "context_query_stats": context_query.get_stats(),
+            "scene_change_stats": scene_change_gate.get_stats(),
+            "deadline_stats": frame_deadline.get_stats(),
+            "supersession_stats": frame_supersession.get_stats(),
+            "inference_scheduler_stats": inference_scheduler.get_stats(),
+            "inference_executor_stats": model_manager.get_executor_stats(),
+            "prompt_cache_stats": model_manager.get_prompt_cache_stats(),
+            "batch_stats": model_manager.get_batch_stats(),
+            "text_model_stats": model_manager.get_text_model_stats(),
+            "model_worker_stats": model_manager.get_stats() if isinstance(model_manager, ModelWorkerPool) else None,
+            "vision_processing_stats": vision_processor.get_stats()
+        },
+        "context": context,
+        "image_data": frame.image_data, # Include image data for dashboard
+        "detections": [d.model_dump() for d in frame.detections or []] # Include detections for dashboard
+    })
+
+    logger.debug(f"Processed frame {frame.frame_id} successfully and broadcast to dashboards")
+
+async def notify_frame_superseded(job: FrameJob, reason: str, duration: float):
+    """Tell the client and dashboards that a frame's scene analysis was cancelled for a newer frame."""
+    frame = job.frame
+    job.superseded = True
+    superseded_by = frame_supersession.latest_frame(job.device_key)
+    logger.info(f"Scene analysis of frame {frame.frame_id} cancelled after {duration:.2f}s: {reason}")
+    await websocket_manager.send_to_ios_client(job.client_id, {
+        "type": "frame_superseded",
+        "frame_id": frame.frame_id,
+        "superseded_by": superseded_by
+    })
+    await websocket_manager.broadcast_event_to_dashboards("frame_superseded", {
+        "frame_id": frame.frame_id,
+        "device_id": frame.device_id,
+        "superseded_by": superseded_by,
+        "duration": duration
+    })
+
+async def report_frame_error(job: FrameJob, error: Exception):
+    """Send a frame processing failure back to the client."""
+    error_msg = f"Error processing frame: {str(error)}"
+    logger.error(f"Error processing frame from {job.client_id}: {error}")
+    
+    # Send error response
+    if websocket_manager:
+        await websocket_manager.send_to_ios_client(job.client_id, {
+            "type": "error",
+            "message": "Failed to process frame",
+            "details": error_msg
         })
 
-        # Broadcast a separate event for successful frame processing, including updated queue size
-        if websocket_manager and frame_queue:
-            queue_contents = []
-            for item in list(frame_queue._queue):
-                client_id_in_queue, frame_in_queue = item
-                queue_contents.append({
-                    "frame_id": frame_in_queue.frame_id,
-                    "timestamp": frame_in_queue.timestamp,
-                    "device_id": frame_in_queue.device_id,
-                    "status": "enqueued" # Indicate status in queue
-                })
-            await websocket_manager.broadcast_event_to_dashboards(
-                "frame_processed_successfully",
-                {"queue_size": frame_queue.qsize(), "frame_id": frame.frame_id, "queue_contents": queue_contents}
-            )
+async def pipeline_detect_stage(job: FrameJob) -> bool:
+    """Full mode stage 1: decode the image and run YOLO."""
+    if frame_deadline.check(job, "admission") == DROP:
+        await notify_frames_dropped([job], "deadline_exceeded")
+        return False
+    try:
+        await begin_frame(job)
+        detection_start_time = time.time()
+        job.detections = await vision_processor.detect_objects(job.frame)
+        job.detection_duration = time.time() - detection_start_time
+        return True
+    except Exception as e:
+        await report_frame_error(job, e)
+        return False
 
-        logger.debug(f"Processed frame {frame.frame_id} successfully and broadcast to dashboards")
-        
+async def pipeline_describe_stage(job: FrameJob) -> bool:
+    """Full mode stage 2: run the VLM on the frame and its detections."""
+    try:
+        describe_start_time = time.time()
+        if frame_deadline.check(job, "describe") == DOWNGRADE:
+            # Not enough budget left for the VLM: continue with detections only
+            job.degraded = True
+            description = None
+            await websocket_manager.broadcast_event_to_dashboards("frame_downgraded", {"frame_id": job.frame.frame_id, "stage": "describe"})
+        else:
+            description = await vision_processor.describe_scene(job.frame, job.detections)
+            frame_deadline.observe("describe", time.time() - describe_start_time)
+        job.vision_duration = job.detection_duration + (time.time() - describe_start_time)
+        job.vision_analysis = vision_processor.build_analysis(job.frame, job.detections, description)
+        await record_vision_events(job)
+        return True
     except Exception as e:
-        error_msg = f"Error processing frame: {str(e)}"
-        logger.error(f"Error processing frame from {client_id}: {e}")
-        
-        # Send error response
-        if websocket_manager:
-            await websocket_manager.send_to_ios_client(client_id, {
-                "type": "error",
-                "message": "Failed to process frame",
-                "details": error_msg
-            })
+        await report_frame_error(job, e)
+        return False
+
+async def pipeline_reason_stage(job: FrameJob) -> bool:
+    """Full mode stage 3: LLM scene analysis and response."""
+    try:
+        await run_scene_reasoning(job)
+        return not job.superseded
+    except Exception as e:
+        await report_frame_error(job, e)
+        return False
+
+def token_streamer(client_id: str, stream: str, stream_id: str) -> TokenCallback:
+    """Build an on_token callback that forwards generated text as token_chunk messages.
+
+    Chunks go to the iOS client and to dashboards as they are generated; the usual
+    final message (ServerResponse or PromptResponse) still follows once generation ends.
+    """
+    index = 0
+
+    async def on_token(text: str) -> None:
+        nonlocal index
+        message = {
+            "type": "token_chunk",
+            "stream": stream, # "scene" or "prompt"
+            "id": stream_id, # frame_id or prompt_id
+            "index": index,
+            "text": text
+        }
+        index += 1
+        await websocket_manager.send_to_ios_client(client_id, message)
+        await websocket_manager.broadcast_to_dashboards({**message, "source_client_id": client_id})
+
+    return on_token
 
 async def process_user_prompt(client_id: str, prompt_message: UserPromptMessage):
     """Process incoming user prompt from iOS app."""
@@ -569,20 +876,37 @@ async def process_user_prompt(client_id: str, prompt_message: UserPromptMessage)
     try:
         assert llm_processor is not None
         assert context_memory is not None
+        assert context_query is not None
         assert websocket_manager is not None
 
-        # Get relevant context for the question
-        # For now, let's get the most recent context. This can be enhanced later.
-        context = context_memory.get_recent_context(prompt_message.prompt_id, limit=10) # Get more context for prompts
+        # Counting, presence and last-seen questions are answered straight from context memory
+        device_key = prompt_message.device_id or client_id
+        direct = context_query.answer(prompt_message.question, device_key)
+        if direct is not None:
+            answer = direct["answer"]
+            answered_by = "context_query"
+        else:
+            # Get candidate context for the question; the LLM processor packs the most relevant into its token budget
+            context = context_memory.get_recent_context(
+                prompt_message.prompt_id, limit=settings.CONTEXT_CANDIDATES, device_id=device_key
+            )
 
-        # Process the question with LLM
-        answer = await llm_processor.answer_question(prompt_message.question, context)
+            # Process the question with LLM
+            on_token = token_streamer(client_id, "prompt", prompt_message.prompt_id) if settings.STREAM_PROMPT_RESPONSES else None
+            answer = await llm_processor.answer_question(
+                prompt_message.question,
+                context,
+                on_token=on_token,
+                device_id=device_key
+            )
+            answered_by = "llm"
 
         response = PromptResponse(
             response_id=prompt_message.prompt_id,
             question=prompt_message.question,
             answer=answer,
             timestamp=time.time(),
+            answered_by=answered_by,
             error=None
         )
         
@@ -596,6 +920,7 @@ async def process_user_prompt(client_id: str, prompt_message: UserPromptMessage)
             "prompt_id": prompt_message.prompt_id,
             "question": prompt_message.question,
             "answer": answer,
+            "answered_by": answered_by,
             "source_client_id": client_id
         }
         await websocket_manager.broadcast_to_dashboards(dashboard_message)
@@ -45,6 +45,7 @@ class PromptResponse(BaseModel):
     question: str
     answer: str
     timestamp: float
+    answered_by: str = "llm"  # "llm" or "context_query" (answered directly from context memory)
     error: Optional[str] = None
 
 class WebSocketMessage(BaseModel):
@@ -81,6 +82,7 @@ class ServerResponse(BaseModel):
     analysis: AnalysisResult
     timestamp: float
     error: Optional[str] = None
+    degraded: bool = False # True when stages were skipped to meet the latency budget
 
 class SystemStatus(BaseModel):
     """System status information."""
@@ -6,19 +6,36 @@ of the application, including:
 - WebSocket management
 - Vision processing
 - LLM processing
-- Context memory management
-- Model management
+- Context memory management and direct answers from it
+- Model management, in process or in worker processes
+- Frame dispatching, queue state tracking and the full mode pipeline
+- Scene change gating
+- Priority inference scheduling
 """
 
 from .websocket_manager import WebSocketManager
 from .vision_processor import VisionProcessor
 from .llm_processor import LLMProcessor
 from .context_memory import ContextMemory
+from .context_query import ContextQueryEngine
 from .model_manager import ModelManager
+from .model_worker_pool import ModelWorkerPool
+from .frame_dispatcher import FrameDispatcher
+from .queue_state import QueueStateTracker
+from .frame_pipeline import FramePipeline
+from .scene_change import SceneChangeGate
+from .inference_scheduler import InferenceScheduler
 
 __all__ = [
     'WebSocketManager',
     'LLMProcessor',
     'ContextMemory',
-    'ModelManager'
+    'ContextQueryEngine',
+    'ModelManager',
+    'ModelWorkerPool',
+    'FrameDispatcher',
+    'QueueStateTracker',
+    'FramePipeline',
+    'SceneChangeGate',
+    'InferenceScheduler'
 ]
\ No newline at end of file
@@ -0,0 +1,243 @@
+"""Continuous batching of text generation requests."""
+import asyncio
+import itertools
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from services.cancellation import CancellationToken, GenerationCancelled
+from services.inference_backends import BatchSession, InferenceBackend, ends_sentence
+from services.inference_executor import InferenceExecutor
+from utils.logger import get_logger
+from config import settings
+
+logger = get_logger(__name__)
+
+class _BatchRequest:
+    """A prompt waiting for or taking part in a batch."""
+
+    __slots__ = ("prompt", "emit", "max_tokens", "stop_at_sentence_end", "model", "cancel_token", "future", "loop", "parts", "tokens")
+
+    def __init__(
+        self,
+        prompt: str,
+        emit: Optional[Callable[[str], Any]],
+        max_tokens: int,
+        stop_at_sentence_end: bool,
+        model: str,
+        cancel_token: Optional[CancellationToken],
+        future: asyncio.Future,
+        loop: asyncio.AbstractEventLoop
+    ):
+        self.prompt = prompt
+        self.emit = emit
+        self.max_tokens = max_tokens
+        self.stop_at_sentence_end = stop_at_sentence_end
+        self.model = model
+        self.cancel_token = cancel_token
+        self.future = future
+        self.loop = loop
+        self.parts = []
+        self.tokens = 0
+
+    def result(self, finish_reason: str) -> Dict[str, Any]:
+        return {
+            "response": "".join(self.parts),
+            "tokens_generated": self.tokens,
+            "finish_reason": finish_reason
+        }
+
+class TextBatchEngine:
+    """Generates concurrent prompts as one batch on the text thread.
+
+    The first request starts a batch loop on the text executor thread. The loop
+    waits up to LLM_BATCH_WINDOW for more requests (or until LLM_BATCH_MAX_SIZE are
+    waiting), then decodes all of them together. Requests that arrive while the
+    batch is running join it between decode steps, up to the maximum size. Every
+    sequence finishes on its own: its caller's future is resolved as soon as that
+    sequence ends, not when the whole batch does. The loop exits once no sequence
+    is active and nothing is waiting.
+
+    Each text model gets its own batch session within the loop, and the loop
+    alternates decode steps between the sessions that have active sequences, so
+    a steady stream of summaries on one model cannot hold off questions on another.
+
+    A request whose cancellation token is set leaves the batch before the next
+    decode step and its caller gets GenerationCancelled.
+    """
+
+    def __init__(
+        self,
+        backend: InferenceBackend,
+        executor: InferenceExecutor,
+        max_size: Optional[int] = None,
+        window: Optional[float] = None
+    ):
+        """
+        Initialize text batch engine.
+
+        Args:
+            backend: Backend whose batch sessions do the decoding
+            executor: Executor whose text thread runs the batch loop
+            max_size: Sequences decoded together at most (defaults to settings.LLM_BATCH_MAX_SIZE)
+            window: Seconds to wait for more requests before starting a batch (defaults to settings.LLM_BATCH_WINDOW)
+        """
+        self.backend = backend
+        self.executor = executor
+        self.max_size = max(1, max_size or settings.LLM_BATCH_MAX_SIZE)
+        self.window = settings.LLM_BATCH_WINDOW if window is None else window
+        self._incoming: "queue.Queue[_BatchRequest]" = queue.Queue()
+        self._lock = threading.Lock()  # Guards _running against the loop exiting as a request arrives
+        self._running = False
+        self._keys = itertools.count()
+        self.stats = {
+            "batches": 0,
+            "sequences": 0,
+            "failed": 0,
+            "cancelled": 0,
+            "steps": 0,
+            "total_step_occupancy": 0,
+            "max_occupancy": 0
+        }
+
+    async def submit(
+        self,
+        prompt: str,
+        emit: Optional[Callable[[str], Any]] = None,
+        max_tokens: Optional[int] = None,
+        stop_at_sentence_end: bool = False,
+        model: str = "main",
+        cancel_token: Optional[CancellationToken] = None
+    ) -> Dict[str, Any]:
+        """
+        Generate a response as part of a batch.
+
+        Args:
+            prompt: Prompt to generate from
+            emit: Called on the text thread with each new piece of text
+            max_tokens: Token limit (defaults to settings.MAX_TEXT_LENGTH)
+            stop_at_sentence_end: Finish the sequence once it completes a sentence
+            model: Text model to generate with
+            cancel_token: Stops the sequence between decode steps once cancelled
+
+        Returns:
+            {"response": text, "tokens_generated": count, "finish_reason": reason}
+        """
+        loop = asyncio.get_running_loop()
+        request = _BatchRequest(
+            prompt, emit, max_tokens or settings.MAX_TEXT_LENGTH, stop_at_sentence_end, model,
+            cancel_token, loop.create_future(), loop
+        )
+        with self._lock:
+            self._incoming.put(request)
+            start = not self._running
+            self._running = True
+        if start:
+            loop.create_task(self._run_batch_loop())
+        return await request.future
+
+    async def _run_batch_loop(self) -> None:
+        try:
+            await self.executor.run("text", self._batch_loop)
+        except Exception as e:
+            logger.error(f"Batch loop failed: {e}")
+            with self._lock:
+                self._running = False
+            self._fail_waiting(e)
+
+    def _batch_loop(self) -> None:
+        """Runs on the text thread until no sequence is active and none is waiting."""
+        deadline = time.time() + self.window
+        while self._incoming.qsize() < self.max_size and time.time() < deadline:
+            time.sleep(0.001)
+
+        self.stats["batches"] += 1
+        sessions: Dict[str, BatchSession] = {}  # One per text model, opened on first use
+        active: Dict[int, _BatchRequest] = {}
+        try:
+            while True:
+                with self._lock:
+                    while len(active) < self.max_size and not self._incoming.empty():
+                        request = self._incoming.get_nowait()
+                        key = next(self._keys)
+                        active[key] = request
+                        if request.model not in sessions:
+                            sessions[request.model] = self.backend.open_batch(self.max_size, request.model)
+                        sessions[request.model].add(key, request.prompt, request.max_tokens)
+                        self.stats["sequences"] += 1
+                    if not active:
+                        self._running = False
+                        return
+
+                for key, request in list(active.items()):
+                    if request.cancel_token is not None and request.cancel_token.cancelled:
+                        sessions[request.model].cancel(key)
+                        del active[key]
+                        self.stats["cancelled"] += 1
+                        error = GenerationCancelled(request.cancel_token.reason)
+                        request.loop.call_soon_threadsafe(_resolve, request.future, None, error)
+
+                for model, session in sessions.items():
+                    occupancy = sum(1 for request in active.values() if request.model == model)
+                    if occupancy:
+                        self._step(session, active, occupancy)
+        except Exception as e:
+            self.stats["failed"] += len(active)
+            for request in active.values():
+                request.loop.call_soon_threadsafe(_resolve, request.future, None, e)
+            raise
+        finally:
+            for session in sessions.values():
+                session.close()
+
+    def _step(self, session: BatchSession, active: Dict[int, _BatchRequest], occupancy: int) -> None:
+        """Advance one session by a decode step and hand out its output."""
+        self.stats["steps"] += 1
+        self.stats["total_step_occupancy"] += occupancy
+        self.stats["max_occupancy"] = max(self.stats["max_occupancy"], occupancy)
+        for key, text, tokens, finish_reason in session.step():
+            request = active.get(key)
+            if request is None:
+                continue
+            request.tokens += tokens
+            if text:
+                request.parts.append(text)
+                if request.emit is not None:
+                    request.emit(text)
+            if finish_reason is None and request.stop_at_sentence_end and text and ends_sentence("".join(request.parts)):
+                finish_reason = "sentence_end"
+                session.cancel(key)
+            if finish_reason is not None:
+                del active[key]
+                request.loop.call_soon_threadsafe(_resolve, request.future, request.result(finish_reason), None)
+
+    def _fail_waiting(self, error: Exception) -> None:
+        while not self._incoming.empty():
+            request = self._incoming.get_nowait()
+            request.loop.call_soon_threadsafe(_resolve, request.future, None, error)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get batching statistics."""
+        steps = self.stats["steps"]
+        return {
+            "max_size": self.max_size,
+            "window": self.window,
+            "waiting": self._incoming.qsize(),
+            "batches": self.stats["batches"],
+            "sequences": self.stats["sequences"],
+            "failed": self.stats["failed"],
+            "cancelled": self.stats["cancelled"],
+            "steps": steps,
+            "average_occupancy": self.stats["total_step_occupancy"] / steps if steps else 0.0,
+            "max_occupancy": self.stats["max_occupancy"]
+        }
+
+def _resolve(future: asyncio.Future, result: Any, error: Optional[Exception]) -> None:
+    """Complete a caller's future on its event loop, unless the caller has given up."""
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
@@ -0,0 +1,41 @@
+"""Cooperative cancellation of model work in progress."""
+from typing import Callable, List, Optional
+
+class GenerationCancelled(Exception):
+    """Raised when a generation stops because its cancellation token was set."""
+
+class CancellationToken:
+    """Flag one party sets to ask work in progress to stop.
+
+    Generation loops check `cancelled` between tokens, so work stops within one
+    decode step. Setting the flag is a single attribute assignment, so the token
+    can be cancelled on the event loop while a text thread is reading it.
+    """
+
+    def __init__(self):
+        self.reason: Optional[str] = None
+        self._callbacks: List[Callable[[], None]] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        """Ask the work to stop; only the first call has an effect."""
+        if self.reason is not None:
+            return
+        self.reason = reason
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def on_cancel(self, callback: Callable[[], None]) -> None:
+        """Run a callback when the token is cancelled (right away if it already is)."""
+        if self.reason is not None:
+            callback()
+        else:
+            self._callbacks.append(callback)
+
+    def raise_if_cancelled(self) -> None:
+        if self.reason is not None:
+            raise GenerationCancelled(self.reason)
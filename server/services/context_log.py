@@ -0,0 +1,266 @@
+"""Append-only on-disk log of context memory, for recovery after a restart."""
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.logger import get_logger
+from config import settings
+
+logger = get_logger(__name__)
+
+# Record kinds, stored as a byte in the index
+RECORD_KINDS = ("frame", "analysis", "objects")
+
+# One index row per record; index files are memory-mapped as arrays of these
+INDEX_DTYPE = np.dtype([
+    ("logged_at", "<f8"),  # When the record was appended, increasing within a log
+    ("offset", "<u8"),  # Byte offset of the record in its segment
+    ("length", "<u4"),  # Record length in bytes
+    ("kind", "u1"),  # Index into RECORD_KINDS
+    ("key", "<u8")  # Hash of the record's frame_id (0 when it has none)
+])
+
+class ContextLog:
+    """Segmented, append-only log of frames, analyses and tracked-object snapshots.
+
+    Records are appended by the event loop to an in-memory batch, which costs a
+    list append; flush, run on a background thread, writes the batch out. Each
+    segment is a file of JSON lines with a companion index file of fixed-size
+    rows (INDEX_DTYPE) that is memory-mapped for lookups by time or frame_id.
+    A segment is closed once it reaches CONTEXT_LOG_SEGMENT_BYTES and a new one
+    is started; every start of the server opens a new segment as well.
+
+    Compaction keeps the newest CONTEXT_LOG_MAX_SEGMENTS segments and deletes
+    older ones, so the log holds a bounded tail of history. Recovery reads the
+    tail through the indexes. A record cut short by a crash is skipped, and its
+    index row is never written, because a row is only appended after its record.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        segment_bytes: Optional[int] = None,
+        max_segments: Optional[int] = None
+    ):
+        """
+        Initialize context log.
+
+        Args:
+            directory: Directory holding the segments (defaults to settings.CONTEXT_LOG_DIR)
+            segment_bytes: Size at which a segment is closed (defaults to settings.CONTEXT_LOG_SEGMENT_BYTES)
+            max_segments: Segments kept by compaction (defaults to settings.CONTEXT_LOG_MAX_SEGMENTS)
+        """
+        self.directory = Path(directory or settings.CONTEXT_LOG_DIR)
+        self.segment_bytes = segment_bytes or settings.CONTEXT_LOG_SEGMENT_BYTES
+        self.max_segments = max(1, max_segments or settings.CONTEXT_LOG_MAX_SEGMENTS)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        self._pending: List[Tuple[float, str, Dict[str, Any]]] = []
+        self._pending_lock = threading.Lock()  # Appends on the event loop, flushes on a worker thread
+        self._write_lock = threading.Lock()  # One flush or compaction at a time
+        segments = self._segments()
+        self._sequence = segments[-1] + 1 if segments else 1
+        self._data: Optional[BinaryIO] = None
+        self._index: Optional[BinaryIO] = None
+        self._size = 0
+        self.stats = {
+            "appended": 0,
+            "written": 0,
+            "bytes_written": 0,
+            "flushes": 0,
+            "flush_time": 0.0,
+            "segments_deleted": 0,
+            "recovered": 0,
+            "skipped_records": 0
+        }
+
+    def append(self, kind: str, record: Dict[str, Any]) -> None:
+        """
+        Queue a record for the next flush.
+
+        Records are serialized by flush, so they may hold pydantic models and
+        must not be modified after they are appended.
+        """
+        with self._pending_lock:
+            self._pending.append((time.time(), kind, record))
+        self.stats["appended"] += 1
+
+    def flush(self) -> int:
+        """Write queued records to the current segment; blocking, so run it off the event loop."""
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return 0
+
+        start_time = time.perf_counter()
+        with self._write_lock:
+            chunks: List[bytes] = []
+            rows: List[Tuple[float, int, int, int, int]] = []
+            for logged_at, kind, record in pending:
+                if self._data is None or self._size >= self.segment_bytes:
+                    self._write(chunks, rows)
+                    chunks, rows = [], []
+                    self._open_segment()
+                data = (json.dumps(record, separators=(",", ":"), default=_encode) + "\n").encode("utf-8")
+                rows.append((logged_at, self._size, len(data), RECORD_KINDS.index(kind), _key(record.get("frame_id"))))
+                chunks.append(data)
+                self._size += len(data)
+            self._write(chunks, rows)
+
+        self.stats["written"] += len(pending)
+        self.stats["flushes"] += 1
+        self.stats["flush_time"] += time.perf_counter() - start_time
+        return len(pending)
+
+    def _write(self, chunks: List[bytes], rows: List[Tuple[float, int, int, int, int]]) -> None:
+        if not chunks:
+            return
+        data = b"".join(chunks)
+        self._data.write(data)
+        self._data.flush()
+        self._index.write(np.array(rows, dtype=INDEX_DTYPE).tobytes())  # Only after the records it points to
+        self._index.flush()
+        self.stats["bytes_written"] += len(data)
+
+    def _open_segment(self) -> None:
+        self._close_segment()
+        self._data = open(self._path(self._sequence, "log"), "ab")
+        self._index = open(self._path(self._sequence, "idx"), "ab")
+        self._size = 0
+        self._sequence += 1
+
+    def _close_segment(self) -> None:
+        if self._data is not None:
+            self._data.close()
+            self._index.close()
+            self._data = self._index = None
+
+    def compact(self) -> int:
+        """Delete all but the newest max_segments segments; returns how many were deleted."""
+        with self._write_lock:
+            old = self._segments()[:-self.max_segments]
+            for sequence in old:
+                for suffix in ("log", "idx"):
+                    try:
+                        os.remove(self._path(sequence, suffix))
+                    except OSError:
+                        pass
+        self.stats["segments_deleted"] += len(old)
+        return len(old)
+
+    def tail(self, frames: int) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        Read the newest records, going back far enough to include a number of frames.
+
+        Args:
+            frames: Frame records to go back at least
+
+        Returns:
+            (kind, record) pairs in the order they were written
+        """
+        found = []
+        frame_kind = RECORD_KINDS.index("frame")
+        for sequence in reversed(self._segments()):
+            index = self._load_index(sequence)
+            if index is None or not len(index):
+                continue
+            frame_rows = np.flatnonzero(index["kind"] == frame_kind)
+            if len(frame_rows) > frames:
+                found.append((sequence, index[frame_rows[-frames]:]))
+                break
+            found.append((sequence, index))
+            frames -= len(frame_rows)
+            if frames <= 0:
+                break
+
+        records = []
+        for sequence, rows in reversed(found):
+            records.extend(self._read(sequence, rows))
+        self.stats["recovered"] += len(records)
+        return records
+
+    def since(self, timestamp: float) -> List[Tuple[str, Dict[str, Any]]]:
+        """Records appended at or after a time, oldest first."""
+        records = []
+        for sequence in self._segments():
+            index = self._load_index(sequence)
+            if index is None or not len(index) or index["logged_at"][-1] < timestamp:
+                continue
+            start = int(np.searchsorted(index["logged_at"], timestamp, side="left"))
+            records.extend(self._read(sequence, index[start:]))
+        return records
+
+    def find(self, frame_id: str) -> List[Tuple[str, Dict[str, Any]]]:
+        """All records kept for a frame (its frame record and analyses), oldest first."""
+        key = _key(frame_id)
+        records = []
+        for sequence in self._segments():
+            index = self._load_index(sequence)
+            if index is None or not len(index):
+                continue
+            matches = index[index["key"] == key]
+            records.extend(entry for entry in self._read(sequence, matches) if entry[1].get("frame_id") == frame_id)
+        return records
+
+    def _load_index(self, sequence: int) -> Optional[np.ndarray]:
+        """Memory-map a segment's index, ignoring a trailing partial row."""
+        path = self._path(sequence, "idx")
+        try:
+            rows = os.path.getsize(path) // INDEX_DTYPE.itemsize
+        except OSError:
+            return None
+        if rows == 0:
+            return None
+        return np.memmap(path, dtype=INDEX_DTYPE, mode="r", shape=(rows,))
+
+    def _read(self, sequence: int, rows: np.ndarray) -> List[Tuple[str, Dict[str, Any]]]:
+        records = []
+        if not len(rows):
+            return records
+        with open(self._path(sequence, "log"), "rb") as data:
+            for offset, length, kind in zip(rows["offset"], rows["length"], rows["kind"]):
+                data.seek(int(offset))
+                try:
+                    records.append((RECORD_KINDS[kind], json.loads(data.read(int(length)))))
+                except (ValueError, IndexError):
+                    self.stats["skipped_records"] += 1
+        return records
+
+    def _segments(self) -> List[int]:
+        return sorted(int(path.stem) for path in self.directory.glob("*.log") if path.stem.isdigit())
+
+    def _path(self, sequence: int, suffix: str) -> Path:
+        return self.directory / f"{sequence:08d}.{suffix}"
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get log statistics."""
+        flushes = self.stats["flushes"]
+        return {
+            "directory": str(self.directory),
+            "segments": len(self._segments()),
+            "pending": len(self._pending),
+            "average_flush_time": self.stats["flush_time"] / flushes if flushes else 0.0,
+            **self.stats
+        }
+
+    def close(self) -> None:
+        """Write out queued records and close the current segment."""
+        self.flush()
+        with self._write_lock:
+            self._close_segment()
+
+def _key(frame_id: Optional[str]) -> int:
+    if not frame_id:
+        return 0
+    return int.from_bytes(hashlib.blake2b(frame_id.encode("utf-8"), digest_size=8).digest(), "little")
+
+def _encode(obj: Any) -> Any:
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    return str(obj)
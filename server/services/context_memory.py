@@ -1,37 +1,59 @@
 """Memory management for scene understanding context."""
-from typing import Dict, List, Optional, Any
-from collections import deque
+from typing import Dict, Iterable, List, Optional, Any, Set
+from collections import OrderedDict, deque
+import heapq
 import time
 import json
 
 from models import DetectionFrame
+from services.context_log import ContextLog
+from services.image_store import ImageStore
+from services.object_tracker import ObjectTracker
 from utils.logger import get_logger
+from config import settings
 
 logger = get_logger(__name__)
 
-class ContextMemory:
-    """Manages temporal context and scene understanding history."""
+# Shard of frames that carry no device_id and were stored without a device key
+DEFAULT_DEVICE = "default"
+
+class DeviceContext:
+    """Temporal context and scene understanding history of one device.
+
+    Context entries for the most recent frames are built once, when the frame or
+    its analysis is stored, and kept in a rolling window; get_recent_context only
+    slices that window. Each entry lists the tracked objects its frame updated.
+
+    Scene analyses are kept oldest first. An analysis is evicted with its frame
+    when the frame leaves the frame deque, and by age through cleanup_old_entries,
+    which only has to look at the front.
+    """
 
-    def __init__(self, max_frames: int = 300000):
+    def __init__(self, max_frames: int = 300000, window_size: Optional[int] = None):
         """
-        Initialize context memory.
+        Initialize device context.
 
         Args:
             max_frames: Maximum frames to keep in memory (default 1s at 30fps)
+            window_size: Recent frames kept as context entries (defaults to settings.CONTEXT_WINDOW_SIZE)
         """
         self.frames = deque(maxlen=max_frames)
-        self.scene_analysis: Dict[str, Dict[str, Any]] = {}
+        self.context_window: deque = deque(maxlen=window_size or settings.CONTEXT_WINDOW_SIZE)
+        self._window_entries: Dict[str, Dict[str, Any]] = {}  # frame_id -> its entry in context_window
+        self.scene_analysis: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()  # frame_id -> analysis, oldest first
+        self.label_last_seen: Dict[str, float] = {}  # Detection label -> timestamp of the latest frame showing it
         self.scene_understanding: Dict[str, Any] = {
             "ongoing_activities": [],
-            "tracked_objects": {},
             "scene_state": {}
         }
+        self.object_tracker = ObjectTracker()
+        self.logged_objects_version = 0  # object_tracker.version of the last snapshot written to the log
+        self.last_updated = time.time()
         self.stats = {
             "frames_stored": 0,
             "analyses_stored": 0,
-            "last_cleanup": time.time()
+            "analyses_evicted": 0
         }
-        logger.info(f"ContextMemory initialized with {max_frames} frame capacity")
 
     def add_frame(self, frame: DetectionFrame) -> None:
         """
@@ -40,16 +62,23 @@ class ContextMemory:
         Args:
             frame: Frame to store
         """
+        if len(self.frames) == self.frames.maxlen:
+            self._evict_analysis(self.frames[0].frame_id)  # Leaves together with its frame
         self.frames.append(frame)
+        self.last_updated = time.time()
         self.stats["frames_stored"] += 1
+        for det in frame.detections:
+            self.label_last_seen[det.label] = max(frame.timestamp, self.label_last_seen.get(det.label, frame.timestamp))
 
         # Track objects based on detection track_ids
-        self._update_object_tracking(frame)
+        updated_objects = self.object_tracker.update(frame.timestamp, frame.detections)
+        self._add_context_entry(frame, updated_objects)
 
     def add_analysis(
         self,
         frame_id: str,
-        analysis: Dict[str, Any]
+        analysis: Dict[str, Any],
+        analyzed_at: Optional[float] = None
     ) -> None:
         """
         Store scene analysis results.
@@ -57,16 +86,26 @@ class ContextMemory:
         Args:
             frame_id: Frame identifier
             analysis: Analysis results
+            analyzed_at: When the analysis was made (defaults to now)
         """
+        self.scene_analysis.pop(frame_id, None)  # A replaced analysis moves to the back
         self.scene_analysis[frame_id] = {
-            "timestamp": time.time(),
+            "timestamp": analyzed_at or time.time(),
             "analysis": analysis
         }
         self.stats["analyses_stored"] += 1
+        while len(self.scene_analysis) > self.frames.maxlen:
+            self._evict_analysis(next(iter(self.scene_analysis)))
+        self.last_updated = time.time()
 
         # Update scene understanding
         self._update_scene_understanding(analysis)
 
+        entry = self._window_entries.get(frame_id)
+        if entry is not None:
+            entry["analysis"] = analysis
+            entry["ongoing_activities"] = self.scene_understanding["ongoing_activities"]
+
     def get_recent_context(
         self,
         current_frame_id: str,
@@ -77,89 +116,52 @@ class ContextMemory:
 
         Args:
             current_frame_id: Current frame ID
-            limit: Maximum context entries
+            limit: Maximum context entries (at most the context window size)
 
         Returns:
-            List of recent context entries
+            List of recent context entries; they are shared with the window, so
+            callers must not modify them
         """
         context = []
-        seen_frames = set()
-
-        # Add recent frames and their analysis
-        for frame in reversed(self.frames):
+        for entry in reversed(self.context_window):
             if len(context) >= limit:
                 break
-
-            if frame.frame_id == current_frame_id:
-                continue
-
-            if frame.frame_id in seen_frames:
-                continue
-
-            # Get analysis for this frame
-            analysis = self.scene_analysis.get(
-                frame.frame_id,
-                {"analysis": {}}
-            )["analysis"]
-
-            context_entry = {
-                "frame_id": frame.frame_id,
-                "timestamp": frame.timestamp,
-                "detections": [d.model_dump() for d in frame.detections],
-                "vlm_description": frame.vlm_description, # Add vlm_description
-                "analysis": analysis
+            if entry["frame_id"] != current_frame_id:
+                context.append(entry)
+
+        return context[::-1]  # Return in chronological order
+
+    def _add_context_entry(self, frame: DetectionFrame, updated_objects: List[str]) -> None:
+        """Build the context entry of a newly stored frame and add it to the window."""
+        entry = self._window_entries.get(frame.frame_id)
+        if entry is not None:
+            # A frame stored again replaces its entry's contents but keeps its place
+            analysis = entry["analysis"]
+        else:
+            analysis = self.scene_analysis.get(frame.frame_id, {"analysis": {}})["analysis"]
+            if len(self.context_window) == self.context_window.maxlen:
+                evicted = self.context_window[0]
+                if self._window_entries.get(evicted["frame_id"]) is evicted:
+                    del self._window_entries[evicted["frame_id"]]
+            entry = {}
+            self.context_window.append(entry)
+            self._window_entries[frame.frame_id] = entry
+
+        entry.update({
+            "frame_id": frame.frame_id,
+            "timestamp": frame.timestamp,
+            "detections": [d.model_dump() for d in frame.detections],
+            "vlm_description": frame.vlm_description, # Add vlm_description
+            "analysis": analysis,
+            "ongoing_activities": self.scene_understanding["ongoing_activities"],
+            "tracked_objects": {
+                obj_id: self.object_tracker.get(obj_id).to_dict() for obj_id in updated_objects
             }
+        })
 
-            # Add ongoing activities and tracked objects
-            context_entry.update({
-                "ongoing_activities": self.scene_understanding["ongoing_activities"],
-                "tracked_objects": {
-                    k: v for k, v in self.scene_understanding["tracked_objects"].items()
-                    if v["last_seen"] >= frame.timestamp - 5.0  # Objects seen in last 5s
-                }
-            })
-
-            context.append(context_entry)
-            seen_frames.add(frame.frame_id)
-
-        return list(reversed(context))  # Return in chronological order
-
-    def _update_object_tracking(self, frame: DetectionFrame) -> None:
-        """Update tracked objects from frame detections."""
-        current_objects = set()
-
-        for det in frame.detections:
-            if det.track_id is not None:
-                obj_id = f"{det.label}_{det.track_id}"
-                current_objects.add(obj_id)
-
-                # Update or create tracked object
-                if obj_id not in self.scene_understanding["tracked_objects"]:
-                    self.scene_understanding["tracked_objects"][obj_id] = {
-                        "label": det.label,
-                        "track_id": det.track_id,
-                        "first_seen": frame.timestamp,
-                        "last_seen": frame.timestamp,
-                        "detection_count": 1,
-                        "average_confidence": det.confidence,
-                        "trajectory": [det.bbox]
-                    }
-                else:
-                    obj = self.scene_understanding["tracked_objects"][obj_id]
-                    obj["last_seen"] = frame.timestamp
-                    obj["detection_count"] += 1
-                    obj["average_confidence"] = (
-                        (obj["average_confidence"] * (obj["detection_count"] - 1) +
-                        det.confidence) / obj["detection_count"]
-                    )
-                    obj["trajectory"].append(det.bbox)
-
-        # Clean up old objects
-        current_time = frame.timestamp
-        self.scene_understanding["tracked_objects"] = {
-            k: v for k, v in self.scene_understanding["tracked_objects"].items()
-            if v["last_seen"] >= current_time - 5.0 or k in current_objects
-        }
+    def latest_frame(self) -> Optional[DetectionFrame]:
+        """The most recently stored frame, if any."""
+        return self.frames[-1] if self.frames else None
 
     def _update_scene_understanding(self, analysis: Dict[str, Any]) -> None:
         """Update ongoing scene understanding."""
@@ -182,22 +184,30 @@ class ContextMemory:
                 "timestamp": time.time()
             }
 
-    def cleanup_old_entries(self) -> None:
-        """Remove old entries to free memory."""
-        current_time = time.time()
-        if current_time - self.stats["last_cleanup"] < 300:  # 5 minutes
-            return
-
-        # Remove old analysis results
-        frame_ids = {frame.frame_id for frame in self.frames}
-        self.scene_analysis = {
-            k: v for k, v in self.scene_analysis.items()
-            if k in frame_ids
-        }
+    def _evict_analysis(self, frame_id: str) -> None:
+        if self.scene_analysis.pop(frame_id, None) is not None:
+            self.stats["analyses_evicted"] += 1
+
+    def cleanup_old_entries(self, max_age: float, limit: int) -> int:
+        """
+        Remove analyses older than max_age, oldest first.
 
-        # Update stats
-        self.stats["last_cleanup"] = current_time
-        logger.debug("Cleaned up old context entries")
+        Args:
+            max_age: Seconds an analysis is kept
+            limit: Analyses removed at most, so one call stays short
+
+        Returns:
+            Number of analyses removed
+        """
+        cutoff = time.time() - max_age
+        removed = 0
+        while self.scene_analysis and removed < limit:
+            frame_id, entry = next(iter(self.scene_analysis.items()))
+            if entry["timestamp"] >= cutoff:
+                break
+            self._evict_analysis(frame_id)
+            removed += 1
+        return removed
 
     def get_stats(self) -> Dict[str, Any]:
         """Get memory statistics."""
@@ -206,7 +216,9 @@ class ContextMemory:
             "total_frames_seen": self.stats["frames_stored"],
             "analyses_in_memory": len(self.scene_analysis),
             "total_analyses": self.stats["analyses_stored"],
-            "tracked_objects": len(self.scene_understanding["tracked_objects"]),
+            "analyses_evicted": self.stats["analyses_evicted"],
+            "tracked_objects": len(self.object_tracker),
+            "context_window_entries": len(self.context_window),
             "ongoing_activities": len(self.scene_understanding["ongoing_activities"])
         }
 
@@ -219,14 +231,311 @@ class ContextMemory:
         """Clear all stored context."""
         self.frames.clear()
         self.scene_analysis.clear()
+        self.label_last_seen.clear()
+        self.context_window.clear()
+        self._window_entries.clear()
         self.scene_understanding = {
             "ongoing_activities": [],
-            "tracked_objects": {},
             "scene_state": {}
         }
+        self.object_tracker.clear()
         self.stats = {
             "frames_stored": 0,
             "analyses_stored": 0,
-            "last_cleanup": time.time()
+            "analyses_evicted": 0
+        }
+
+class ContextMemory:
+    """Context memory partitioned by device.
+
+    Each device gets its own DeviceContext shard, with its own frame capacity,
+    context window, tracked objects and stats, so lookups for one device never
+    touch another device's history. Methods take the device key of the frame or
+    question (device_id, or the client ID when none is sent); leaving it out
+    gives a view across all devices where that makes sense. A shard not updated
+    for CONTEXT_DEVICE_IDLE_TTL seconds is dropped whole.
+
+    run_maintenance, called periodically by the server, evicts aged analyses in
+    bounded batches and drops idle shards; its cost is reported in the stats.
+
+    Stored frames keep only metadata; their images go to a shared ImageStore with
+    one byte budget for all devices.
+
+    With a ContextLog, stored frames and analyses are also queued to the log and
+    snapshot_objects records the tracked objects; restore replays the tail of
+    the log after a restart. Images are not logged.
+    """
+
+    def __init__(
+        self,
+        max_frames: int = 300000,
+        window_size: Optional[int] = None,
+        device_idle_ttl: Optional[float] = None,
+        log: Optional[ContextLog] = None
+    ):
+        """
+        Initialize context memory.
+
+        Args:
+            max_frames: Maximum frames to keep per device
+            window_size: Recent frames per device kept as context entries (defaults to settings.CONTEXT_WINDOW_SIZE)
+            device_idle_ttl: Seconds after which an idle device's shard is dropped
+                (defaults to settings.CONTEXT_DEVICE_IDLE_TTL, 0 keeps shards)
+            log: Log that stored context is appended to (None keeps it in memory only)
+        """
+        self.max_frames = max_frames
+        self.window_size = window_size
+        self.device_idle_ttl = settings.CONTEXT_DEVICE_IDLE_TTL if device_idle_ttl is None else device_idle_ttl
+        self.shards: Dict[str, DeviceContext] = {}
+        self.image_store = ImageStore()
+        self.log = log
+        self.stats = {
+            "devices_dropped": 0,
+            "maintenance_runs": 0,
+            "maintenance_removed": 0,
+            "maintenance_time": 0.0,
+            "maintenance_max_time": 0.0
         }
+        logger.info(f"ContextMemory initialized with {max_frames} frame capacity per device")
+
+    def shard(self, device_id: str) -> Optional[DeviceContext]:
+        """A device's shard, if it has stored anything."""
+        return self.shards.get(device_id)
+
+    def _shard_for_update(self, device_id: Optional[str]) -> DeviceContext:
+        key = device_id or DEFAULT_DEVICE
+        shard = self.shards.get(key)
+        if shard is None:
+            shard = DeviceContext(self.max_frames, self.window_size)
+            self.shards[key] = shard
+        return shard
+
+    def add_frame(self, frame: DetectionFrame, device_id: Optional[str] = None) -> None:
+        """
+        Add frame to its device's memory.
+
+        Args:
+            frame: Frame to store; its image goes to the image store and the
+                stored copy of the frame has no image_data
+            device_id: Device key (defaults to frame.device_id)
+        """
+        device_id = device_id or frame.device_id or DEFAULT_DEVICE
+        if frame.image_data:
+            self.image_store.put(_image_key(device_id, frame.frame_id), frame.image_data)
+            frame = frame.model_copy(update={"image_data": None})
+        self._shard_for_update(device_id).add_frame(frame)
+        if self.log is not None:
+            self.log.append("frame", {"device": device_id, "frame_id": frame.frame_id, "frame": frame})
+
+    def add_analysis(self, frame_id: str, analysis: Dict[str, Any], device_id: Optional[str] = None) -> None:
+        """Store scene analysis results of a device's frame."""
+        self._shard_for_update(device_id).add_analysis(frame_id, analysis)
+        if self.log is not None:
+            self.log.append("analysis", {
+                "device": device_id or DEFAULT_DEVICE,
+                "frame_id": frame_id,
+                "analyzed_at": time.time(),
+                "analysis": analysis
+            })
+
+    def snapshot_objects(self) -> int:
+        """
+        Append the tracked objects of each device whose objects changed since its last snapshot to the log.
+
+        Returns:
+            Number of snapshots appended
+        """
+        if self.log is None:
+            return 0
+        appended = 0
+        for device_id, shard in self.shards.items():
+            tracker = shard.object_tracker
+            if tracker.version == shard.logged_objects_version:
+                continue
+            self.log.append("objects", {"device": device_id, "objects": tracker.snapshot()})
+            shard.logged_objects_version = tracker.version
+            appended += 1
+        return appended
+
+    def restore(self, frames: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Rebuild memory from the tail of the log, as it was before a restart.
+
+        Records are replayed in the order they were logged: frames and analyses
+        are stored again (without their images) and object snapshots replace the
+        device's tracked objects. Replayed records are not logged again.
+
+        Args:
+            frames: Frames to replay at most (defaults to settings.CONTEXT_LOG_RECOVERY_FRAMES)
+
+        Returns:
+            {"records": records replayed, "devices": devices restored, "duration": seconds}
+        """
+        if self.log is None:
+            return {"records": 0, "devices": 0, "duration": 0.0}
+        start_time = time.perf_counter()
+        replayed = 0
+        for kind, record in self.log.tail(frames or settings.CONTEXT_LOG_RECOVERY_FRAMES):
+            try:
+                shard = self._shard_for_update(record["device"])
+                if kind == "frame":
+                    shard.add_frame(DetectionFrame.model_validate(record["frame"]))
+                elif kind == "analysis":
+                    shard.add_analysis(record["frame_id"], record["analysis"], record.get("analyzed_at"))
+                else:
+                    shard.object_tracker.load(record["objects"])
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning(f"Skipping unreadable {kind} record in context log: {e}")
+                continue
+            replayed += 1
+        for shard in self.shards.values():
+            shard.logged_objects_version = shard.object_tracker.version  # Replaying the log gives this state again
+        return {"records": replayed, "devices": len(self.shards), "duration": time.perf_counter() - start_time}
+
+    def get_recent_context(
+        self,
+        current_frame_id: str,
+        limit: int = 5,
+        device_id: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Get recent context for a frame.
+
+        Args:
+            current_frame_id: Current frame ID
+            limit: Maximum context entries (at most the context window size)
+            device_id: Device whose history to use; None merges the most recent
+                entries of all devices by timestamp
+
+        Returns:
+            List of recent context entries in chronological order; they are
+            shared with the shards, so callers must not modify them
+        """
+        if device_id is not None:
+            shard = self.shards.get(device_id)
+            return shard.get_recent_context(current_frame_id, limit) if shard else []
+        per_device = [shard.get_recent_context(current_frame_id, limit) for shard in self.shards.values()]
+        return list(heapq.merge(*per_device, key=lambda entry: entry["timestamp"]))[-limit:] if limit > 0 else []
+
+    def latest_frame(self, device_id: Optional[str] = None) -> Optional[DetectionFrame]:
+        """The most recently stored frame of a device, or of any device."""
+        if device_id is not None:
+            shard = self.shards.get(device_id)
+            return shard.latest_frame() if shard else None
+        frames = [frame for frame in (shard.latest_frame() for shard in self.shards.values()) if frame is not None]
+        return max(frames, key=lambda frame: frame.timestamp, default=None)
+
+    def last_seen(self, label: str, device_id: Optional[str] = None) -> Optional[float]:
+        """Timestamp of the latest frame showing a label, on one device or any."""
+        shards = self._shards(device_id)
+        return max((shard.label_last_seen[label] for shard in shards if label in shard.label_last_seen), default=None)
+
+    def seen_labels(self, device_id: Optional[str] = None) -> Set[str]:
+        """Labels detected so far, on one device or any."""
+        labels: Set[str] = set()
+        for shard in self._shards(device_id):
+            labels.update(shard.label_last_seen)
+        return labels
+
+    def get_image(self, frame_id: str, device_id: Optional[str] = None) -> Optional[bytes]:
+        """Raw image bytes of a stored frame, if the image store still has them."""
+        return self.image_store.get(_image_key(device_id or DEFAULT_DEVICE, frame_id))
+
+    def _shards(self, device_id: Optional[str]) -> Iterable[DeviceContext]:
+        if device_id is None:
+            return self.shards.values()
+        shard = self.shards.get(device_id)
+        return [shard] if shard else []
+
+    def drop_device(self, device_id: str) -> bool:
+        """Forget everything stored for a device; returns whether it had a shard.
+
+        The device's images are not searched out; they age out of the image store.
+        """
+        if self.shards.pop(device_id, None) is None:
+            return False
+        self.stats["devices_dropped"] += 1
+        logger.info(f"Dropped context memory of device {device_id}")
+        return True
+
+    def _drop_idle_devices(self) -> int:
+        """Drop shards not updated within the idle TTL; returns how many were dropped."""
+        if not self.device_idle_ttl:
+            return 0
+        now = time.time()
+        idle = [key for key, shard in self.shards.items() if now - shard.last_updated > self.device_idle_ttl]
+        for device_id in idle:
+            self.drop_device(device_id)
+        return len(idle)
+
+    def run_maintenance(self, max_age: Optional[float] = None, limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        One incremental cleanup pass over all shards.
+
+        Args:
+            max_age: Seconds an analysis is kept (defaults to settings.SCENE_ANALYSIS_MAX_AGE)
+            limit: Analyses removed per pass at most (defaults to settings.MEMORY_CLEANUP_BATCH)
+
+        Returns:
+            {"removed": analyses removed, "devices_dropped": count, "duration": seconds}
+        """
+        start_time = time.perf_counter()
+        max_age = settings.SCENE_ANALYSIS_MAX_AGE if max_age is None else max_age
+        budget = settings.MEMORY_CLEANUP_BATCH if limit is None else limit
+        dropped = self._drop_idle_devices()
+        removed = 0
+        for shard in self.shards.values():
+            if removed >= budget:
+                break
+            removed += shard.cleanup_old_entries(max_age, budget - removed)
+
+        duration = time.perf_counter() - start_time
+        self.stats["maintenance_runs"] += 1
+        self.stats["maintenance_removed"] += removed
+        self.stats["maintenance_time"] += duration
+        self.stats["maintenance_max_time"] = max(self.stats["maintenance_max_time"], duration)
+        return {"removed": removed, "devices_dropped": dropped, "duration": duration}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get memory statistics, in total and per device."""
+        per_device = {device_id: shard.get_stats() for device_id, shard in self.shards.items()}
+        runs = self.stats["maintenance_runs"]
+        totals = {
+            key: sum(stats[key] for stats in per_device.values())
+            for key in (
+                "frames_in_memory", "total_frames_seen", "analyses_in_memory", "total_analyses", "analyses_evicted", "tracked_objects"
+            )
+        }
+        return {
+            "devices": len(self.shards),
+            "devices_dropped": self.stats["devices_dropped"],
+            **totals,
+            "per_device": per_device,
+            "image_store": self.image_store.get_stats(),
+            "log": self.log.get_stats() if self.log is not None else None,
+            "maintenance": {
+                "runs": runs,
+                "removed": self.stats["maintenance_removed"],
+                "average_time": self.stats["maintenance_time"] / runs if runs else 0.0,
+                "max_time": self.stats["maintenance_max_time"]
+            }
+        }
+
+    def is_healthy(self) -> bool:
+        """Check if every device's memory is healthy."""
+        return all(shard.is_healthy() for shard in self.shards.values())
+
+    def clear(self) -> None:
+        """Clear all stored context."""
+        self.shards.clear()
+        self.image_store.clear()
         logger.info("Context memory cleared")
+
+    def close(self) -> None:
+        """Release the image store, removing its spill file, and write out and close the log."""
+        self.image_store.close()
+        if self.log is not None:
+            self.log.close()
+
+def _image_key(device_id: str, frame_id: str) -> str:
+    return f"{device_id}/{frame_id}"
@@ -0,0 +1,124 @@
+"""Token-budgeted selection of context entries for LLM prompts."""
+import string
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from utils.logger import get_logger
+from config import settings
+
+logger = get_logger(__name__)
+
+class ContextPacker:
+    """Fills a token budget with the most relevant context entries.
+
+    Each entry is rendered to the text it would add to a prompt. Entries are ranked
+    by how many words they share with the query (most recent first among equals,
+    or purely by recency without a query) and added while they fit in the budget.
+    The chosen entries are returned in their original, chronological order.
+
+    Token counts are cached by rendered text: consecutive prompts draw on mostly
+    the same recent history, so each entry is usually tokenized only once.
+    """
+
+    def __init__(self, count_tokens: Callable[[str], int], cache_size: Optional[int] = None):
+        """
+        Initialize context packer.
+
+        Args:
+            count_tokens: Token counter of the loaded language model
+            cache_size: Token counts kept at most (defaults to settings.CONTEXT_TOKEN_CACHE_SIZE)
+        """
+        self.count_tokens = count_tokens
+        self.cache_size = cache_size or settings.CONTEXT_TOKEN_CACHE_SIZE
+        self._token_counts: "OrderedDict[str, int]" = OrderedDict()
+        self.stats = {
+            "packs": 0,
+            "entries_packed": 0,
+            "entries_dropped": 0,
+            "tokens_packed": 0,
+            "count_cache_hits": 0,
+            "count_cache_misses": 0
+        }
+
+    def count(self, text: str) -> int:
+        """Token count of a rendered entry, from the cache when possible."""
+        tokens = self._token_counts.get(text)
+        if tokens is not None:
+            self._token_counts.move_to_end(text)
+            self.stats["count_cache_hits"] += 1
+            return tokens
+
+        self.stats["count_cache_misses"] += 1
+        tokens = self.count_tokens(text)
+        self._token_counts[text] = tokens
+        if len(self._token_counts) > self.cache_size:
+            self._token_counts.popitem(last=False)
+        return tokens
+
+    def pack(
+        self,
+        entries: List[Dict[str, Any]],
+        render: Callable[[Dict[str, Any]], str],
+        budget: int,
+        query: Optional[str] = None
+    ) -> Tuple[str, int]:
+        """
+        Select context entries that fit a token budget.
+
+        Args:
+            entries: Context entries in chronological order
+            render: Turns an entry into prompt text ("" leaves the entry out)
+            budget: Tokens the selected entries may use
+            query: Text the entries should be relevant to (recency only when omitted)
+
+        Returns:
+            (text of the selected entries, tokens they use)
+        """
+        candidates = []
+        for index, entry in enumerate(entries):
+            text = render(entry)
+            if text:
+                candidates.append((index, text))
+
+        query_terms = _terms(query) if query else set()
+        if query_terms:
+            candidates.sort(key=lambda c: (len(query_terms & _terms(c[1])), c[0]), reverse=True)
+        else:
+            candidates.sort(key=lambda c: c[0], reverse=True)
+
+        selected = []
+        used = 0
+        for index, text in candidates:
+            tokens = self.count(text)
+            if used + tokens > budget:
+                continue  # A shorter entry further down may still fit
+            selected.append((index, text))
+            used += tokens
+
+        self.stats["packs"] += 1
+        self.stats["entries_packed"] += len(selected)
+        self.stats["entries_dropped"] += len(candidates) - len(selected)
+        self.stats["tokens_packed"] += used
+        return "".join(text for _, text in sorted(selected)), used
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get packing statistics."""
+        packs = self.stats["packs"]
+        lookups = self.stats["count_cache_hits"] + self.stats["count_cache_misses"]
+        return {
+            "packs": packs,
+            "average_entries_packed": self.stats["entries_packed"] / packs if packs else 0.0,
+            "entries_dropped": self.stats["entries_dropped"],
+            "average_tokens_packed": self.stats["tokens_packed"] / packs if packs else 0.0,
+            "count_cache_entries": len(self._token_counts),
+            "count_cache_hit_rate": self.stats["count_cache_hits"] / lookups if lookups else 0.0
+        }
+
+    def clear(self) -> None:
+        """Drop all cached token counts."""
+        self._token_counts.clear()
+
+def _terms(text: str) -> Set[str]:
+    """Content words of a text, for relevance matching."""
+    words = (word.strip(string.punctuation).lower() for word in text.split())
+    return {word for word in words if len(word) > 2}
@@ -0,0 +1,186 @@
+"""Direct answers to simple questions about what the cameras have seen."""
+import re
+import time
+from typing import Any, Dict, Iterable, Optional
+
+from services.context_memory import ContextMemory
+from services.inference_backends import YOLO_CLASS_NAMES
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_ARTICLE = r"(?:(?:a|an|the|any|some) )?"
+_OBJECT = r"(?P<object>[a-z][a-z ]*?)"
+_WHERE = r"(?: (?:here|there|visible|(?:right )?now|in (?:the )?(?:room|scene|view|frame|picture|image)))?"
+
+# Question patterns by intent, matched against the normalized question
+QUESTION_PATTERNS = {
+    "count": [
+        re.compile(rf"^how many {_OBJECT}(?: (?:are|is) there| do you see| can you see| are visible| are)?{_WHERE}$")
+    ],
+    "presence": [
+        re.compile(rf"^(?:is there|are there|do you see|can you see) {_ARTICLE}{_OBJECT}{_WHERE}$"),
+        re.compile(rf"^is (?P<object>anyone|anybody|someone|somebody){_WHERE}$")
+    ],
+    "last_seen": [
+        re.compile(rf"^when did {_ARTICLE}{_OBJECT} last (?:appear|show up)$"),
+        re.compile(rf"^when (?:was|were) {_ARTICLE}{_OBJECT} last (?:seen|visible)$"),
+        re.compile(rf"^when did you last see {_ARTICLE}{_OBJECT}$")
+    ]
+}
+
+# Words that name a label without being its plain singular form
+ALIASES = {
+    "people": "person", "persons": "person", "anyone": "person", "anybody": "person",
+    "someone": "person", "somebody": "person", "man": "person", "men": "person",
+    "woman": "person", "women": "person", "child": "person", "children": "person",
+    "television": "tv", "phone": "cell phone", "sofa": "couch", "table": "dining table",
+    "plant": "potted plant", "fridge": "refrigerator"
+}
+
+class ContextQueryEngine:
+    """Answers counting, presence and last-seen questions from context memory.
+
+    Questions like "how many people are there", "is there a cup" or "when did the
+    dog last appear" only need detection data the server already holds: the latest
+    frame's detections and the time each label was last seen. They are answered
+    directly instead of going through the LLM. Questions that do not match a known
+    pattern, or that name something outside the detection vocabulary, return None
+    so the caller can fall back to the LLM.
+    """
+
+    def __init__(self, context_memory: ContextMemory, vocabulary: Optional[Iterable[str]] = None):
+        """
+        Initialize context query engine.
+
+        Args:
+            context_memory: Memory whose frames and label index answer the questions
+            vocabulary: Labels questions may ask about (defaults to the YOLO classes;
+                labels seen in frames are always accepted too)
+        """
+        self.context_memory = context_memory
+        self.vocabulary = set(vocabulary if vocabulary is not None else YOLO_CLASS_NAMES)
+        self.stats = {
+            "count": 0,
+            "presence": 0,
+            "last_seen": 0,
+            "fallbacks": 0,
+            "total_time": 0.0
+        }
+
+    def answer(self, question: str, device_id: Optional[str] = None) -> Optional[Dict[str, str]]:
+        """
+        Answer a question from context memory if it is one of the recognized kinds.
+
+        Args:
+            question: The user's question
+            device_id: Device whose frames the question is about (None uses all devices)
+
+        Returns:
+            {"answer": text, "intent": "count" | "presence" | "last_seen"}, or None
+            when the LLM has to answer
+        """
+        start_time = time.perf_counter()
+        result = self._answer(_normalize_question(question), device_id)
+        if result is None:
+            self.stats["fallbacks"] += 1
+        else:
+            self.stats[result["intent"]] += 1
+            self.stats["total_time"] += time.perf_counter() - start_time
+        return result
+
+    def _answer(self, question: str, device_id: Optional[str]) -> Optional[Dict[str, str]]:
+        for intent, patterns in QUESTION_PATTERNS.items():
+            for pattern in patterns:
+                match = pattern.match(question)
+                if match is None:
+                    continue
+                label = self._resolve_label(match.group("object"), device_id)
+                if label is None:
+                    return None
+                frame = self.context_memory.latest_frame(device_id)
+                if frame is None:
+                    return None  # Nothing seen yet; let the LLM say so in its own words
+                visible = sum(1 for det in frame.detections if det.label == label)
+                if intent == "count":
+                    text = f"I see {_quantity(visible, label)}." if visible else f"I don't see any {_plural(label)} right now."
+                elif intent == "presence":
+                    text = f"Yes, I see {_quantity(visible, label)}." if visible else f"No, I don't see {_indefinite(label)} right now."
+                else:
+                    text = self._last_seen_answer(label, visible, device_id)
+                return {"answer": text, "intent": intent}
+        return None
+
+    def _last_seen_answer(self, label: str, visible: int, device_id: Optional[str]) -> str:
+        if visible:
+            return f"{_indefinite(label).capitalize()} is in view right now."
+        last_seen = self.context_memory.last_seen(label, device_id)
+        if last_seen is None:
+            return f"I haven't seen {_indefinite(label)}."
+        return f"I last saw {_indefinite(label)} {_ago(time.time() - last_seen)}."
+
+    def _resolve_label(self, phrase: str, device_id: Optional[str] = None) -> Optional[str]:
+        """Map an object phrase from a question to a detection label."""
+        phrase = ALIASES.get(phrase, phrase)
+        words = phrase.split()
+        singular = " ".join(words[:-1] + [ALIASES.get(words[-1], _singular(words[-1]))])
+        labels = self.vocabulary | self.context_memory.seen_labels(device_id)
+        for candidate in (phrase, singular):
+            if candidate in labels:
+                return candidate
+        # "table" -> "dining table", "phone" -> "cell phone"
+        matches = [label for label in labels if label.endswith(" " + singular)]
+        return matches[0] if len(matches) == 1 else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get query statistics."""
+        answered = self.stats["count"] + self.stats["presence"] + self.stats["last_seen"]
+        return {
+            "answered": answered,
+            "count": self.stats["count"],
+            "presence": self.stats["presence"],
+            "last_seen": self.stats["last_seen"],
+            "fallbacks": self.stats["fallbacks"],
+            "average_answer_time_us": self.stats["total_time"] / answered * 1e6 if answered else 0.0
+        }
+
+def _normalize_question(question: str) -> str:
+    return " ".join(question.lower().replace("?", " ").replace("!", " ").replace(".", " ").split())
+
+def _singular(word: str) -> str:
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith(("ches", "shes", "xes", "sses")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+def _plural(label: str) -> str:
+    if label == "person":
+        return "people"
+    if label.endswith(("ch", "sh", "x", "s")):
+        return label + "es"
+    if label.endswith("y") and label[-2:-1] not in "aeiou":
+        return label[:-1] + "ies"
+    return label + "s"
+
+def _quantity(count: int, label: str) -> str:
+    return f"{count} {label if count == 1 else _plural(label)}"
+
+def _indefinite(label: str) -> str:
+    if label == "person":
+        return "someone"
+    return ("an " if label[0] in "aeiou" else "a ") + label
+
+def _ago(seconds: float) -> str:
+    seconds = max(0.0, seconds)
+    if seconds < 5:
+        return "just now"
+    if seconds < 60:
+        return f"{int(seconds)} seconds ago"
+    if seconds < 3600:
+        minutes = int(seconds // 60)
+        return f"{minutes} minute{'s' if minutes != 1 else ''} ago"
+    hours = int(seconds // 3600)
+    return f"{hours} hour{'s' if hours != 1 else ''} ago"
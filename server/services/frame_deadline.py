@@ -0,0 +1,108 @@
+"""Per-frame latency budgets checked at stage boundaries."""
+import time
+from typing import Any, Dict, Optional
+
+from services.frame_pipeline import FrameJob
+from utils.logger import get_logger
+from config import settings
+
+logger = get_logger(__name__)
+
+# Decisions returned by FrameDeadline.check
+PROCEED = "proceed"
+DOWNGRADE = "downgrade"
+DROP = "drop"
+
+class FrameDeadline:
+    """Decides whether a frame can still be answered within its latency budget.
+
+    A frame's age is measured from when the server received it (or from the client
+    `timestamp` when FRAME_DEADLINE_CLOCK is "client", which assumes synced clocks).
+    At each stage boundary the remaining budget is compared with a moving average of
+    how long the upcoming stage usually takes:
+
+        admission: an already expired frame is dropped
+        describe / reason: a frame that cannot finish the stage in time is
+            downgraded, i.e. answered without running that stage
+    """
+
+    def __init__(self, budget: Optional[float] = None, clock: Optional[str] = None):
+        """
+        Initialize frame deadline checks.
+
+        Args:
+            budget: Seconds a frame may take end to end (0 disables the checks)
+            clock: "server" to age frames from receipt, "client" to use the frame timestamp
+        """
+        self.budget = settings.FRAME_LATENCY_BUDGET if budget is None else budget
+        self.clock = clock or settings.FRAME_DEADLINE_CLOCK
+        self._expected: Dict[str, float] = {}  # Moving average duration per stage
+        self.stats = {
+            "frames_checked": 0,
+            "frames_dropped": 0,
+            "frames_downgraded": 0,
+            "dropped_by_stage": {},
+            "downgraded_by_stage": {}
+        }
+
+    def age(self, job: FrameJob) -> float:
+        """Seconds since the frame started counting against its budget."""
+        start = job.frame.timestamp if self.clock == "client" else job.received_at
+        return max(0.0, time.time() - start)
+
+    def remaining(self, job: FrameJob) -> float:
+        """Seconds of budget left for the frame."""
+        return self.budget - self.age(job)
+
+    def check(self, job: FrameJob, stage: str) -> str:
+        """
+        Decide what to do with a frame before running a stage.
+
+        Args:
+            job: Frame being processed
+            stage: Stage about to run ("admission", "describe" or "reason")
+
+        Returns:
+            PROCEED, DOWNGRADE or DROP
+        """
+        if self.budget <= 0:
+            return PROCEED
+
+        self.stats["frames_checked"] += 1
+        remaining = self.remaining(job)
+
+        if stage == "admission":
+            if remaining > 0:
+                return PROCEED
+            decision, counter = DROP, "dropped"
+        else:
+            if remaining > self._expected.get(stage, 0.0):
+                return PROCEED
+            decision, counter = DOWNGRADE, "downgraded"
+
+        self.stats[f"frames_{counter}"] += 1
+        by_stage = self.stats[f"{counter}_by_stage"]
+        by_stage[stage] = by_stage.get(stage, 0) + 1
+        logger.info(
+            f"Frame {job.frame.frame_id} {counter} before {stage}: "
+            f"{remaining:.2f}s of {self.budget:.2f}s budget left"
+        )
+        return decision
+
+    def observe(self, stage: str, duration: float) -> None:
+        """Feed a measured stage duration into its moving average."""
+        previous = self._expected.get(stage)
+        self._expected[stage] = duration if previous is None else 0.8 * previous + 0.2 * duration
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get deadline statistics."""
+        return {
+            "latency_budget": self.budget,
+            "clock": self.clock,
+            "frames_checked": self.stats["frames_checked"],
+            "frames_dropped": self.stats["frames_dropped"],
+            "frames_downgraded": self.stats["frames_downgraded"],
+            "dropped_by_stage": dict(self.stats["dropped_by_stage"]),
+            "downgraded_by_stage": dict(self.stats["downgraded_by_stage"]),
+            "expected_stage_durations": dict(self._expected)
+        }
@@ -0,0 +1,190 @@
+"""Frame dispatching across a pool of processing workers."""
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+from services.frame_pipeline import FrameJob
+from utils.logger import get_logger
+from config import settings
+
+logger = get_logger(__name__)
+
+FrameHandler = Callable[[FrameJob], Awaitable[None]]
+
+OVERFLOW_POLICIES = ("drop_oldest", "latest_wins", "reject")
+
+class FrameQueueFullError(Exception):
+    """Raised when a device's frame buffer is full and the overflow policy is "reject"."""
+
+class FrameDispatcher:
+    """Runs queued frames on a worker pool while keeping each device's frames in order.
+
+    Every device gets its own bounded FIFO of pending frames. A device is handed to at
+    most one worker at a time, so frames from the same device are processed strictly
+    in arrival order while different devices are processed concurrently.
+
+    Overflow policies:
+        drop_oldest: a full buffer discards its oldest frame to make room
+        latest_wins: a new frame replaces every frame still waiting for its device
+        reject: a full buffer refuses the new frame with FrameQueueFullError
+    """
+
+    def __init__(
+        self,
+        num_workers: Optional[int] = None,
+        max_per_device: Optional[int] = None,
+        overflow_policy: Optional[str] = None
+    ):
+        """
+        Initialize frame dispatcher.
+
+        Args:
+            num_workers: Number of concurrent frame workers (defaults to settings.FRAME_WORKERS)
+            max_per_device: Pending frames allowed per device (defaults to settings.FRAME_QUEUE_MAX_PER_DEVICE)
+            overflow_policy: What to do with a full buffer (defaults to settings.FRAME_QUEUE_OVERFLOW_POLICY)
+        """
+        self.num_workers = max(1, num_workers or settings.FRAME_WORKERS)
+        self.max_per_device = max(1, max_per_device or settings.FRAME_QUEUE_MAX_PER_DEVICE)
+        self.overflow_policy = overflow_policy or settings.FRAME_QUEUE_OVERFLOW_POLICY
+        if self.overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow_policy must be one of: {', '.join(OVERFLOW_POLICIES)}")
+        self._pending: Dict[str, Deque[FrameJob]] = {}
+        self._scheduled: Set[str] = set()  # Devices waiting in _ready or held by a worker
+        self._ready: asyncio.Queue = asyncio.Queue()
+        self._workers: List[asyncio.Task] = []
+        self._handler: Optional[FrameHandler] = None
+        self._in_flight = 0
+        self._queued = 0
+        self.stats = {
+            "frames_enqueued": 0,
+            "frames_processed": 0,
+            "frames_failed": 0,
+            "frames_dropped": 0,
+            "frames_rejected": 0
+        }
+        logger.info(
+            f"FrameDispatcher initialized with {self.num_workers} workers, "
+            f"{self.max_per_device} frames per device, policy {self.overflow_policy}"
+        )
+
+    async def start(self, handler: FrameHandler) -> None:
+        """
+        Start the worker pool.
+
+        Args:
+            handler: Coroutine called with every dequeued FrameJob
+        """
+        self._handler = handler
+        for worker_id in range(self.num_workers):
+            self._workers.append(asyncio.create_task(self._worker(worker_id)))
+        logger.info(f"Started {self.num_workers} frame processor workers")
+
+    async def put(self, job: FrameJob) -> List[FrameJob]:
+        """
+        Enqueue a frame for processing, applying the overflow policy.
+
+        Args:
+            job: Frame to process
+
+        Returns:
+            Frames that were evicted from the buffer to admit this one
+
+        Raises:
+            FrameQueueFullError: If the device's buffer is full and the policy is "reject"
+        """
+        key = job.device_key
+        frames = self._pending.setdefault(key, deque())
+        dropped: List[FrameJob] = []
+
+        if self.overflow_policy == "latest_wins":
+            dropped.extend(frames)
+            frames.clear()
+        elif len(frames) >= self.max_per_device:
+            if self.overflow_policy == "reject":
+                self.stats["frames_rejected"] += 1
+                raise FrameQueueFullError(
+                    f"Frame queue for device {key} is full ({self.max_per_device} frames pending)"
+                )
+            while len(frames) >= self.max_per_device:
+                dropped.append(frames.popleft())
+
+        frames.append(job)
+        self._queued += 1 - len(dropped)
+        self.stats["frames_enqueued"] += 1
+        self.stats["frames_dropped"] += len(dropped)
+        if key not in self._scheduled:
+            self._scheduled.add(key)
+            self._ready.put_nowait(key)
+        return dropped
+
+    def qsize(self) -> int:
+        """Number of frames waiting to be picked up by a worker."""
+        return self._queued
+
+    async def _worker(self, worker_id: int) -> None:
+        """Take the next ready device, process its oldest frame, then hand the device back."""
+        logger.info(f"Frame processor worker {worker_id} started.")
+        while True:
+            try:
+                key = await self._ready.get()
+            except asyncio.CancelledError:
+                logger.info(f"Frame processor worker {worker_id} cancelled.")
+                break
+
+            frames = self._pending.get(key)
+            if not frames:
+                self._pending.pop(key, None)
+                self._scheduled.discard(key)
+                continue
+
+            job = frames.popleft()
+            self._queued -= 1
+            self._in_flight += 1
+            try:
+                await self._handler(job)
+                self.stats["frames_processed"] += 1
+            except asyncio.CancelledError:
+                logger.info(f"Frame processor worker {worker_id} cancelled.")
+                break
+            except Exception as e:
+                self.stats["frames_failed"] += 1
+                logger.error(f"Error in frame processor worker {worker_id}: {e}")
+            finally:
+                self._in_flight -= 1
+                # Requeue the device behind the others so one busy phone cannot starve the rest
+                if frames:
+                    self._ready.put_nowait(key)
+                else:
+                    self._pending.pop(key, None)
+                    self._scheduled.discard(key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get dispatcher statistics."""
+        return {
+            "workers": self.num_workers,
+            "overflow_policy": self.overflow_policy,
+            "max_per_device": self.max_per_device,
+            "frames_in_flight": self._in_flight,
+            "queue_size": self.qsize(),
+            "devices_pending": len(self._pending),
+            "frames_enqueued": self.stats["frames_enqueued"],
+            "frames_processed": self.stats["frames_processed"],
+            "frames_failed": self.stats["frames_failed"],
+            "frames_dropped": self.stats["frames_dropped"],
+            "frames_rejected": self.stats["frames_rejected"]
+        }
+
+    def is_healthy(self) -> bool:
+        """Check that the worker pool is running."""
+        return bool(self._workers) and not all(task.done() for task in self._workers)
+
+    async def shutdown(self) -> None:
+        """Stop all workers and drop pending frames."""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+        self._pending.clear()
+        self._scheduled.clear()
+        self._queued = 0
+        logger.info("Frame dispatcher shut down")
@@ -0,0 +1,175 @@
+"""Staged asynchronous pipeline for full processing mode."""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from models import FrameDataMessage
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+class FrameJob:
+    """State carried by one frame as it moves through the processing stages."""
+
+    def __init__(self, client_id: str, frame: FrameDataMessage):
+        self.client_id = client_id
+        self.frame = frame
+        self.received_at = time.time()
+        self.packet_events: List[Dict[str, Any]] = []
+        self.detections: Optional[List[Any]] = None
+        self.detection_duration = 0.0
+        self.vision_analysis: Optional[Dict[str, Any]] = None
+        self.vision_duration = 0.0
+        self.degraded = False  # Set when a stage is skipped to stay within the latency budget
+        self.superseded = False  # Set when a newer frame from the device cancelled its scene analysis
+
+    @property
+    def device_key(self) -> str:
+        """Key used to keep a device's frames together; falls back to the connection when no device_id is sent."""
+        return self.frame.device_id or self.client_id
+
+StageHandler = Callable[[FrameJob], Awaitable[bool]]
+
+class PipelineStage:
+    """One pipeline stage: a bounded input channel drained by a fixed number of workers."""
+
+    def __init__(self, name: str, handler: StageHandler, concurrency: int, channel_size: int):
+        """
+        Initialize pipeline stage.
+
+        Args:
+            name: Stage name used in logs and stats
+            handler: Coroutine run for each job; returns False to stop the job at this stage
+            concurrency: Number of jobs this stage may run at once
+            channel_size: Capacity of the channel feeding this stage
+        """
+        self.name = name
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self.channel: asyncio.Queue = asyncio.Queue(maxsize=max(1, channel_size))
+        self.in_flight = 0
+        self.stats = {
+            "processed": 0,
+            "stopped": 0,
+            "failed": 0,
+            "total_duration": 0.0
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get stage statistics."""
+        handled = self.stats["processed"] + self.stats["stopped"] + self.stats["failed"]
+        return {
+            "concurrency": self.concurrency,
+            "queue_depth": self.channel.qsize(),
+            "queue_capacity": self.channel.maxsize,
+            "in_flight": self.in_flight,
+            "processed": self.stats["processed"],
+            "stopped": self.stats["stopped"],
+            "failed": self.stats["failed"],
+            "average_duration": self.stats["total_duration"] / handled if handled else 0.0
+        }
+
+class FramePipeline:
+    """Runs frames through a chain of stages connected by bounded channels.
+
+    While one frame is in a slow stage (e.g. the LLM), later frames keep moving
+    through the earlier stages, so throughput is set by the slowest stage rather
+    than by the sum of all of them. A full channel blocks the stage in front of it,
+    which pushes backpressure all the way to `submit`.
+
+    With a stage concurrency above 1, frames of the same device may overtake each
+    other inside that stage.
+    """
+
+    def __init__(self, stages: List[PipelineStage]):
+        """
+        Initialize frame pipeline.
+
+        Args:
+            stages: Stages in execution order
+        """
+        if not stages:
+            raise ValueError("FramePipeline needs at least one stage")
+        self.stages = stages
+        self._workers: List[asyncio.Task] = []
+        self.stats = {
+            "frames_submitted": 0,
+            "frames_completed": 0
+        }
+        logger.info(f"FramePipeline initialized with stages: {', '.join(s.name for s in stages)}")
+
+    async def start(self) -> None:
+        """Start the workers of every stage."""
+        for index, stage in enumerate(self.stages):
+            for worker_id in range(stage.concurrency):
+                self._workers.append(asyncio.create_task(self._stage_worker(index, worker_id)))
+        logger.info(f"Started frame pipeline with {len(self._workers)} stage workers")
+
+    async def submit(self, job: FrameJob) -> None:
+        """Feed a job into the first stage, waiting while its channel is full."""
+        await self.stages[0].channel.put(job)
+        self.stats["frames_submitted"] += 1
+
+    def qsize(self) -> int:
+        """Number of jobs waiting in any stage channel."""
+        return sum(stage.channel.qsize() for stage in self.stages)
+
+    async def _stage_worker(self, index: int, worker_id: int) -> None:
+        """Pull jobs from a stage's channel, run the handler and forward to the next stage."""
+        stage = self.stages[index]
+        next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+        while True:
+            try:
+                job = await stage.channel.get()
+            except asyncio.CancelledError:
+                break
+
+            stage.in_flight += 1
+            start_time = time.time()
+            try:
+                proceed = await stage.handler(job)
+                outcome = "processed" if proceed else "stopped"
+            except asyncio.CancelledError:
+                stage.in_flight -= 1
+                break
+            except Exception as e:
+                proceed = False
+                outcome = "failed"
+                logger.error(f"Pipeline stage {stage.name} (worker {worker_id}) failed for frame {job.frame.frame_id}: {e}")
+            stage.in_flight -= 1
+            stage.stats["total_duration"] += time.time() - start_time
+            stage.stats[outcome] += 1
+            if not proceed:
+                continue
+
+            if next_stage is None:
+                self.stats["frames_completed"] += 1
+                continue
+            try:
+                await next_stage.channel.put(job)
+            except asyncio.CancelledError:
+                break
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get pipeline statistics, including per-stage queue depth."""
+        return {
+            "frames_submitted": self.stats["frames_submitted"],
+            "frames_completed": self.stats["frames_completed"],
+            "queue_size": self.qsize(),
+            "stages": {stage.name: stage.get_stats() for stage in self.stages}
+        }
+
+    def is_healthy(self) -> bool:
+        """Check that the stage workers are running."""
+        return bool(self._workers) and not all(task.done() for task in self._workers)
+
+    async def shutdown(self) -> None:
+        """Stop all stage workers and drop queued jobs."""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+        for stage in self.stages:
+            while not stage.channel.empty():
+                stage.channel.get_nowait()
+        logger.info("Frame pipeline shut down")
@@ -0,0 +1,102 @@
+"""Cancellation of scene analyses made obsolete by a newer frame."""
+from typing import Any, Dict, Optional
+
+from services.cancellation import CancellationToken
+from utils.logger import get_logger
+from config import settings
+
+logger = get_logger(__name__)
+
+class FrameSupersession:
+    """Cancels a device's in-flight scene analysis when the device sends a newer frame.
+
+    Each scene analysis registers a cancellation token for its device while the
+    LLM runs. When a newer frame from the same device is admitted, the tokens of
+    the device's in-flight analyses are cancelled; generation stops at the next
+    token and the older frame is acknowledged as superseded instead of answered.
+
+    A device that sends frames faster than one can be analyzed would otherwise
+    never get an answer, so after SUPERSEDE_MAX_CONSECUTIVE analyses in a row were
+    cancelled the next one is allowed to finish.
+    """
+
+    def __init__(self, enabled: Optional[bool] = None, max_consecutive: Optional[int] = None):
+        """
+        Initialize frame supersession.
+
+        Args:
+            enabled: Cancel superseded analyses (defaults to settings.CANCEL_SUPERSEDED_FRAMES)
+            max_consecutive: Cancellations in a row after which an analysis is left to finish
+                (defaults to settings.SUPERSEDE_MAX_CONSECUTIVE, 0 = no limit)
+        """
+        self.enabled = settings.CANCEL_SUPERSEDED_FRAMES if enabled is None else enabled
+        self.max_consecutive = settings.SUPERSEDE_MAX_CONSECUTIVE if max_consecutive is None else max_consecutive
+        self._in_flight: Dict[str, Dict[str, CancellationToken]] = {}  # device -> frame_id -> token
+        self._consecutive: Dict[str, int] = {}  # device -> analyses cancelled since one finished
+        self._latest: Dict[str, str] = {}  # device -> newest admitted frame_id
+        self.stats = {
+            "analyses_started": 0,
+            "analyses_completed": 0,
+            "analyses_superseded": 0,
+            "analyses_spared": 0
+        }
+
+    def begin(self, device_key: str, frame_id: str) -> CancellationToken:
+        """Register a scene analysis that is about to run; returns its cancellation token."""
+        token = CancellationToken()
+        self._in_flight.setdefault(device_key, {})[frame_id] = token
+        self.stats["analyses_started"] += 1
+        return token
+
+    def end(self, device_key: str, frame_id: str, token: CancellationToken) -> None:
+        """Unregister a scene analysis that finished or was cancelled."""
+        in_flight = self._in_flight.get(device_key)
+        if in_flight is not None and in_flight.get(frame_id) is token:
+            del in_flight[frame_id]
+            if not in_flight:
+                del self._in_flight[device_key]
+        if not token.cancelled:
+            self._consecutive[device_key] = 0
+            self.stats["analyses_completed"] += 1
+
+    def supersede(self, device_key: str, frame_id: str) -> int:
+        """
+        Record a newly admitted frame and cancel the device's older in-flight analyses.
+
+        Args:
+            device_key: Device the frame came from
+            frame_id: The new frame
+
+        Returns:
+            Number of analyses cancelled
+        """
+        self._latest[device_key] = frame_id
+        in_flight = self._in_flight.get(device_key)
+        if not self.enabled or not in_flight:
+            return 0
+
+        running = [token for older_id, token in in_flight.items() if older_id != frame_id and not token.cancelled]
+        if not running:
+            return 0
+        if self.max_consecutive and self._consecutive.get(device_key, 0) >= self.max_consecutive:
+            self.stats["analyses_spared"] += len(running)
+            return 0
+
+        for token in running:
+            token.cancel(f"superseded by frame {frame_id}")
+        self._consecutive[device_key] = self._consecutive.get(device_key, 0) + 1
+        self.stats["analyses_superseded"] += len(running)
+        logger.debug(f"Frame {frame_id} superseded {len(running)} in-flight analyses of device {device_key}")
+        return len(running)
+
+    def latest_frame(self, device_key: str) -> Optional[str]:
+        """Newest frame admitted from a device."""
+        return self._latest.get(device_key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get supersession statistics."""
+        return {
+            "enabled": self.enabled,
+            "in_flight": sum(len(in_flight) for in_flight in self._in_flight.values()),
+            **self.stats
+        }
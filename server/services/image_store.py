@@ -0,0 +1,245 @@
+"""Byte-budgeted storage of frame images, kept apart from frame metadata."""
+import base64
+import binascii
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple, Union
+
+from utils.logger import get_logger
+from config import settings
+
+logger = get_logger(__name__)
+
+class ImageStore:
+    """Raw image bytes by frame_id, within a fixed memory budget.
+
+    Images arrive base64 encoded and are stored decoded, which saves a quarter of
+    the size. When the stored bytes exceed the budget, the least recently used
+    images are evicted. With a spill path set, evicted images are appended to a
+    file on disk instead of being dropped, and read back from there on request;
+    when the file reaches its own limit it is emptied and starts over, so the
+    oldest spilled images are the ones lost.
+
+    put runs on the event loop and never touches the disk: evicted images wait in
+    a pending buffer (still readable by get) until spill, run on a background
+    thread, writes them out. The pending buffer is held to the same byte budget;
+    beyond it the oldest pending images are dropped.
+    """
+
+    def __init__(
+        self,
+        max_bytes: Optional[int] = None,
+        spill_path: Optional[str] = None,
+        spill_max_bytes: Optional[int] = None
+    ):
+        """
+        Initialize image store.
+
+        Args:
+            max_bytes: Image bytes kept in memory (defaults to settings.IMAGE_STORE_MAX_BYTES)
+            spill_path: File evicted images are written to (defaults to settings.IMAGE_STORE_SPILL_PATH,
+                "" drops evicted images)
+            spill_max_bytes: Size at which the spill file starts over (defaults to settings.IMAGE_STORE_SPILL_MAX_BYTES)
+        """
+        self.max_bytes = settings.IMAGE_STORE_MAX_BYTES if max_bytes is None else max_bytes
+        self.spill_path = settings.IMAGE_STORE_SPILL_PATH if spill_path is None else spill_path
+        self.spill_max_bytes = spill_max_bytes or settings.IMAGE_STORE_SPILL_MAX_BYTES
+        self._images: "OrderedDict[str, bytes]" = OrderedDict()  # Least recently used first
+        self._bytes = 0
+        self._pending: "OrderedDict[str, bytes]" = OrderedDict()  # Evicted images waiting to be spilled, oldest first
+        self._pending_bytes = 0
+        self._spilled: Dict[str, Tuple[int, int]] = {}  # frame_id -> (offset, length) in the spill file
+        self._spill_file: Optional[BinaryIO] = None
+        self._spill_bytes = 0
+        self._lock = threading.Lock()  # Guards the pending and spilled maps between the event loop and spill
+        self._spill_lock = threading.Lock()  # One spill at a time
+        self.stats = {
+            "stored": 0,
+            "invalid": 0,
+            "hits": 0,
+            "spill_hits": 0,
+            "misses": 0,
+            "evicted": 0,
+            "spilled": 0,
+            "spill_dropped": 0,
+            "spill_resets": 0
+        }
+
+    def put(self, frame_id: str, image_data: Union[str, bytes]) -> None:
+        """
+        Store a frame's image.
+
+        Args:
+            frame_id: Frame identifier
+            image_data: Base64 encoded image, or raw bytes
+        """
+        if isinstance(image_data, str):
+            try:
+                image_data = base64.b64decode(image_data, validate=True)
+            except (binascii.Error, ValueError):
+                self.stats["invalid"] += 1
+                logger.warning(f"Not storing image of frame {frame_id}: invalid base64")
+                return
+
+        self.discard(frame_id)
+        self._images[frame_id] = image_data
+        self._bytes += len(image_data)
+        self.stats["stored"] += 1
+        while self._bytes > self.max_bytes and self._images:
+            evicted_id, evicted = self._images.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.stats["evicted"] += 1
+            if self.spill_path and len(evicted) <= self.spill_max_bytes:
+                self._queue_spill(evicted_id, evicted)
+
+    def get(self, frame_id: str) -> Optional[bytes]:
+        """Raw bytes of a frame's image, or None if it is no longer stored."""
+        image = self._images.get(frame_id)
+        if image is not None:
+            self._images.move_to_end(frame_id)
+            self.stats["hits"] += 1
+            return image
+
+        with self._lock:
+            image = self._pending.get(frame_id)
+            location = self._spilled.get(frame_id)
+            spill_file = self._spill_file
+        if image is not None:
+            self.stats["spill_hits"] += 1
+            return image
+        if location is not None:
+            offset, length = location
+            image = os.pread(spill_file.fileno(), length, offset)
+            if len(image) == length:  # Shorter if the file started over while reading
+                self.stats["spill_hits"] += 1
+                return image
+
+        self.stats["misses"] += 1
+        return None
+
+    def get_base64(self, frame_id: str) -> Optional[str]:
+        """A frame's image encoded as base64, as clients send it."""
+        image = self.get(frame_id)
+        return base64.b64encode(image).decode("ascii") if image is not None else None
+
+    def discard(self, frame_id: str) -> None:
+        """Forget a frame's image (spilled bytes stay in the file until it starts over)."""
+        image = self._images.pop(frame_id, None)
+        if image is not None:
+            self._bytes -= len(image)
+        with self._lock:
+            pending = self._pending.pop(frame_id, None)
+            if pending is not None:
+                self._pending_bytes -= len(pending)
+            self._spilled.pop(frame_id, None)
+
+    def __contains__(self, frame_id: str) -> bool:
+        return frame_id in self._images or frame_id in self._pending or frame_id in self._spilled
+
+    def _queue_spill(self, frame_id: str, image: bytes) -> None:
+        with self._lock:
+            self._pending[frame_id] = image
+            self._pending_bytes += len(image)
+            while self._pending_bytes > self.max_bytes and self._pending:
+                _, dropped = self._pending.popitem(last=False)
+                self._pending_bytes -= len(dropped)
+                self.stats["spill_dropped"] += 1
+
+    @property
+    def spill_pending(self) -> int:
+        """Evicted images waiting to be written to the spill file."""
+        return len(self._pending)
+
+    def spill(self) -> int:
+        """
+        Write evicted images waiting in memory to the spill file.
+
+        Blocking, so run it off the event loop. Images stay readable from the
+        pending buffer until their bytes are in the file.
+
+        Returns:
+            Number of images written
+        """
+        with self._spill_lock:
+            with self._lock:
+                batch: List[Tuple[str, bytes]] = list(self._pending.items())
+            if not batch:
+                return 0
+
+            written: List[Tuple[str, bytes, int]] = []
+            try:
+                if self._spill_file is None:
+                    self._spill_file = open(self.spill_path, "w+b")
+                for frame_id, image in batch:
+                    if self._spill_bytes + len(image) > self.spill_max_bytes:
+                        self._reset_spill_file()
+                        self._drop_pending(written)  # Their bytes went with the old file contents
+                        written = []
+                    os.pwrite(self._spill_file.fileno(), image, self._spill_bytes)
+                    written.append((frame_id, image, self._spill_bytes))
+                    self._spill_bytes += len(image)
+            except OSError as e:
+                logger.error(f"Spilling images to {self.spill_path} failed: {e}")
+
+            with self._lock:
+                for frame_id, image, offset in written:
+                    # Skip images discarded or evicted from the buffer while they were written
+                    if self._pending.get(frame_id) is image:
+                        del self._pending[frame_id]
+                        self._pending_bytes -= len(image)
+                        self._spilled[frame_id] = (offset, len(image))
+            self.stats["spilled"] += len(written)
+            return len(written)
+
+    def _drop_pending(self, images: List[Tuple[str, bytes, int]]) -> None:
+        with self._lock:
+            for frame_id, image, _ in images:
+                if self._pending.get(frame_id) is image:
+                    del self._pending[frame_id]
+                    self._pending_bytes -= len(image)
+                    self.stats["spill_dropped"] += 1
+
+    def _reset_spill_file(self) -> None:
+        with self._lock:
+            self._spilled.clear()
+        self._spill_file.truncate(0)
+        self._spill_bytes = 0
+        self.stats["spill_resets"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get image storage statistics."""
+        return {
+            "images_in_memory": len(self._images),
+            "bytes_in_memory": self._bytes,
+            "max_bytes": self.max_bytes,
+            "images_pending_spill": len(self._pending),
+            "bytes_pending_spill": self._pending_bytes,
+            "images_spilled": len(self._spilled),
+            "spill_file_bytes": self._spill_bytes,
+            **self.stats
+        }
+
+    def clear(self) -> None:
+        """Drop all stored images, including spilled ones."""
+        self._images.clear()
+        self._bytes = 0
+        with self._spill_lock:
+            with self._lock:
+                self._pending.clear()
+                self._pending_bytes = 0
+                self._spilled.clear()
+            self._spill_bytes = 0
+            if self._spill_file is not None:
+                self._spill_file.truncate(0)
+
+    def close(self) -> None:
+        """Drop all images and remove the spill file."""
+        self.clear()
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+            try:
+                os.remove(self.spill_path)
+            except OSError:
+                pass
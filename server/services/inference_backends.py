@@ -0,0 +1,733 @@
+"""Inference backends behind ModelManager."""
+import base64
+import hashlib
+import io
+import random
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from services.cancellation import CancellationToken, GenerationCancelled
+from services.prompt_cache import PromptPrefixCache, PROMPT_CACHE_AVAILABLE
+from utils.logger import get_logger
+from config import settings
+
+logger = get_logger(__name__)
+
+# MLX imports (still needed for Gemma)
+mx = None
+nn = None
+mlx_lm = None
+MLX_AVAILABLE = False
+
+def check_mlx_availability():
+    """Check if MLX and mlx_lm are available."""
+    global MLX_AVAILABLE, mx, nn, mlx_lm
+    try:
+        import mlx.core as mx_core
+        import mlx.nn as nn_core
+        import mlx_lm as lm_core
+        mx = mx_core
+        nn = nn_core
+        mlx_lm = lm_core
+        MLX_AVAILABLE = True
+        logger.info("MLX and mlx-lm loaded successfully")
+        return True
+    except ImportError as e:
+        logger.warning(f"MLX or mlx-lm not available. Please install MLX and mlx-lm for Apple Silicon support. Error: {e}")
+        return False
+
+MLX_READY = check_mlx_availability()
+
+# Labels of the YOLO model's classes, by class index
+YOLO_CLASS_NAMES = ["person", "bicycle", "car", "motorcycle", "airplane", "bus", "train", "truck", "boat",
+                    "traffic light", "fire hydrant", "stop sign", "parking meter", "bench", "bird", "cat",
+                    "dog", "horse", "sheep", "cow", "elephant", "bear", "zebra", "giraffe", "backpack",
+                    "umbrella", "handbag", "tie", "suitcase", "frisbee", "skis", "snowboard", "sports ball",
+                    "kite", "baseball bat", "baseball glove", "skateboard", "surfboard", "tennis racket",
+                    "bottle", "wine glass", "cup", "fork", "knife", "spoon", "bowl", "banana", "apple",
+                    "sandwich", "orange", "broccoli", "carrot", "hot dog", "pizza", "donut", "cake",
+                    "chair", "couch", "potted plant", "bed", "dining table", "toilet", "tv", "laptop",
+                    "mouse", "remote", "keyboard", "cell phone", "microwave", "oven", "toaster", "sink",
+                    "refrigerator", "book", "clock", "vase", "scissors", "teddy bear", "hair drier", "toothbrush"]
+
+# Text models a backend can hold: the main model (LLM_MODEL_PATH) and an optional
+# smaller one for frame summaries (SUMMARY_LLM_MODEL_PATH)
+TEXT_MODELS = ("main", "summary")
+
+# Why a generation ended: "length" (max_tokens reached), "stop" (end-of-sequence
+# token) or "sentence_end" (stopped after the first complete sentence)
+SENTENCE_ENDINGS = (".", "!", "?")
+
+def ends_sentence(text: str) -> bool:
+    """Whether the text generated so far ends with a complete sentence.
+
+    Pass the whole response, not the latest chunk: tokenizers usually emit the
+    final "." as a token of its own.
+    """
+    stripped = text.rstrip()
+    return len(stripped) > 1 and stripped.endswith(SENTENCE_ENDINGS)
+
+def decode_image(image_data: Union[str, bytes]) -> Image.Image:
+    """Decode a base64 string or raw encoded bytes (e.g. JPEG) into an RGB image."""
+    if isinstance(image_data, str):
+        image_data = base64.b64decode(image_data)
+    return Image.open(io.BytesIO(image_data)).convert("RGB")
+
+class InferenceBackend(ABC):
+    """Blocking model calls behind ModelManager.
+
+    ModelManager runs every method on its inference executor threads, so
+    implementations may block freely. `generate` is only ever called from the
+    single text thread.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def load(self) -> Dict[str, bool]:
+        """Load the models needed for settings.PROCESSING_MODE; returns which models are loaded."""
+
+    @abstractmethod
+    def generate(
+        self,
+        prompt: str,
+        emit: Optional[Callable[[str], Any]] = None,
+        max_tokens: Optional[int] = None,
+        stop_at_sentence_end: bool = False,
+        model: str = "main",
+        cancel_token: Optional[CancellationToken] = None
+    ) -> Dict[str, Any]:
+        """
+        Generate a response to a prompt.
+
+        Args:
+            prompt: Prompt text
+            emit: Called with each new piece of text when given
+            max_tokens: Token limit (defaults to settings.MAX_TEXT_LENGTH)
+            stop_at_sentence_end: Stop once the response completes a sentence
+            model: Text model to generate with (one of TEXT_MODELS that load reported)
+            cancel_token: Checked before each token; generation stops once it is cancelled
+
+        Returns:
+            {"response": text, "tokens_generated": count, "finish_reason": reason}
+
+        Raises:
+            GenerationCancelled: If cancel_token was cancelled before generation finished
+        """
+
+    @abstractmethod
+    def detect(self, image_data: Union[str, bytes]) -> List[Dict[str, Any]]:
+        """Detect objects in an encoded image."""
+
+    @abstractmethod
+    def describe(self, image_data: Union[str, bytes], prompt: str) -> Dict[str, Any]:
+        """Describe an encoded image."""
+
+    def open_batch(self, max_size: int, model: str = "main") -> "BatchSession":
+        """Start a batched generation session on a text model; sequences run one after another unless overridden."""
+        return SerialBatchSession(self, model)
+
+    def count_tokens(self, text: str) -> int:
+        """Number of language model tokens in a text; estimated unless the backend has a tokenizer."""
+        return estimate_tokens(text)
+
+    def get_prompt_cache_stats(self) -> Dict[str, Any]:
+        """Hit and reuse metrics of the backend's prompt prefix cache, if it has one."""
+        return {"enabled": False}
+
+    def unload(self) -> None:
+        """Release the models."""
+
+class BatchSession(ABC):
+    """A set of sequences generated together, which new sequences may join between steps.
+
+    Used from the text thread only.
+    """
+
+    @abstractmethod
+    def add(self, key: Any, prompt: str, max_tokens: int) -> None:
+        """Add a sequence to the batch."""
+
+    @abstractmethod
+    def step(self) -> List[Tuple[Any, str, int, Optional[str]]]:
+        """
+        Advance every sequence by one decode step.
+
+        Returns:
+            (key, new text, new tokens, finish reason or None) per sequence
+        """
+
+    def cancel(self, key: Any) -> None:
+        """Stop decoding a sequence; its later output, if any, is ignored by the caller."""
+
+    @property
+    @abstractmethod
+    def active(self) -> int:
+        """Sequences that have not finished yet."""
+
+    def close(self) -> None:
+        """Release batch resources."""
+
+class SerialBatchSession(BatchSession):
+    """Fallback for backends without batched decoding: each step generates one whole sequence."""
+
+    def __init__(self, backend: InferenceBackend, model: str = "main"):
+        self.backend = backend
+        self.model = model
+        self._pending: List[Tuple[Any, str, int]] = []
+
+    def add(self, key: Any, prompt: str, max_tokens: int) -> None:
+        self._pending.append((key, prompt, max_tokens))
+
+    def step(self) -> List[Tuple[Any, str, int, Optional[str]]]:
+        key, prompt, max_tokens = self._pending.pop(0)
+        result = self.backend.generate(prompt, max_tokens=max_tokens, model=self.model)
+        return [(key, result["response"], result["tokens_generated"], result["finish_reason"])]
+
+    def cancel(self, key: Any) -> None:
+        self._pending = [entry for entry in self._pending if entry[0] != key]
+
+    @property
+    def active(self) -> int:
+        return len(self._pending)
+
+class MLXCoreMLBackend(InferenceBackend):
+    """Gemma (plus an optional summary model) on MLX for text, YOLO and FastVLM on CoreML for vision."""
+
+    name = "mlx"
+
+    def __init__(self):
+        if not MLX_READY:
+            raise RuntimeError("MLX or mlx-lm is required but not available. Please install them.")
+
+        self.gemma_model: Optional[Any] = None
+        self.gemma_tokenizer: Optional[Any] = None
+        self.text_models: Dict[str, Tuple[Any, Any]] = {}  # Loaded text models by name: (model, tokenizer)
+        self.yolo_model: Optional[Any] = None  # coremltools MLModel
+        self.vlm_model: Optional[Any] = None  # coremltools MLModel
+
+        self.gemma_path_str = settings.LLM_MODEL_PATH
+        self.summary_path_str = settings.SUMMARY_LLM_MODEL_PATH
+        self.yolo_path_str = settings.YOLO_MODEL_PATH
+        self.vlm_path_str = settings.FASTVLM_MODEL_PATH
+
+        # Attention state of recent prompts per text model, so shared prefixes are not prefilled again
+        self.prompt_caches: Dict[str, PromptPrefixCache] = {}
+        if settings.PROMPT_CACHE_ENABLED and PROMPT_CACHE_AVAILABLE:
+            self.prompt_caches = {name: PromptPrefixCache() for name in TEXT_MODELS}
+
+    def load(self) -> Dict[str, bool]:
+        models_loaded = {"gemma": False, "summary": False, "yolo": False, "vlm": False}
+
+        logger.info(f"Loading Gemma model from {self.gemma_path_str}")
+        self.gemma_model, self.gemma_tokenizer = self._load_gemma_model()
+        self.text_models["main"] = (self.gemma_model, self.gemma_tokenizer)
+        models_loaded["gemma"] = True
+
+        if self.summary_path_str:
+            summary_model = self._load_summary_model()
+            if summary_model is not None:
+                self.text_models["summary"] = summary_model
+            models_loaded["summary"] = summary_model is not None
+
+        if settings.PROCESSING_MODE == "full":
+            logger.info("Full processing mode: Loading YOLO and VLM models.")
+            self.yolo_model = self._load_yolo_model()
+            models_loaded["yolo"] = self.yolo_model is not None
+
+            self.vlm_model = self._load_vlm_model()
+            models_loaded["vlm"] = self.vlm_model is not None
+
+        return models_loaded
+
+    def _load_gemma_model(self) -> Tuple[Any, Any]:
+        gemma_model_dir = Path(self.gemma_path_str)
+        if not gemma_model_dir.is_dir():
+            raise FileNotFoundError(f"Gemma model directory not found at {self.gemma_path_str}")
+
+        try:
+            model, tokenizer = mlx_lm.load(str(gemma_model_dir))
+            logger.info("Gemma model and tokenizer loaded successfully.")
+            return model, tokenizer
+        except Exception as e:
+            logger.error(f"Failed to load Gemma model from {self.gemma_path_str}: {e}")
+            raise
+
+    def _load_summary_model(self) -> Optional[Tuple[Any, Any]]:
+        logger.info(f"Loading summary model from {self.summary_path_str}")
+        try:
+            model, tokenizer = mlx_lm.load(str(Path(self.summary_path_str)))
+            logger.info("Summary model and tokenizer loaded successfully.")
+            return model, tokenizer
+        except Exception as e:
+            # Summaries fall back to Gemma
+            logger.error(f"Error loading summary model from {self.summary_path_str}: {e}")
+            return None
+
+    def _load_yolo_model(self) -> Optional[Any]:
+        logger.info(f"Loading YOLOv11n model from {self.yolo_path_str}")
+        try:
+            import coremltools as ct
+            # CoreML models are loaded using coremltools.models.MLModel
+            model = ct.models.MLModel(self.yolo_path_str)
+            logger.info("YOLOv11n model loaded successfully.")
+            return model
+        except Exception as e:
+            logger.error(f"Error loading YOLO model from {self.yolo_path_str}: {e}")
+            return None
+
+    def _load_vlm_model(self) -> Optional[Any]:
+        logger.info(f"Loading FastVLM model from {self.vlm_path_str}")
+        try:
+            import coremltools as ct
+            # FastVLM is also a CoreML model
+            # The .mlpackage contains the model.mlmodel file
+            vlm_model_path = Path(self.vlm_path_str) / "fastvithd.mlpackage" / "Data" / "com.apple.CoreML" / "model.mlmodel"
+            model = ct.models.MLModel(str(vlm_model_path))
+            logger.info("FastVLM model loaded successfully.")
+            return model
+        except Exception as e:
+            logger.error(f"Error loading FastVLM model from {self.vlm_path_str}: {e}")
+            return None
+
+    def generate(
+        self,
+        prompt: str,
+        emit: Optional[Callable[[str], Any]] = None,
+        max_tokens: Optional[int] = None,
+        stop_at_sentence_end: bool = False,
+        model: str = "main",
+        cancel_token: Optional[CancellationToken] = None
+    ) -> Dict[str, Any]:
+        max_tokens = max_tokens or settings.MAX_TEXT_LENGTH
+        text_model, tokenizer = self.text_models[model]
+        prompt_input, cache_kwargs, tokens = self._cached_prompt(prompt, model)
+        # stream_generate (which mlx_lm.generate wraps) lets us stop at a sentence end
+        parts = []
+        generated = 0
+        finish_reason = "length"
+        for response in mlx_lm.stream_generate(
+            text_model,
+            tokenizer,
+            prompt=prompt_input,
+            max_tokens=max_tokens,
+            **cache_kwargs
+        ):
+            if cancel_token is not None and cancel_token.cancelled:
+                finish_reason = "cancelled"
+                break
+            generated += 1
+            text = getattr(response, "text", response)  # Older mlx_lm versions yield plain strings
+            if text:
+                parts.append(text)
+                if emit is not None:
+                    emit(text)
+            if getattr(response, "finish_reason", None) == "stop":
+                finish_reason = "stop"
+            elif stop_at_sentence_end and text and ends_sentence("".join(parts)):
+                finish_reason = "sentence_end"
+                break
+        if tokens is not None:
+            self.prompt_caches[model].release(tokens, cache_kwargs["prompt_cache"])
+        if finish_reason == "cancelled":
+            raise GenerationCancelled(cancel_token.reason)
+        return {
+            "response": "".join(parts),
+            "tokens_generated": generated,
+            "finish_reason": finish_reason
+        }
+
+    def _cached_prompt(self, prompt: str, model: str = "main") -> Tuple[Any, Dict[str, Any], Optional[List[int]]]:
+        """
+        Prepare generation input, reusing cached attention state for a shared prompt prefix.
+
+        Returns:
+            (prompt argument for mlx_lm, extra generate kwargs, full prompt tokens or
+            None when the prefix cache is off)
+        """
+        if not self.prompt_caches:
+            return prompt, {}, None
+        text_model, tokenizer = self.text_models[model]
+        tokens = tokenizer.encode(prompt)
+        kv_cache, reused = self.prompt_caches[model].acquire(text_model, tokens)
+        return tokens[reused:], {"prompt_cache": kv_cache}, tokens
+
+    def detect(self, image_data: Union[str, bytes]) -> List[Dict[str, Any]]:
+        try:
+            image = decode_image(image_data)
+            
+            # YOLOv11n expects 640x640 input
+            image = image.resize((640, 640))
+
+            # CoreML model prediction
+            # The input name 'image' is derived from the CoreML model's input features
+            # You might need to inspect the .mlmodel to confirm the exact input/output names
+            predictions = self.yolo_model.predict({"image": image})
+
+            # Process predictions (this part is highly model-specific)
+            # Assuming output format similar to what's expected by iOS ObjectDetector
+            detections = []
+            # Example: if output is 'coordinates' and 'confidence'
+            # You need to map these to your Detection model format
+            # This is a placeholder and needs to be adapted to the actual YOLOv11n CoreML output
+            
+            # Example of processing output from a typical YOLO CoreML model
+            # This assumes the model outputs are named 'coordinates' and 'confidence'
+            # and that 'confidence' is a multiarray of shape (num_boxes, num_classes)
+            # and 'coordinates' is (num_boxes, 4) for [x,y,w,h] or [x1,y1,x2,y2]
+            
+            # You need to inspect your specific yolov11n.mlpackage to know the exact output names and shapes.
+            # For demonstration, let's assume it outputs 'var_1' (boxes) and 'var_2' (confidences)
+            # and that the boxes are normalized [x,y,w,h] and confidences are per class.
+            
+            # This is a generic example, replace with actual output parsing for yolov11n.mlpackage
+            if "var_1" in predictions and "var_2" in predictions:
+                boxes = predictions["var_1"]
+                confidences = predictions["var_2"]
+                
+                for i in range(confidences.shape[0]): # Iterate over detected boxes
+                    # Find the class with the highest confidence for this box
+                    max_confidence_idx = np.argmax(confidences[i])
+                    max_confidence = confidences[i, max_confidence_idx]
+                    
+                    if max_confidence > 0.25: # Example confidence threshold
+                        label = YOLO_CLASS_NAMES[max_confidence_idx]
+                        bbox_raw = boxes[i] # [x,y,w,h] or [x1,y1,x2,y2] depending on model
+                        
+                        # Convert [x,y,w,h] to [x1,y1,x2,y2] if necessary and normalize
+                        # Assuming bbox_raw is already normalized [x_center, y_center, width, height]
+                        x_center, y_center, width, height = bbox_raw
+                        x1 = x_center - width / 2
+                        y1 = y_center - height / 2
+                        x2 = x_center + width / 2
+                        y2 = y_center + height / 2
+                        
+                        detections.append({
+                            "label": label,
+                            "confidence": float(max_confidence),
+                            "bbox": [float(x1), float(y1), float(x2), float(y2)]
+                        })
+            
+            return detections
+        except Exception as e:
+            logger.error(f"Error during YOLO processing: {e}")
+            return []
+
+    def describe(self, image_data: Union[str, bytes], prompt: str) -> Dict[str, Any]:
+        try:
+            image = decode_image(image_data)
+            
+            # FastVLM expects 1024x1024 input
+            image = image.resize((1024, 1024))
+
+            # CoreML model prediction
+            # The input name 'images' is derived from the CoreML model's input features
+            predictions = self.vlm_model.predict({"images": image})
+
+            # Process predictions (this part is highly model-specific)
+            # Assuming output is 'image_features' which needs to be processed by an LLM
+            # This is a placeholder and needs to be adapted to the actual FastVLM CoreML output
+            
+            # The FastVLM CoreML model outputs image features, not directly a description.
+            # These features would then be fed into an LLM (like Gemma) to generate the description.
+            # For now, we'll return a placeholder description and confidence.
+            
+            # You would typically pass these image features to your LLM (Gemma) along with the text prompt.
+            # This requires a more complex integration than just a single CoreML model call.
+            
+            logger.warning("FastVLM CoreML model outputs features, not direct description. LLM integration needed.")
+            return {"description": "FastVLM features processed. LLM integration pending."}
+
+        except Exception as e:
+            logger.error(f"Error during VLM processing: {e}")
+            return {"description": "Error during VLM processing"}
+
+    def open_batch(self, max_size: int, model: str = "main") -> BatchSession:
+        try:
+            from mlx_lm.generate import BatchGenerator
+        except ImportError:  # mlx_lm before batched generation support
+            return SerialBatchSession(self, model)
+        if not hasattr(BatchGenerator, "remove"):  # mlx_lm before 0.28.4 cannot stop a single sequence
+            return SerialBatchSession(self, model)
+        text_model, tokenizer = self.text_models[model]
+        return MLXBatchSession(BatchGenerator, text_model, tokenizer, max_size)
+
+    def count_tokens(self, text: str) -> int:
+        if self.gemma_tokenizer is None:
+            return estimate_tokens(text)
+        return len(self.gemma_tokenizer.encode(text, add_special_tokens=False))
+
+    def get_prompt_cache_stats(self) -> Dict[str, Any]:
+        if not self.prompt_caches:
+            return {"enabled": False}
+        stats = {"enabled": True, **self.prompt_caches["main"].get_stats()}
+        if "summary" in self.text_models:
+            stats["summary"] = self.prompt_caches["summary"].get_stats()
+        return stats
+
+    def unload(self) -> None:
+        self.gemma_model = None
+        self.gemma_tokenizer = None
+        self.yolo_model = None
+        self.vlm_model = None
+        self.text_models.clear()
+        for prompt_cache in self.prompt_caches.values():
+            prompt_cache.clear()
+
+class MLXBatchSession(BatchSession):
+    """Batched text model decoding with mlx_lm's BatchGenerator.
+
+    The prompt prefix cache is not used here; BatchGenerator keeps its own
+    per-sequence caches. A cancelled sequence is removed from the generator, so
+    it stops decoding and frees its batch slot at once.
+    """
+
+    def __init__(self, generator_class: Any, model: Any, tokenizer: Any, max_size: int):
+        self.tokenizer = tokenizer
+        self.generator = generator_class(
+            model,
+            max_tokens=settings.MAX_TEXT_LENGTH,
+            stop_tokens=set(tokenizer.eos_token_ids),
+            completion_batch_size=max_size,
+            prefill_batch_size=max_size
+        )
+        self._sequences: Dict[int, Tuple[Any, List[int], int]] = {}  # uid -> (key, tokens, chars emitted)
+
+    def add(self, key: Any, prompt: str, max_tokens: int) -> None:
+        uid = self.generator.insert([self.tokenizer.encode(prompt)], max_tokens)[0]
+        self._sequences[uid] = (key, [], 0)
+
+    def step(self) -> List[Tuple[Any, str, int, Optional[str]]]:
+        results = []
+        for response in self.generator.next():
+            key, tokens, emitted = self._sequences[response.uid]
+            if response.finish_reason != "stop":
+                tokens.append(response.token)
+            # Decode the whole sequence so multi-token characters come out intact
+            text = self.tokenizer.decode(tokens)
+            results.append((key, text[emitted:], 1, response.finish_reason))
+            if response.finish_reason is not None:
+                del self._sequences[response.uid]
+            else:
+                self._sequences[response.uid] = (key, tokens, len(text))
+        return results
+
+    def cancel(self, key: Any) -> None:
+        uids = [uid for uid, (sequence_key, _, _) in self._sequences.items() if sequence_key == key]
+        if uids:
+            self.generator.remove(uids)
+            for uid in uids:
+                del self._sequences[uid]
+
+    @property
+    def active(self) -> int:
+        return len(self._sequences)
+
+class StandInBackend(InferenceBackend):
+    """CPU stand-in with deterministic outputs and configurable latency.
+
+    Outputs depend only on the input (prompt text or image bytes) and
+    STANDIN_SEED, so runs are reproducible. Each call blocks its executor thread
+    for a latency drawn from the configured distribution, which lets queuing,
+    memory and broadcast behaviour be measured on machines without MLX or CoreML.
+    """
+
+    name = "standin"
+
+    LABELS = ["person", "chair", "cup", "laptop", "bottle", "book", "dining table", "cell phone", "tv", "potted plant"]
+    FILLER = ["the", "a", "near", "with", "on", "beside", "scene", "shows", "room", "table", "left", "right"]
+    PREFILL_SHARE = 0.3  # Part of the text latency spent before the first token
+
+    def __init__(self):
+        self.seed = settings.STANDIN_SEED
+        self.distribution = settings.STANDIN_LATENCY_DISTRIBUTION
+        if self.distribution not in ("fixed", "normal", "lognormal"):
+            raise ValueError("STANDIN_LATENCY_DISTRIBUTION must be one of: fixed, normal, lognormal")
+        self.latency = {
+            "text": (settings.STANDIN_TEXT_LATENCY, settings.STANDIN_TEXT_LATENCY_STDDEV),
+            "detect": (settings.STANDIN_DETECT_LATENCY, settings.STANDIN_DETECT_LATENCY_STDDEV),
+            "describe": (settings.STANDIN_DESCRIBE_LATENCY, settings.STANDIN_DESCRIBE_LATENCY_STDDEV)
+        }
+        self._latency_rng = random.Random(self.seed)
+
+    def load(self) -> Dict[str, bool]:
+        full = settings.PROCESSING_MODE == "full"
+        logger.info(f"Stand-in inference backend ready ({self.distribution} latency, seed {self.seed})")
+        return {"gemma": True, "summary": bool(settings.SUMMARY_LLM_MODEL_PATH), "yolo": full, "vlm": full}
+
+    def generate(
+        self,
+        prompt: str,
+        emit: Optional[Callable[[str], Any]] = None,
+        max_tokens: Optional[int] = None,
+        stop_at_sentence_end: bool = False,
+        model: str = "main",
+        cancel_token: Optional[CancellationToken] = None
+    ) -> Dict[str, Any]:
+        max_tokens = max_tokens or settings.MAX_TEXT_LENGTH
+        words = self._response_words(prompt, model)
+        latency = self._text_latency(model)
+        time.sleep(latency * self.PREFILL_SHARE)
+        per_word = latency * (1 - self.PREFILL_SHARE) / len(words)  # One word stands in for one token
+        parts = []
+        finish_reason = "stop"
+        for index, word in enumerate(words):
+            if index == max_tokens:
+                finish_reason = "length"
+                break
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            time.sleep(per_word)
+            text = word if index == 0 else " " + word
+            parts.append(text)
+            if emit is not None:
+                emit(text)
+            if stop_at_sentence_end and ends_sentence("".join(parts)) and index < len(words) - 1:
+                finish_reason = "sentence_end"
+                break
+        return {
+            "response": "".join(parts),
+            "tokens_generated": len(parts),
+            "finish_reason": finish_reason
+        }
+
+    def open_batch(self, max_size: int, model: str = "main") -> BatchSession:
+        return StandInBatchSession(self, model)
+
+    def count_tokens(self, text: str) -> int:
+        return len(text.split())  # One word stands in for one token
+
+    def _response_words(self, prompt: str, model: str = "main") -> List[str]:
+        """Deterministic response of a text model to a prompt, as words."""
+        rng = self._output_rng(prompt.encode("utf-8") if model == "main" else (model + prompt).encode("utf-8"))
+        prompt_words = [w.strip(".,:;()").lower() for w in prompt.split()]
+        vocabulary = [w for w in prompt_words if w.isalpha() and len(w) > 3] or self.FILLER
+        if model == "summary":
+            # The smaller model answers in one short sentence, and sometimes gets stuck on a word
+            if rng.random() < settings.STANDIN_SUMMARY_FAILURE_RATE:
+                word = rng.choice(vocabulary)
+                return [word.capitalize()] + [word] * rng.randint(1, 4) + [word + "."]
+            length = rng.randint(5, 15)
+        else:
+            length = rng.randint(8, 40)
+        words = [rng.choice(vocabulary if rng.random() < 0.6 else self.FILLER) for _ in range(length)]
+        # Split into sentences of 5 to 15 words
+        start = 0
+        while start < len(words):
+            end = min(len(words), start + rng.randint(5, 15))
+            words[start] = words[start].capitalize()
+            words[end - 1] += "."
+            start = end
+        return words
+
+    def detect(self, image_data: Union[str, bytes]) -> List[Dict[str, Any]]:
+        rng = self._output_rng(_image_bytes(image_data))
+        time.sleep(self._sample_latency("detect"))
+        detections = []
+        for _ in range(rng.randint(0, 4)):
+            x1, y1 = rng.uniform(0.0, 0.8), rng.uniform(0.0, 0.8)
+            detections.append({
+                "label": rng.choice(self.LABELS),
+                "confidence": round(rng.uniform(0.3, 0.99), 3),
+                "bbox": [x1, y1, min(1.0, x1 + rng.uniform(0.05, 0.3)), min(1.0, y1 + rng.uniform(0.05, 0.3))]
+            })
+        return detections
+
+    def describe(self, image_data: Union[str, bytes], prompt: str) -> Dict[str, Any]:
+        rng = self._output_rng(_image_bytes(image_data))
+        time.sleep(self._sample_latency("describe"))
+        labels = sorted(set(rng.sample(self.LABELS, rng.randint(1, 3))))
+        return {"description": f"A view with {', '.join(labels)}.", "confidence": round(rng.uniform(0.5, 0.95), 3)}
+
+    def _output_rng(self, data: bytes) -> random.Random:
+        """Random generator seeded by the input, so the same input always gives the same output."""
+        digest = hashlib.sha1(str(self.seed).encode("utf-8") + data).digest()
+        return random.Random(int.from_bytes(digest[:8], "big"))
+
+    def _text_latency(self, model: str) -> float:
+        latency = self._sample_latency("text")
+        return latency * settings.STANDIN_SUMMARY_LATENCY_SCALE if model == "summary" else latency
+
+    def _sample_latency(self, kind: str) -> float:
+        mean, stddev = self.latency[kind]
+        if mean <= 0:
+            return 0.0
+        if self.distribution == "fixed" or stddev <= 0:
+            return mean
+        if self.distribution == "normal":
+            return max(0.0, self._latency_rng.gauss(mean, stddev))
+        # Lognormal with the configured mean and standard deviation
+        sigma_squared = np.log(1 + (stddev / mean) ** 2)
+        return self._latency_rng.lognormvariate(np.log(mean) - sigma_squared / 2, np.sqrt(sigma_squared))
+
+class StandInBatchSession(BatchSession):
+    """Emulated batched decoding: one word per sequence per step.
+
+    A step costs one word's worth of the sampled text latency, plus
+    STANDIN_BATCH_STEP_OVERHEAD of that for each additional sequence, mimicking
+    how batched decoding raises throughput on real hardware.
+    """
+
+    def __init__(self, backend: StandInBackend, model: str = "main"):
+        self.backend = backend
+        self.model = model
+        self._sequences: Dict[Any, Tuple[List[str], float, str]] = {}  # key -> (words left, seconds per word, finish reason)
+        self._prefill: List[float] = []  # Prefill time of sequences added since the last step
+
+    def add(self, key: Any, prompt: str, max_tokens: int) -> None:
+        words = self.backend._response_words(prompt, self.model)
+        latency = self.backend._text_latency(self.model)
+        self._prefill.append(latency * self.backend.PREFILL_SHARE)
+        self._sequences[key] = (
+            [word if index == 0 else " " + word for index, word in enumerate(words[:max_tokens])],
+            latency * (1 - self.backend.PREFILL_SHARE) / len(words),
+            "length" if len(words) > max_tokens else "stop"
+        )
+
+    def step(self) -> List[Tuple[Any, str, int, Optional[str]]]:
+        # New sequences are prefilled together, so the batch pays for the longest one
+        step_time = max(self._prefill, default=0.0)
+        self._prefill = []
+        per_word = max(seconds for _, seconds, _ in self._sequences.values())
+        time.sleep(step_time + per_word * (1 + settings.STANDIN_BATCH_STEP_OVERHEAD * (len(self._sequences) - 1)))
+
+        results = []
+        for key in list(self._sequences):
+            words, _, finish_reason = self._sequences[key]
+            text = words.pop(0)
+            results.append((key, text, 1, None if words else finish_reason))
+            if not words:
+                del self._sequences[key]
+        return results
+
+    def cancel(self, key: Any) -> None:
+        self._sequences.pop(key, None)
+
+    @property
+    def active(self) -> int:
+        return len(self._sequences)
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for when no tokenizer is at hand (about four characters per token)."""
+    return (len(text) + 3) // 4
+
+def _image_bytes(image_data: Union[str, bytes]) -> bytes:
+    return base64.b64decode(image_data) if isinstance(image_data, str) else image_data
+
+# Backends selectable with settings.INFERENCE_BACKEND
+BACKENDS = {
+    MLXCoreMLBackend.name: MLXCoreMLBackend,
+    StandInBackend.name: StandInBackend
+}
+
+def create_backend(name: Optional[str] = None) -> InferenceBackend:
+    """Instantiate the configured inference backend."""
+    name = name or settings.INFERENCE_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"INFERENCE_BACKEND must be one of: {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
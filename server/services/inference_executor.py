@@ -0,0 +1,126 @@
+"""Dedicated threads for blocking model calls."""
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from utils.logger import get_logger
+from config import settings
+
+logger = get_logger(__name__)
+
+class InferenceExecutor:
+    """Runs blocking inference on named thread pools and hands back awaitables.
+
+    MLX generation, PIL decoding and CoreML `predict` all block. Running them on
+    these pools keeps the event loop free for WebSocket traffic, dashboard
+    broadcasts and health checks while a model is busy.
+
+    Pools:
+        text: LLM generation; a single thread, since one model instance must not
+            be driven from two threads at once
+        vision: image decoding and CoreML prediction
+    """
+
+    def __init__(self, pool_sizes: Optional[Dict[str, int]] = None):
+        """
+        Initialize inference executor.
+
+        Args:
+            pool_sizes: Threads per pool (defaults: text=1, vision=settings.VISION_EXECUTOR_THREADS)
+        """
+        self.pool_sizes = pool_sizes or {
+            "text": 1,
+            "vision": settings.VISION_EXECUTOR_THREADS
+        }
+        self._executors = {
+            name: ThreadPoolExecutor(max_workers=max(1, size), thread_name_prefix=f"inference-{name}")
+            for name, size in self.pool_sizes.items()
+        }
+        self._lock = threading.Lock()  # Stats are updated from the pool threads
+        self.stats = {
+            name: {
+                "queued": 0,
+                "running": 0,
+                "completed": 0,
+                "failed": 0,
+                "total_queue_time": 0.0,
+                "total_execution_time": 0.0,
+                "max_execution_time": 0.0
+            }
+            for name in self.pool_sizes
+        }
+        logger.info(f"InferenceExecutor initialized with pools: {self.pool_sizes}")
+
+    async def run(self, pool: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Run a blocking function on a pool and await its result.
+
+        Args:
+            pool: Pool name ("text" or "vision")
+            fn: Blocking callable
+            *args: Positional arguments for fn
+            **kwargs: Keyword arguments for fn
+
+        Returns:
+            The callable's return value
+        """
+        if pool not in self._executors:
+            raise ValueError(f"Unknown inference pool: {pool}")
+        with self._lock:
+            self.stats[pool]["queued"] += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executors[pool],
+            functools.partial(self._timed_call, pool, time.time(), fn, args, kwargs)
+        )
+
+    def _timed_call(self, pool: str, submitted_at: float, fn: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+        """Execute on the pool thread and record queue and execution time."""
+        pool_stats = self.stats[pool]
+        started_at = time.time()
+        with self._lock:
+            pool_stats["queued"] -= 1
+            pool_stats["running"] += 1
+            pool_stats["total_queue_time"] += started_at - submitted_at
+        outcome = "failed"
+        try:
+            result = fn(*args, **kwargs)
+            outcome = "completed"
+            return result
+        finally:
+            duration = time.time() - started_at
+            with self._lock:
+                pool_stats[outcome] += 1
+                pool_stats["running"] -= 1
+                pool_stats["total_execution_time"] += duration
+                pool_stats["max_execution_time"] = max(pool_stats["max_execution_time"], duration)
+
+    def queue_depth(self, pool: str) -> int:
+        """Calls waiting for a thread in a pool."""
+        return self.stats[pool]["queued"]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get per-pool queue depth and execution-time metrics."""
+        result = {}
+        for name, pool_stats in self.stats.items():
+            finished = pool_stats["completed"] + pool_stats["failed"]
+            result[name] = {
+                "threads": self.pool_sizes[name],
+                "queue_depth": pool_stats["queued"],
+                "running": pool_stats["running"],
+                "completed": pool_stats["completed"],
+                "failed": pool_stats["failed"],
+                "average_queue_time": pool_stats["total_queue_time"] / finished if finished else 0.0,
+                "average_execution_time": pool_stats["total_execution_time"] / finished if finished else 0.0,
+                "max_execution_time": pool_stats["max_execution_time"]
+            }
+        return result
+
+    def shutdown(self, wait: bool = False) -> None:
+        """Stop all pools; queued calls that have not started are cancelled."""
+        for executor in self._executors.values():
+            executor.shutdown(wait=wait, cancel_futures=True)
+        logger.info("Inference executor shut down")
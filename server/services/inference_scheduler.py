@@ -0,0 +1,207 @@
+"""Priority scheduling of model calls."""
+import asyncio
+import itertools
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from services.model_manager import ModelManager
+from utils.logger import get_logger
+from config import settings
+
+logger = get_logger(__name__)
+
+# Lanes in priority order: interactive prompts first, background work last
+LANES = ("interactive", "scene", "background")
+
+class InferenceQueueFullError(Exception):
+    """Raised when a lane already holds as many waiting requests as it may."""
+
+class _InferenceRequest:
+    """A queued model call."""
+
+    __slots__ = ("lane", "call", "future", "enqueued_at")
+
+    def __init__(self, lane: str, call: Callable[[], Awaitable[Any]], future: asyncio.Future):
+        self.lane = lane
+        self.call = call
+        self.future = future
+        self.enqueued_at = time.time()
+
+class InferenceScheduler:
+    """Single entry point for text generation, ordered by priority lane.
+
+    Requests wait in bounded per-lane queues. Whenever a worker frees up it takes
+    the oldest request of the highest-priority non-empty lane, so a user question
+    never waits behind a backlog of scene summaries; it only waits for the
+    generation that is already running.
+    """
+
+    def __init__(
+        self,
+        model_manager: ModelManager,
+        concurrency: Optional[int] = None,
+        lane_capacity: Optional[Dict[str, int]] = None
+    ):
+        """
+        Initialize inference scheduler.
+
+        Args:
+            model_manager: Model manager that executes the calls
+            concurrency: Model calls allowed to run at once (defaults to settings.INFERENCE_CONCURRENCY;
+                raised to fill a batch when batching, capped at the text threads otherwise)
+            lane_capacity: Maximum waiting requests per lane (defaults from settings)
+        """
+        self.model_manager = model_manager
+        concurrency = concurrency or settings.INFERENCE_CONCURRENCY
+        if settings.LLM_BATCH_MAX_SIZE > 1:
+            # With batching, enough calls must be in flight at once to fill a batch
+            concurrency = max(concurrency, settings.LLM_BATCH_MAX_SIZE)
+        else:
+            # Without it, calls beyond the text threads would wait in the executor's FIFO, out of priority order
+            concurrency = min(concurrency, model_manager.text_workers)
+        self.concurrency = max(1, concurrency)
+        self.lane_capacity = lane_capacity or {
+            "interactive": settings.INFERENCE_INTERACTIVE_QUEUE_SIZE,
+            "scene": settings.INFERENCE_SCENE_QUEUE_SIZE,
+            "background": settings.INFERENCE_BACKGROUND_QUEUE_SIZE
+        }
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._sequence = itertools.count()
+        self._waiting = {lane: 0 for lane in LANES}
+        self._running = {lane: 0 for lane in LANES}
+        self._workers: List[asyncio.Task] = []
+        self._wait_samples: Dict[str, Deque[float]] = {lane: deque(maxlen=200) for lane in LANES}
+        self.stats = {
+            lane: {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0, "total_wait": 0.0, "max_wait": 0.0}
+            for lane in LANES
+        }
+        logger.info(f"InferenceScheduler initialized with {self.concurrency} workers")
+
+    async def start(self) -> None:
+        """Start the scheduler workers."""
+        for worker_id in range(self.concurrency):
+            self._workers.append(asyncio.create_task(self._worker(worker_id)))
+
+    async def submit(self, lane: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Queue a model call and wait for its result.
+
+        Args:
+            lane: Priority lane ("interactive", "scene" or "background")
+            call: Zero-argument coroutine function performing the model call
+
+        Returns:
+            Whatever the call returns
+
+        Raises:
+            InferenceQueueFullError: If the lane is at capacity
+        """
+        if lane not in LANES:
+            raise ValueError(f"lane must be one of: {', '.join(LANES)}")
+        if self._waiting[lane] >= self.lane_capacity[lane]:
+            self.stats[lane]["rejected"] += 1
+            raise InferenceQueueFullError(f"Inference lane '{lane}' is full ({self.lane_capacity[lane]} waiting)")
+
+        request = _InferenceRequest(lane, call, asyncio.get_running_loop().create_future())
+        self._waiting[lane] += 1
+        self.stats[lane]["submitted"] += 1
+        self._queue.put_nowait((LANES.index(lane), next(self._sequence), request))
+        return await request.future
+
+    async def process_text(
+        self,
+        prompt: str,
+        vision_context: Optional[Dict] = None,
+        lane: str = "scene",
+        **kwargs: Any
+    ) -> Dict[str, Any]:
+        """Scheduled ModelManager.process_text."""
+        return await self.submit(
+            lane,
+            lambda: self.model_manager.process_text(prompt, vision_context, **kwargs)
+        )
+
+    def queue_depth(self, lane: Optional[str] = None) -> int:
+        """Requests waiting in one lane, or in all lanes."""
+        if lane is not None:
+            return self._waiting[lane]
+        return sum(self._waiting.values())
+
+    async def _worker(self, worker_id: int) -> None:
+        """Run queued requests, highest priority first."""
+        while True:
+            try:
+                _, _, request = await self._queue.get()
+            except asyncio.CancelledError:
+                break
+
+            lane = request.lane
+            self._waiting[lane] -= 1
+            if request.future.done():  # Caller gave up while waiting
+                continue
+
+            wait = time.time() - request.enqueued_at
+            lane_stats = self.stats[lane]
+            lane_stats["total_wait"] += wait
+            lane_stats["max_wait"] = max(lane_stats["max_wait"], wait)
+            self._wait_samples[lane].append(wait)
+
+            self._running[lane] += 1
+            try:
+                result = await request.call()
+                if not request.future.done():
+                    request.future.set_result(result)
+                lane_stats["completed"] += 1
+            except asyncio.CancelledError:
+                if not request.future.done():
+                    request.future.cancel()
+                break
+            except Exception as e:
+                lane_stats["failed"] += 1
+                if not request.future.done():
+                    request.future.set_exception(e)
+            finally:
+                self._running[lane] -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get per-lane queue depth and wait-time statistics."""
+        lanes = {}
+        for lane in LANES:
+            lane_stats = self.stats[lane]
+            started = lane_stats["completed"] + lane_stats["failed"]
+            samples = sorted(self._wait_samples[lane])
+            lanes[lane] = {
+                "queue_depth": self._waiting[lane],
+                "queue_capacity": self.lane_capacity[lane],
+                "running": self._running[lane],
+                "submitted": lane_stats["submitted"],
+                "completed": lane_stats["completed"],
+                "failed": lane_stats["failed"],
+                "rejected": lane_stats["rejected"],
+                "average_wait": lane_stats["total_wait"] / started if started else 0.0,
+                "p95_wait": samples[int(0.95 * (len(samples) - 1))] if samples else 0.0,
+                "max_wait": lane_stats["max_wait"]
+            }
+        return {
+            "concurrency": self.concurrency,
+            "queue_depth": self.queue_depth(),
+            "lanes": lanes
+        }
+
+    def is_healthy(self) -> bool:
+        """Check that the scheduler workers are running."""
+        return bool(self._workers) and not all(task.done() for task in self._workers)
+
+    async def shutdown(self) -> None:
+        """Stop the workers and fail any waiting requests."""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+        while not self._queue.empty():
+            _, _, request = self._queue.get_nowait()
+            if not request.future.done():
+                request.future.cancel()
+        self._waiting = {lane: 0 for lane in LANES}
+        logger.info("Inference scheduler shut down")
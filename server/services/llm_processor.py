@@ -3,8 +3,15 @@
 from typing import Dict, Any, List, Optional
 
 from models import Detection, DetectionFrame
-from services.model_manager import ModelManager
+from services.cancellation import CancellationToken, GenerationCancelled
+from services.model_manager import ModelManager, TokenCallback
+from services.context_packer import ContextPacker
+from services.model_cascade import ModelCascade
+from services.inference_scheduler import InferenceScheduler, InferenceQueueFullError
+from services.response_cache import ResponseCache
+from services.token_budget import TokenBudgetController
 from utils.logger import get_logger
+from config import settings
 
 from utils.bbox import get_spatial_label
 
@@ -13,18 +20,27 @@ logger = get_logger(__name__)
 class LLMProcessor:
     """Handles text generation and scene understanding."""
     
-    def __init__(self, model_manager: ModelManager):
+    def __init__(self, model_manager: ModelManager, scheduler: Optional[InferenceScheduler] = None):
         """
         Initialize LLM processor.
         
         Args:
             model_manager: MLX model manager instance
+            scheduler: Priority scheduler that model calls go through (calls go
+                straight to the model manager when omitted)
         """
         self.model_manager = model_manager
+        self.scheduler = scheduler
+        self.response_cache = ResponseCache()
+        self.token_budget = TokenBudgetController(scheduler)
+        self.context_packer = ContextPacker(model_manager.count_tokens)
+        self.cascade = ModelCascade(model_manager)
         self.stats = {
             "scenes_analyzed": 0,
+            "scenes_summarized_without_llm": 0,
             "questions_answered": 0
         }
+        self.prompt_tokens = self._new_prompt_token_stats()
         logger.info("LLMProcessor initialized")
         
     async def initialize(self) -> None:
@@ -35,7 +51,10 @@ class LLMProcessor:
         self,
         frame: DetectionFrame,
         vision_analysis: Dict[str, Any],
-        context: List[Dict[str, Any]]
+        context: List[Dict[str, Any]],
+        on_token: Optional[TokenCallback] = None,
+        cancel_token: Optional[CancellationToken] = None,
+        device_id: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Analyze a scene using vision results and context.
@@ -44,20 +63,51 @@ class LLMProcessor:
             frame: Current frame with iOS detections
             vision_analysis: Results from MLX vision processing
             context: Recent historical context
+            on_token: Called with each chunk of the LLM response as it is generated
+            cancel_token: Stops the LLM call once cancelled (e.g. a newer frame superseded this one)
+            device_id: Device the frame came from (its connection when it sent no device_id);
+                cached responses are scoped to it
             
         Returns:
             Enhanced scene understanding
+
+        Raises:
+            GenerationCancelled: If cancel_token was cancelled before the analysis finished
         """
         try:
-            # Build prompt for scene analysis
-            prompt = self._build_scene_analysis_prompt(frame, vision_analysis, context)
-            
-            # Get enhanced understanding from Gemma
-            llm_result = await self.model_manager.process_text(prompt, vision_analysis)
-            
-            # Update stats
-            self.stats["scenes_analyzed"] += 1
-            
+            # Only the model's response is cached; detections and insights are rebuilt
+            # below from this frame and context, since the fingerprint is coarse
+            fingerprint = self._scene_fingerprint(vision_analysis)
+            cached_response = self.response_cache.get(fingerprint, device_id)
+            if cached_response is not None:
+                if on_token is not None:
+                    await on_token(cached_response)
+                llm_result = {"response": cached_response}
+            else:
+                # Build prompt for scene analysis
+                prompt = self._build_scene_analysis_prompt(frame, vision_analysis, context)
+                self._record_prompt_tokens("scene", prompt)
+
+                # Get enhanced understanding from Gemma
+                budget = self.token_budget.budget("scene")
+                try:
+                    llm_result = await self.cascade.generate(
+                        "scene",
+                        lambda model, emit: self._process_text(
+                            prompt, vision_analysis, lane="scene", on_token=emit, model=model,
+                            cancel_token=cancel_token, **budget
+                        ),
+                        on_token
+                    )
+                except InferenceQueueFullError as e:
+                    logger.warning(f"Skipping LLM scene analysis for frame {frame.frame_id}: {e}")
+                    return self.summarize_without_llm(frame, vision_analysis)
+                self.token_budget.record("scene", budget, llm_result)
+                self.response_cache.put(fingerprint, llm_result.get("response", ""), device_id)
+
+                # Update stats
+                self.stats["scenes_analyzed"] += 1
+
             # Return enhanced analysis
             final_scene_description = self._enhance_description(
                 ios_detections=frame.detections,
@@ -79,6 +129,9 @@ class LLMProcessor:
                 "contextual_insights": final_contextual_insights,
                 "enhanced_detections": final_enhanced_detections
             }
+
+        except GenerationCancelled:
+            raise
             
         except Exception as e:
             logger.error(f"Error analyzing scene: {e}")
@@ -88,10 +141,45 @@ class LLMProcessor:
                 "enhanced_detections": []
             }
             
+    def summarize_without_llm(
+        self,
+        frame: DetectionFrame,
+        vision_analysis: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        Build a scene result from detections and the VLM description alone.
+        
+        Used when there is no time left for an LLM call.
+        
+        Args:
+            frame: Current frame with detections
+            vision_analysis: Results from vision processing
+            
+        Returns:
+            Scene understanding in the same shape as analyze_scene
+        """
+        scene_description = self._enhance_description(
+            ios_detections=frame.detections,
+            vlm_description=vision_analysis.get("description") or "",
+            llm_response=""
+        )
+        if frame.detections and scene_description == "No meaningful scene description available.":
+            scene_description = "Detected: " + ", ".join(
+                f"{d.label} ({get_spatial_label(d.bbox)})" for d in frame.detections
+            )
+        self.stats["scenes_summarized_without_llm"] += 1
+        return {
+            "scene_description": scene_description,
+            "contextual_insights": [],
+            "enhanced_detections": self._enhance_detections(frame.detections, vision_analysis, {})
+        }
+
     async def answer_question(
         self,
         question: str,
-        context: List[Dict[str, Any]]
+        context: List[Dict[str, Any]],
+        on_token: Optional[TokenCallback] = None,
+        device_id: Optional[str] = None
     ) -> str:
         """
         Answer a user question based on provided context.
@@ -99,19 +187,64 @@ class LLMProcessor:
         Args:
             question: The user's question.
             context: Relevant historical context.
+            on_token: Called with each chunk of the answer as it is generated.
+            device_id: Device asking; cached answers are only reused for the same
+                device, whatever RESPONSE_CACHE_SCOPE says, since context is per device.
             
         Returns:
             The LLM's answer to the question.
         """
         try:
-            prompt = self._build_question_answering_prompt(question, context)
-            llm_result = await self.model_manager.process_text(prompt)
+            packed_context = self._pack_question_context(question, context)
+            # The packed context names its frames, so a new frame in it means a new answer
+            fingerprint = ResponseCache.fingerprint("question", _normalize(question), packed_context)
+            cached = self.response_cache.get(fingerprint, device_id, scope="device")
+            if cached is not None:
+                if on_token is not None:
+                    await on_token(cached)
+                return cached
+
+            prompt = self._build_question_answering_prompt(question, packed_context)
+            self._record_prompt_tokens("question", prompt)
+            budget = self.token_budget.budget("question")
+            llm_result = await self.cascade.generate(
+                "question",
+                lambda model, emit: self._process_text(prompt, lane="interactive", on_token=emit, model=model, **budget),
+                on_token
+            )
+            self.token_budget.record("question", budget, llm_result)
             self.stats["questions_answered"] += 1
+            self.response_cache.put(fingerprint, llm_result["response"], device_id, scope="device")
             return llm_result["response"]
+        except InferenceQueueFullError as e:
+            logger.warning(f"Not answering question: {e}")
+            return "I am busy with other questions right now. Please ask again in a moment."
         except Exception as e:
             logger.error(f"Error answering question: {e}")
             return "I am sorry, I could not process your question at this time."
 
+    async def _process_text(
+        self,
+        prompt: str,
+        vision_context: Optional[Dict[str, Any]] = None,
+        lane: str = "scene",
+        on_token: Optional[TokenCallback] = None,
+        **limits: Any
+    ) -> Dict[str, Any]:
+        """Run a prompt through the scheduler, or directly when there is none."""
+        if self.scheduler is not None:
+            return await self.scheduler.process_text(prompt, vision_context, lane=lane, on_token=on_token, **limits)
+        return await self.model_manager.process_text(prompt, vision_context, on_token=on_token, **limits)
+
+    @staticmethod
+    def _scene_fingerprint(vision_analysis: Dict[str, Any]) -> str:
+        """Fingerprint of the scene prompt inputs: labels with their positions and the VLM description."""
+        objects = sorted(
+            (d["label"], get_spatial_label(d["bbox"]))
+            for d in vision_analysis.get("detections", [])
+        )
+        return ResponseCache.fingerprint("scene", objects, _normalize(vision_analysis.get("description")))
+
     def _build_scene_analysis_prompt(
         self,
         frame: DetectionFrame,
@@ -121,20 +254,17 @@ class LLMProcessor:
         """Build concise prompt for LLM scene analysis, focusing on changes and key elements."""
         
         detections_for_prompt = [Detection(**d) for d in vision_analysis.get("detections", [])]
-        current_vlm_desc = vision_analysis.get("description", "").replace("VLM model not loaded.", "").strip()
+        current_vlm_desc = (vision_analysis.get("description") or "").replace("VLM model not loaded.", "").strip()
 
         prompt_parts = []
 
         # Start with a very direct instruction for the LLM
         prompt_parts.append("Analyze the current scene. Focus on key objects and any changes from the previous scene.\n")
 
-        # Add concise historical context if available
+        # Add the most recent scene descriptions that fit the history budget, filtering out placeholders
         if context:
-            # Get the most recent scene description from the context, filtering out placeholder
-            last_context_entry = context[0]
-            last_scene_desc = last_context_entry.get('vlm_description', '').replace("VLM model not loaded.", "").strip()
-            if last_scene_desc:
-                prompt_parts.append(f"Previous: {last_scene_desc}\n")
+            history, _ = self.context_packer.pack(context, _render_scene_entry, settings.SCENE_CONTEXT_TOKENS)
+            prompt_parts.append(history)
 
         # Add current VLM description if meaningful
         if current_vlm_desc:
@@ -149,10 +279,19 @@ class LLMProcessor:
         
         return "".join(prompt_parts)
         
+    def _pack_question_context(self, question: str, context: List[Dict[str, Any]]) -> str:
+        """The context entries most relevant to the question that fit the context budget, rendered."""
+        if not context:
+            return ""
+        packed, _ = self.context_packer.pack(
+            context, _render_question_entry, settings.QUESTION_CONTEXT_TOKENS, query=question
+        )
+        return packed
+
     def _build_question_answering_prompt(
         self,
         question: str,
-        context: List[Dict[str, Any]]
+        packed_context: str
     ) -> str:
         """
         Build prompt for LLM question answering.
@@ -162,16 +301,9 @@ class LLMProcessor:
             "Question: " + question + "\n\n"
         ]
 
-        if context:
+        if packed_context:
             prompt_parts.append("Context:\n")
-            for entry in context:
-                prompt_parts.append(f"- Frame ID: {entry.get('frame_id', 'N/A')}\n")
-                prompt_parts.append(f"  Timestamp: {entry.get('timestamp', 'N/A')}\n")
-                if entry.get('analysis') and entry['analysis'].get('scene_description'):
-                    prompt_parts.append(f"  Scene Description: {entry['analysis']['scene_description']}\n")
-                if entry.get('detections'):
-                    prompt_parts.append(f"  Detections: {len(entry['detections'])} objects\n")
-                prompt_parts.append("\n")
+            prompt_parts.append(packed_context)
             prompt_parts.append("\n")
 
         prompt_parts.append("Answer:")
@@ -233,11 +365,38 @@ class LLMProcessor:
             
         return enhanced
         
+    def _record_prompt_tokens(self, prompt_type: str, prompt: str) -> None:
+        stats = self.prompt_tokens[prompt_type]
+        tokens = self.model_manager.count_tokens(prompt)
+        stats["prompts"] += 1
+        stats["total_tokens"] += tokens
+        stats["max_tokens"] = max(stats["max_tokens"], tokens)
+
+    @staticmethod
+    def _new_prompt_token_stats() -> Dict[str, Dict[str, int]]:
+        return {
+            prompt_type: {"prompts": 0, "total_tokens": 0, "max_tokens": 0}
+            for prompt_type in ("scene", "question")
+        }
+
     def get_stats(self) -> Dict[str, Any]:
         """Get processing statistics."""
         return {
             "scenes_analyzed": self.stats["scenes_analyzed"],
-            "questions_answered": self.stats["questions_answered"]
+            "scenes_summarized_without_llm": self.stats["scenes_summarized_without_llm"],
+            "questions_answered": self.stats["questions_answered"],
+            "prompt_tokens": {
+                prompt_type: {
+                    "prompts": stats["prompts"],
+                    "average_tokens": stats["total_tokens"] / stats["prompts"] if stats["prompts"] else 0.0,
+                    "max_tokens": stats["max_tokens"]
+                }
+                for prompt_type, stats in self.prompt_tokens.items()
+            },
+            "context_packing": self.context_packer.get_stats(),
+            "model_cascade": self.cascade.get_stats(),
+            "response_cache": self.response_cache.get_stats(),
+            "token_budget": self.token_budget.get_stats()
         }
         
     def is_healthy(self) -> bool:
@@ -248,6 +407,33 @@ class LLMProcessor:
         """Cleanup processor resources."""
         self.stats = {
             "scenes_analyzed": 0,
+            "scenes_summarized_without_llm": 0,
             "questions_answered": 0
         }
+        self.prompt_tokens = self._new_prompt_token_stats()
+        self.response_cache.clear()
+        self.context_packer.clear()
         logger.info("LLM processor cleaned up")
+
+def _render_scene_entry(entry: Dict[str, Any]) -> str:
+    """History line of a context entry in the scene analysis prompt."""
+    description = (entry.get("vlm_description") or "").replace("VLM model not loaded.", "").strip()
+    return f"Previous: {description}\n" if description else ""
+
+def _render_question_entry(entry: Dict[str, Any]) -> str:
+    """Context block of a context entry in the question answering prompt."""
+    lines = [
+        f"- Frame ID: {entry.get('frame_id', 'N/A')}\n",
+        f"  Timestamp: {entry.get('timestamp', 'N/A')}\n"
+    ]
+    if entry.get('analysis') and entry['analysis'].get('scene_description'):
+        lines.append(f"  Scene Description: {entry['analysis']['scene_description']}\n")
+    if entry.get('detections'):
+        labels = ", ".join(d.get("label", "?") for d in entry["detections"])
+        lines.append(f"  Detections: {len(entry['detections'])} objects ({labels})\n")
+    lines.append("\n")
+    return "".join(lines)
+
+def _normalize(text: Optional[str]) -> str:
+    """Lowercase and collapse whitespace so trivially different inputs share a cache entry."""
+    return " ".join((text or "").lower().split())
@@ -0,0 +1,102 @@
+"""Routing of LLM requests between a small and a large text model."""
+import string
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from services.model_manager import ModelManager, TokenCallback
+from utils.logger import get_logger
+from config import settings
+
+logger = get_logger(__name__)
+
+# Text model each request type goes to first
+ROUTES = {"scene": "summary", "question": "main"}
+
+class ModelCascade:
+    """Sends routine requests to the summary model and escalates weak answers.
+
+    Frame summaries are the highest-volume LLM call and go to the smaller summary
+    model when one is loaded; questions go to the main model. A summary that fails
+    simple checks (empty, too short, repeating itself) is generated again on the
+    main model. While a summary can still be escalated its tokens are held back
+    and sent in one piece once it passes, so clients never see a discarded answer.
+    """
+
+    def __init__(self, model_manager: ModelManager):
+        """
+        Initialize model cascade.
+
+        Args:
+            model_manager: Model manager (or worker pool) whose loaded models decide the routes
+        """
+        self.model_manager = model_manager
+        self.stats = {
+            "routed": {"main": 0, "summary": 0},
+            "accepted": 0,
+            "escalations": {"empty": 0, "too_short": 0, "repetitive": 0}
+        }
+
+    def route(self, request_type: str) -> str:
+        """Text model a request should go to first."""
+        model = ROUTES[request_type]
+        if model == "summary" and not self.model_manager.get_model_health().get("summary"):
+            return "main"
+        return model
+
+    async def generate(
+        self,
+        request_type: str,
+        call: Callable[[str, Optional[TokenCallback]], Awaitable[Dict[str, Any]]],
+        on_token: Optional[TokenCallback] = None
+    ) -> Dict[str, Any]:
+        """
+        Generate on the routed model, escalating to the main model if the result fails the checks.
+
+        Args:
+            request_type: "scene" or "question"
+            call: Runs the prompt on a model: call(model, on_token) -> process_text result
+            on_token: Called with each chunk of the accepted response
+
+        Returns:
+            The process_text result of the model whose answer was kept
+        """
+        model = self.route(request_type)
+        self.stats["routed"][model] += 1
+        if model == "main" or not settings.CASCADE_ESCALATION:
+            return await call(model, on_token)
+
+        result = await call(model, None)
+        reason = self.check(result)
+        if reason is None:
+            self.stats["accepted"] += 1
+            if on_token is not None and result.get("response"):
+                await on_token(result["response"])
+            return result
+
+        logger.debug(f"Escalating {request_type} request to the main model ({reason})")
+        self.stats["escalations"][reason] += 1
+        self.stats["routed"]["main"] += 1
+        return await call("main", on_token)
+
+    @staticmethod
+    def check(result: Dict[str, Any]) -> Optional[str]:
+        """Reason a summary model answer should be escalated, or None if it is acceptable."""
+        words = [word.strip(string.punctuation).lower() for word in (result.get("response") or "").split()]
+        words = [word for word in words if word]
+        if not words:
+            return "empty"
+        if len(words) < settings.CASCADE_MIN_WORDS:
+            return "too_short"
+        if len(set(words)) / len(words) < settings.CASCADE_MIN_DISTINCT_RATIO:
+            return "repetitive"
+        return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get routing statistics."""
+        escalated = sum(self.stats["escalations"].values())
+        checked = self.stats["accepted"] + escalated
+        return {
+            "routed": dict(self.stats["routed"]),
+            "accepted": self.stats["accepted"],
+            "escalations": dict(self.stats["escalations"]),
+            "escalation_rate": escalated / checked if checked else 0.0
+        }
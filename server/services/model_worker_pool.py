@@ -0,0 +1,477 @@
+"""Model inference in separate worker processes."""
+import asyncio
+import base64
+import itertools
+import multiprocessing
+from multiprocessing import shared_memory
+from multiprocessing.connection import Connection
+from typing import Any, Dict, List, Optional, Union
+
+from services.cancellation import CancellationToken, GenerationCancelled
+from services.inference_backends import estimate_tokens
+from services.model_manager import TokenCallback
+from utils.logger import get_logger
+from config import settings
+
+logger = get_logger(__name__)
+
+# Reply kinds sent back by a worker: (request_id, kind, payload, worker_stats)
+RESULT = "result"
+ERROR = "error"
+CHUNK = "chunk"  # Streamed text; the final RESULT still follows
+CANCELLED = "cancelled"  # The request's generation was cancelled
+
+# Request kind asking a worker to cancel an outstanding text request: (request_id, CANCEL, reason)
+CANCEL = "cancel"
+
+class ModelWorkerError(RuntimeError):
+    """Raised when a worker process fails to start or dies with requests outstanding."""
+
+class _SharedImageSlots:
+    """Fixed pool of shared-memory buffers used to hand image bytes to the workers.
+
+    The web process writes the decoded frame bytes into a free slot and only sends
+    the slot index and length over the pipe; the worker reads them straight out of
+    the shared buffer. A slot is released once the worker has replied.
+    """
+
+    def __init__(self, count: int, slot_bytes: int):
+        self.slot_bytes = slot_bytes
+        self.blocks = [shared_memory.SharedMemory(create=True, size=slot_bytes) for _ in range(count)]
+        self._free = list(range(count))
+
+    @property
+    def names(self) -> List[str]:
+        return [block.name for block in self.blocks]
+
+    @property
+    def free(self) -> int:
+        return len(self._free)
+
+    def write(self, data: bytes) -> Optional[int]:
+        """Copy data into a free slot; None when no slot is free or the data does not fit."""
+        if len(data) > self.slot_bytes or not self._free:
+            return None
+        slot = self._free.pop()
+        self.blocks[slot].buf[:len(data)] = data
+        return slot
+
+    def release(self, slot: int) -> None:
+        self._free.append(slot)
+
+    def close(self) -> None:
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+        self._free = []
+
+class _WorkerHandle:
+    """Web-process side of one worker process."""
+
+    def __init__(self, index: int, process: multiprocessing.Process, conn: Connection):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.slots_held: Dict[int, int] = {}  # request_id -> shared-memory slot
+        self.streams: Dict[int, asyncio.Queue] = {}  # request_id -> streamed chunks, ended by None
+        self.models_loaded: Dict[str, bool] = {}
+        self.worker_stats: Dict[str, Any] = {}  # Latest executor and prompt cache stats of the worker
+        self.alive = True
+
+class ModelWorkerPool:
+    """Runs ModelManager in worker processes behind the same async interface.
+
+    Each worker process loads its own copy of the models and runs them on its own
+    inference executor, so image decoding, CoreML prediction and generation glue
+    no longer compete with the web process for the GIL. Requests go out over a
+    pipe as small tuples; image bytes travel through shared-memory slots instead
+    of being pickled (falling back to inline bytes when every slot is busy or the
+    image is larger than a slot). Requests are sent to the worker with the fewest
+    outstanding calls. Cancelling a text request's token sends a cancel message
+    after it, which the worker applies to its own token for that request.
+
+    Each worker holds a full set of models, so memory use grows with
+    MODEL_WORKER_PROCESSES.
+    """
+
+    def __init__(
+        self,
+        num_workers: Optional[int] = None,
+        shm_slots: Optional[int] = None,
+        shm_slot_bytes: Optional[int] = None
+    ):
+        """
+        Initialize model worker pool.
+
+        Args:
+            num_workers: Worker processes to start (defaults to settings.MODEL_WORKER_PROCESSES)
+            shm_slots: Shared-memory image slots (defaults to settings.MODEL_WORKER_SHM_SLOTS)
+            shm_slot_bytes: Size of each slot (defaults to settings.MODEL_WORKER_SHM_SLOT_BYTES)
+        """
+        self.num_workers = max(1, num_workers or settings.MODEL_WORKER_PROCESSES)
+        self._slot_count = shm_slots or settings.MODEL_WORKER_SHM_SLOTS
+        self._slot_bytes = shm_slot_bytes or settings.MODEL_WORKER_SHM_SLOT_BYTES
+        self._slots: Optional[_SharedImageSlots] = None
+        self._workers: List[_WorkerHandle] = []
+        self._request_ids = itertools.count(1)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.stats = {
+            "requests": 0,
+            "failed": 0,
+            "cancelled": 0,
+            "images_via_shared_memory": 0,
+            "images_inline": 0,
+            "worker_deaths": 0
+        }
+
+    async def initialize(self) -> None:
+        """Start the worker processes and wait until each has loaded its models."""
+        self._loop = asyncio.get_running_loop()
+        self._slots = _SharedImageSlots(self._slot_count, self._slot_bytes)
+        context = multiprocessing.get_context("spawn")  # MLX and CoreML are not fork-safe
+
+        for index in range(self.num_workers):
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(
+                target=_worker_main,
+                args=(child_conn, self._slots.names),
+                name=f"model-worker-{index}",
+                daemon=True
+            )
+            process.start()
+            child_conn.close()
+            worker = _WorkerHandle(index, process, parent_conn)
+            worker.pending[0] = self._loop.create_future()  # Request 0 is the startup handshake
+            self._loop.add_reader(parent_conn.fileno(), self._on_readable, worker)
+            self._workers.append(worker)
+
+        try:
+            ready = await asyncio.wait_for(
+                asyncio.gather(*(worker.pending[0] for worker in self._workers)),
+                timeout=settings.MODEL_WORKER_STARTUP_TIMEOUT
+            )
+        except Exception as e:
+            await self.cleanup()
+            raise ModelWorkerError(f"Model workers failed to start: {e}") from e
+
+        for worker, models_loaded in zip(self._workers, ready):
+            worker.models_loaded = models_loaded
+        logger.info(f"ModelWorkerPool started {self.num_workers} worker processes with {self._slot_count} shared-memory slots")
+
+    async def process_text(
+        self,
+        prompt: str,
+        vision_context: Optional[Dict] = None,
+        on_token: Optional[TokenCallback] = None,
+        max_tokens: Optional[int] = None,
+        stop_at_sentence_end: bool = False,
+        model: Optional[str] = None,
+        cancel_token: Optional[CancellationToken] = None
+    ) -> Dict[str, Any]:
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        payload = {
+            "prompt": prompt,
+            "vision_context": vision_context,
+            "stream": on_token is not None,
+            "max_tokens": max_tokens,
+            "stop_at_sentence_end": stop_at_sentence_end,
+            "model": model
+        }
+        return await self._call("text", payload, on_token=on_token, cancel_token=cancel_token)
+
+    async def process_image_for_yolo(self, image_data: Union[str, bytes]) -> List[Dict[str, Any]]:
+        return await self._call("yolo", {}, image_data)
+
+    async def process_image_for_vlm(self, image_data: Union[str, bytes], prompt: str) -> Dict[str, Any]:
+        return await self._call("vlm", {"prompt": prompt}, image_data)
+
+    async def _call(
+        self,
+        kind: str,
+        payload: Dict[str, Any],
+        image_data: Union[str, bytes, None] = None,
+        on_token: Optional[TokenCallback] = None,
+        cancel_token: Optional[CancellationToken] = None
+    ) -> Any:
+        """Send a request to the least busy worker and await its reply."""
+        worker = self._pick_worker()
+        request_id = next(self._request_ids)
+
+        if image_data is not None:
+            if isinstance(image_data, str):
+                image_data = base64.b64decode(image_data)
+            slot = self._slots.write(image_data)
+            if slot is None:
+                payload["image"] = image_data
+                self.stats["images_inline"] += 1
+            else:
+                payload["slot"] = slot
+                payload["size"] = len(image_data)
+                worker.slots_held[request_id] = slot
+                self.stats["images_via_shared_memory"] += 1
+
+        future = self._loop.create_future()
+        worker.pending[request_id] = future
+        if on_token is not None:
+            chunks: asyncio.Queue = asyncio.Queue()
+            worker.streams[request_id] = chunks
+        self.stats["requests"] += 1
+        try:
+            worker.conn.send((request_id, kind, payload))
+        except (OSError, ValueError) as e:
+            self._fail_worker(worker, e)
+        if cancel_token is not None:
+            cancel_token.on_cancel(lambda: self._send_cancel(worker, request_id, cancel_token.reason))
+        try:
+            if on_token is not None:
+                try:
+                    while (text := await chunks.get()) is not None:
+                        await on_token(text)
+                finally:
+                    if not future.done():  # on_token failed or the caller was cancelled
+                        self._send_cancel(worker, request_id, "stream closed")
+                        future.add_done_callback(lambda done: done.cancelled() or done.exception())
+            return await future
+        except GenerationCancelled:
+            self.stats["cancelled"] += 1
+            raise
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+
+    def _send_cancel(self, worker: _WorkerHandle, request_id: int, reason: str) -> None:
+        """Ask a worker to cancel a request it has not answered yet."""
+        if not worker.alive or request_id not in worker.pending:
+            return
+        try:
+            worker.conn.send((request_id, CANCEL, reason))
+        except (OSError, ValueError) as e:
+            self._fail_worker(worker, e)
+
+    def _pick_worker(self) -> _WorkerHandle:
+        alive = [worker for worker in self._workers if worker.alive]
+        if not alive:
+            raise ModelWorkerError("No model worker process is running")
+        return min(alive, key=lambda worker: len(worker.pending))
+
+    def _on_readable(self, worker: _WorkerHandle) -> None:
+        """Event-loop reader callback: resolve futures for every reply waiting on the pipe."""
+        try:
+            while worker.conn.poll():
+                request_id, kind, payload, worker_stats = worker.conn.recv()
+                if worker_stats is not None:
+                    worker.worker_stats = worker_stats
+                if kind == CHUNK:
+                    if request_id in worker.streams:
+                        worker.streams[request_id].put_nowait(payload)
+                    continue
+                stream = worker.streams.pop(request_id, None)
+                if stream is not None:
+                    stream.put_nowait(None)
+                slot = worker.slots_held.pop(request_id, None)
+                if slot is not None:
+                    self._slots.release(slot)
+                future = worker.pending.pop(request_id, None)
+                if future is None or future.done():
+                    continue
+                if kind == ERROR:
+                    future.set_exception(ModelWorkerError(payload))
+                elif kind == CANCELLED:
+                    future.set_exception(GenerationCancelled(payload))
+                else:
+                    future.set_result(payload)
+        except (EOFError, OSError) as e:
+            self._fail_worker(worker, e)
+
+    def _fail_worker(self, worker: _WorkerHandle, error: Optional[Exception]) -> None:
+        """Mark a worker dead and fail everything it still owed (error is None for an orderly stop)."""
+        if not worker.alive:
+            return
+        worker.alive = False
+        if error is not None:
+            self.stats["worker_deaths"] += 1
+            logger.error(f"Model worker {worker.index} stopped: {error!r}")
+        self._loop.remove_reader(worker.conn.fileno())
+        for slot in worker.slots_held.values():
+            self._slots.release(slot)
+        worker.slots_held.clear()
+        for stream in worker.streams.values():
+            stream.put_nowait(None)
+        worker.streams.clear()
+        for future in worker.pending.values():
+            if not future.done():
+                future.set_exception(ModelWorkerError(f"Model worker {worker.index} stopped"))
+        worker.pending.clear()
+
+    def get_executor_stats(self) -> Dict[str, Any]:
+        """Executor metrics reported by each worker with its latest reply."""
+        return {f"worker-{worker.index}": worker.worker_stats.get("executor", {}) for worker in self._workers}
+
+    def get_batch_stats(self) -> Dict[str, Any]:
+        """Batching metrics reported by each worker with its latest reply."""
+        return {f"worker-{worker.index}": worker.worker_stats.get("batching", {}) for worker in self._workers}
+
+    def get_prompt_cache_stats(self) -> Dict[str, Any]:
+        """Prompt cache metrics reported by each worker with its latest reply."""
+        return {f"worker-{worker.index}": worker.worker_stats.get("prompt_cache", {}) for worker in self._workers}
+
+    def get_text_model_stats(self) -> Dict[str, Any]:
+        """Text model latency reported by each worker with its latest reply."""
+        return {f"worker-{worker.index}": worker.worker_stats.get("text_models", {}) for worker in self._workers}
+
+    @property
+    def text_workers(self) -> int:
+        """Text generations that can run at once: one per worker process."""
+        return self.num_workers
+
+    def count_tokens(self, text: str) -> int:
+        """Estimated token count; the tokenizer lives in the worker processes."""
+        return estimate_tokens(text)
+
+    def get_model_health(self) -> Dict[str, bool]:
+        """A model counts as loaded only if every live worker has it."""
+        alive = [worker for worker in self._workers if worker.alive]
+        if not alive:
+            return {"gemma": False, "yolo": False, "vlm": False}
+        return {
+            name: all(worker.models_loaded.get(name, False) for worker in alive)
+            for name in alive[0].models_loaded
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get pool statistics."""
+        return {
+            "workers": self.num_workers,
+            "workers_alive": sum(1 for worker in self._workers if worker.alive),
+            "outstanding": {f"worker-{worker.index}": len(worker.pending) for worker in self._workers},
+            "shared_memory_slots_free": self._slots.free if self._slots else 0,
+            **self.stats
+        }
+
+    def is_healthy(self) -> bool:
+        health = self.get_model_health()
+        if not all(worker.alive and worker.process.is_alive() for worker in self._workers) or not self._workers:
+            return False
+        if settings.PROCESSING_MODE == "full":
+            return health.get("gemma", False) and health.get("yolo", False) and health.get("vlm", False)
+        return health.get("gemma", False)
+
+    async def cleanup(self) -> None:
+        """Stop the worker processes and release the shared memory."""
+        for worker in self._workers:
+            if worker.alive:
+                try:
+                    worker.conn.send(None)  # Shutdown request
+                except (OSError, ValueError):
+                    pass
+                self._fail_worker(worker, None)
+        for worker in self._workers:
+            await asyncio.to_thread(worker.process.join, 5.0)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.conn.close()
+        self._workers.clear()
+        if self._slots:
+            self._slots.close()
+            self._slots = None
+        logger.info("Model worker processes stopped")
+
+def _worker_stats(model_manager: Any) -> Dict[str, Any]:
+    """Stats a worker attaches to each reply."""
+    return {
+        "executor": model_manager.get_executor_stats(),
+        "prompt_cache": model_manager.get_prompt_cache_stats(),
+        "batching": model_manager.get_batch_stats(),
+        "text_models": model_manager.get_text_model_stats()
+    }
+
+def _worker_main(conn: Connection, slot_names: List[str]) -> None:
+    """Entry point of a worker process."""
+    asyncio.run(_serve(conn, slot_names))
+
+async def _serve(conn: Connection, slot_names: List[str]) -> None:
+    """Load the models, then answer requests from the web process until told to stop."""
+    from services.model_manager import ModelManager
+
+    blocks = [shared_memory.SharedMemory(name=name) for name in slot_names]
+    loop = asyncio.get_running_loop()
+    try:
+        model_manager = ModelManager()
+        await model_manager.initialize()
+    except Exception as e:
+        conn.send((0, ERROR, f"{type(e).__name__}: {e}", None))
+        return
+    conn.send((0, RESULT, model_manager.get_model_health(), None))
+
+    stopped = asyncio.Event()
+    tasks = set()
+    cancel_tokens: Dict[int, CancellationToken] = {}  # request_id -> token of a text request in progress
+
+    async def handle(request_id: int, kind: str, payload: Dict[str, Any]) -> None:
+        try:
+            if kind == "text":
+                on_token = None
+                if payload["stream"]:
+                    async def on_token(text: str) -> None:
+                        conn.send((request_id, CHUNK, text, None))
+                result = await model_manager.process_text(
+                    payload["prompt"],
+                    payload["vision_context"],
+                    on_token=on_token,
+                    max_tokens=payload["max_tokens"],
+                    stop_at_sentence_end=payload["stop_at_sentence_end"],
+                    model=payload["model"],
+                    cancel_token=cancel_tokens[request_id]
+                )
+            else:
+                if "slot" in payload:
+                    image = bytes(blocks[payload["slot"]].buf[:payload["size"]])
+                else:
+                    image = payload["image"]
+                if kind == "yolo":
+                    result = await model_manager.process_image_for_yolo(image)
+                else:
+                    result = await model_manager.process_image_for_vlm(image, payload["prompt"])
+            reply = (request_id, RESULT, result, _worker_stats(model_manager))
+        except GenerationCancelled as e:
+            reply = (request_id, CANCELLED, str(e), _worker_stats(model_manager))
+        except Exception as e:
+            reply = (request_id, ERROR, f"{type(e).__name__}: {e}", _worker_stats(model_manager))
+        finally:
+            cancel_tokens.pop(request_id, None)
+        try:
+            conn.send(reply)
+        except (OSError, ValueError):
+            stopped.set()
+
+    def on_readable() -> None:
+        try:
+            while conn.poll():
+                message = conn.recv()
+                if message is None:
+                    stopped.set()
+                    return
+                if message[1] == CANCEL:
+                    token = cancel_tokens.get(message[0])
+                    if token is not None:
+                        token.cancel(message[2])
+                    continue
+                if message[1] == "text":
+                    cancel_tokens[message[0]] = CancellationToken()  # Before a cancel for it can arrive
+                task = loop.create_task(handle(*message))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (EOFError, OSError):
+            stopped.set()
+
+    loop.add_reader(conn.fileno(), on_readable)
+    await stopped.wait()
+    loop.remove_reader(conn.fileno())
+    for task in list(tasks):
+        task.cancel()
+    await model_manager.cleanup()
+    for block in blocks:
+        block.close()
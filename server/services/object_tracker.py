@@ -0,0 +1,187 @@
+"""Compact store of objects tracked across frames."""
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from utils.logger import get_logger
+from config import settings
+
+logger = get_logger(__name__)
+
+class TrackedObject:
+    """One tracked object: running statistics and a fixed-size trajectory.
+
+    The trajectory is a ring buffer of the last TRACK_TRAJECTORY_LENGTH recorded
+    boxes; with a stride above 1 only every stride-th detection is recorded.
+    """
+
+    __slots__ = (
+        "label", "track_id", "first_seen", "last_seen", "detection_count",
+        "average_confidence", "_boxes", "_recorded"
+    )
+
+    def __init__(self, label: str, track_id: int, timestamp: float, trajectory_length: int):
+        self.label = label
+        self.track_id = track_id
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.detection_count = 0
+        self.average_confidence = 0.0
+        self._boxes = np.zeros((trajectory_length, 4), dtype=np.float32)
+        self._recorded = 0  # Boxes ever written to the ring buffer
+
+    def observe(self, timestamp: float, confidence: float, bbox: List[float], stride: int) -> None:
+        """Fold one detection into the object."""
+        self.last_seen = timestamp
+        self.detection_count += 1
+        self.average_confidence += (confidence - self.average_confidence) / self.detection_count
+        if (self.detection_count - 1) % stride == 0:
+            self._boxes[self._recorded % len(self._boxes)] = bbox
+            self._recorded += 1
+
+    @property
+    def trajectory(self) -> np.ndarray:
+        """Recorded boxes, oldest first."""
+        size = len(self._boxes)
+        if self._recorded <= size:
+            return self._boxes[:self._recorded].copy()
+        start = self._recorded % size
+        return np.concatenate((self._boxes[start:], self._boxes[:start]))
+
+    def to_dict(self, include_trajectory: bool = False) -> Dict[str, Any]:
+        """Plain, JSON-serializable view of the object."""
+        obj = {
+            "label": self.label,
+            "track_id": self.track_id,
+            "first_seen": self.first_seen,
+            "last_seen": self.last_seen,
+            "detection_count": self.detection_count,
+            "average_confidence": self.average_confidence
+        }
+        if include_trajectory:
+            obj["trajectory"] = self.trajectory.tolist()
+        return obj
+
+class ObjectTracker:
+    """Tracked objects keyed by "<label>_<track_id>", expired once unseen for a while.
+
+    Objects are kept in the order they were last seen: an update moves the object
+    to the end, so expiry only has to pop stale objects off the front and stops at
+    the first one still live. Per-frame cost depends on the frame's detections,
+    not on how many objects are tracked, and memory per object is fixed by the
+    trajectory length. Frame timestamps are assumed to be roughly increasing; an
+    object updated by a frame with an older timestamp expires a little late.
+    """
+
+    def __init__(
+        self,
+        ttl: Optional[float] = None,
+        trajectory_length: Optional[int] = None,
+        trajectory_stride: Optional[int] = None
+    ):
+        """
+        Initialize object tracker.
+
+        Args:
+            ttl: Seconds an object stays tracked after it was last seen (defaults to settings.TRACK_TTL)
+            trajectory_length: Boxes kept per object (defaults to settings.TRACK_TRAJECTORY_LENGTH)
+            trajectory_stride: Record every n-th detection's box (defaults to settings.TRACK_TRAJECTORY_STRIDE)
+        """
+        self.ttl = settings.TRACK_TTL if ttl is None else ttl
+        self.trajectory_length = max(1, trajectory_length or settings.TRACK_TRAJECTORY_LENGTH)
+        self.trajectory_stride = max(1, trajectory_stride or settings.TRACK_TRAJECTORY_STRIDE)
+        self._objects: "OrderedDict[str, TrackedObject]" = OrderedDict()  # Least recently seen first
+        self.version = 0  # Bumped whenever the tracked objects change, so callers can tell if a snapshot is stale
+        self.stats = {
+            "objects_created": 0,
+            "objects_expired": 0
+        }
+
+    def update(self, timestamp: float, detections: Iterable[Any]) -> List[str]:
+        """
+        Record a frame's detections and expire objects not seen within the TTL.
+
+        Args:
+            timestamp: Frame timestamp
+            detections: Frame detections; those without a track_id are ignored
+
+        Returns:
+            IDs of the objects the frame's detections updated
+        """
+        updated = []
+        for det in detections:
+            if det.track_id is None:
+                continue
+            obj_id = f"{det.label}_{det.track_id}"
+            obj = self._objects.get(obj_id)
+            if obj is None:
+                obj = TrackedObject(det.label, det.track_id, timestamp, self.trajectory_length)
+                self._objects[obj_id] = obj
+                self.stats["objects_created"] += 1
+            else:
+                self._objects.move_to_end(obj_id)
+            obj.observe(timestamp, det.confidence, det.bbox, self.trajectory_stride)
+            updated.append(obj_id)
+
+        if updated:
+            self.version += 1
+        self.expire(timestamp)
+        return updated
+
+    def expire(self, now: float) -> int:
+        """Drop objects last seen more than the TTL before now; returns how many were dropped."""
+        expired = 0
+        while self._objects:
+            obj_id, obj = next(iter(self._objects.items()))
+            if obj.last_seen >= now - self.ttl:
+                break
+            del self._objects[obj_id]
+            expired += 1
+        if expired:
+            self.version += 1
+        self.stats["objects_expired"] += expired
+        return expired
+
+    def load(self, objects: Iterable[Dict[str, Any]]) -> None:
+        """Replace the tracked objects with snapshots made by to_dict(include_trajectory=True)."""
+        self._objects.clear()
+        for snapshot in sorted(objects, key=lambda snapshot: snapshot["last_seen"]):
+            obj = TrackedObject(snapshot["label"], snapshot["track_id"], snapshot["first_seen"], self.trajectory_length)
+            obj.last_seen = snapshot["last_seen"]
+            obj.detection_count = snapshot["detection_count"]
+            obj.average_confidence = snapshot["average_confidence"]
+            trajectory = snapshot.get("trajectory", [])[-self.trajectory_length:]
+            if trajectory:
+                obj._boxes[:len(trajectory)] = trajectory
+                obj._recorded = len(trajectory)
+            self._objects[f"{obj.label}_{obj.track_id}"] = obj
+        self.version += 1
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """All tracked objects with their trajectories, least recently seen first."""
+        return [obj.to_dict(include_trajectory=True) for obj in self._objects.values()]
+
+    def get(self, obj_id: str) -> Optional[TrackedObject]:
+        return self._objects.get(obj_id)
+
+    def __len__(self) -> int:
+        return len(self._objects)
+
+    def __contains__(self, obj_id: str) -> bool:
+        return obj_id in self._objects
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get tracking statistics."""
+        return {
+            "tracked_objects": len(self._objects),
+            "trajectory_length": self.trajectory_length,
+            "trajectory_stride": self.trajectory_stride,
+            "trajectory_bytes": len(self._objects) * self.trajectory_length * 4 * 4,
+            **self.stats
+        }
+
+    def clear(self) -> None:
+        """Forget all tracked objects."""
+        self._objects.clear()
+        self.version += 1
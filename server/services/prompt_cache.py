@@ -0,0 +1,147 @@
+"""Reuse of LLM attention state across prompts that share a prefix."""
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from utils.logger import get_logger
+from config import settings
+
+logger = get_logger(__name__)
+
+try:
+    from mlx_lm.models.cache import make_prompt_cache, can_trim_prompt_cache, trim_prompt_cache
+    PROMPT_CACHE_AVAILABLE = True
+except ImportError:
+    PROMPT_CACHE_AVAILABLE = False
+
+class PromptPrefixCache:
+    """LRU store of KV caches keyed by the prompt tokens they hold.
+
+    Scene and question prompts all start with the same instruction text, so most of
+    a prompt has usually been prefilled before. `acquire` hands out the stored KV
+    cache sharing the longest token prefix with a new prompt, trimmed back to that
+    prefix, so generation only has to prefill the remaining suffix. `release` trims
+    the generated tokens off again and stores the cache under the full prompt.
+
+    A cache is owned by one generation at a time: `acquire` removes it from the
+    store. Both methods run on the single text executor thread.
+    """
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        min_prefix: Optional[int] = None
+    ):
+        """
+        Initialize prompt prefix cache.
+
+        Args:
+            max_entries: Cached prompts kept at most (defaults to settings.PROMPT_CACHE_MAX_ENTRIES)
+            max_bytes: Memory cap for all cached attention state (defaults to settings.PROMPT_CACHE_MAX_BYTES)
+            min_prefix: Shared tokens needed before an entry is taken over (defaults to
+                settings.PROMPT_CACHE_MIN_PREFIX_TOKENS); keeps unrelated prompts that only
+                share a BOS token from consuming each other's entries
+        """
+        self.max_entries = max_entries or settings.PROMPT_CACHE_MAX_ENTRIES
+        self.max_bytes = max_bytes or settings.PROMPT_CACHE_MAX_BYTES
+        self.min_prefix = settings.PROMPT_CACHE_MIN_PREFIX_TOKENS if min_prefix is None else min_prefix
+        self._entries: "OrderedDict[Tuple[int, ...], Tuple[List[Any], int]]" = OrderedDict()
+        self._bytes = 0
+        self.stats = {
+            "lookups": 0,
+            "hits": 0,
+            "tokens_reused": 0,
+            "tokens_prefilled": 0,
+            "evictions": 0
+        }
+
+    def acquire(self, model: Any, tokens: Sequence[int]) -> Tuple[List[Any], int]:
+        """
+        Get a KV cache for a prompt.
+
+        Args:
+            model: Model the cache belongs to (used to build a fresh cache on a miss)
+            tokens: Full prompt tokens
+
+        Returns:
+            (KV cache, number of leading prompt tokens it already holds)
+        """
+        self.stats["lookups"] += 1
+        best_key, best_length = None, 0
+        for key in self._entries:
+            length = _common_prefix_length(key, tokens)
+            if length > best_length:
+                best_key, best_length = key, length
+
+        # At least one token has to be left for generation to prefill
+        best_length = min(best_length, len(tokens) - 1)
+        if best_key is not None and best_length > 0 and best_length >= self.min_prefix:
+            kv_cache, size = self._entries.pop(best_key)
+            self._bytes -= size
+            surplus = len(best_key) - best_length
+            if surplus == 0 or (can_trim_prompt_cache(kv_cache) and trim_prompt_cache(kv_cache, surplus) == surplus):
+                self.stats["hits"] += 1
+                self.stats["tokens_reused"] += best_length
+                self.stats["tokens_prefilled"] += len(tokens) - best_length
+                return kv_cache, best_length
+
+        self.stats["tokens_prefilled"] += len(tokens)
+        return make_prompt_cache(model), 0
+
+    def release(self, tokens: Sequence[int], kv_cache: List[Any]) -> None:
+        """
+        Store a KV cache after generation for the prompt it was used with.
+
+        Args:
+            tokens: Full prompt tokens
+            kv_cache: Cache holding the prompt followed by the generated tokens
+        """
+        generated = kv_cache[0].offset - len(tokens) if kv_cache else 0
+        if generated > 0:
+            if not can_trim_prompt_cache(kv_cache) or trim_prompt_cache(kv_cache, generated) != generated:
+                return  # e.g. a sliding-window cache that has already wrapped around
+
+        key = tuple(tokens)
+        size = sum(getattr(layer, "nbytes", 0) for layer in kv_cache)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+        self._entries[key] = (kv_cache, size)
+        self._bytes += size
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.stats["evictions"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics."""
+        lookups = self.stats["lookups"]
+        reused = self.stats["tokens_reused"]
+        total_tokens = reused + self.stats["tokens_prefilled"]
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "lookups": lookups,
+            "hits": self.stats["hits"],
+            "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+            "tokens_reused": reused,
+            "tokens_prefilled": self.stats["tokens_prefilled"],
+            "token_reuse_rate": reused / total_tokens if total_tokens else 0.0,
+            "evictions": self.stats["evictions"]
+        }
+
+    def clear(self) -> None:
+        """Drop all cached attention state."""
+        self._entries.clear()
+        self._bytes = 0
+
+def _common_prefix_length(a: Sequence[int], b: Sequence[int]) -> int:
+    length = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        length += 1
+    return length
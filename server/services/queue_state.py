@@ -0,0 +1,145 @@
+"""Incremental view of the frame queue for dashboards."""
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from models import FrameDataMessage
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+QueueEventSink = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+class QueueStateTracker:
+    """Tracks queued and in-progress frames and publishes changes as deltas.
+
+    Each transition costs O(1) and produces one small "queue_delta" event instead of
+    a re-serialized copy of the whole queue. Dashboards apply deltas in `seq` order and
+    ask for a full snapshot when they connect or notice a gap.
+    """
+
+    def __init__(self, event_sink: Optional[QueueEventSink] = None, overflow_policy: Optional[str] = None):
+        """
+        Initialize queue state tracker.
+
+        Args:
+            event_sink: Coroutine called with (event_type, data) for every delta,
+                typically WebSocketManager.broadcast_event_to_dashboards
+            overflow_policy: Dispatcher overflow policy, reported with "added" deltas and snapshots
+        """
+        self.event_sink = event_sink
+        self.overflow_policy = overflow_policy
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._seq = 0
+        self.counts = {
+            "enqueued": 0,
+            "processing": 0
+        }
+        self.stats = {
+            "added": 0,
+            "started": 0,
+            "finished": 0
+        }
+
+    async def added(self, frame: FrameDataMessage) -> None:
+        """Record a frame entering the queue."""
+        entry = {
+            "frame_id": frame.frame_id,
+            "timestamp": frame.timestamp,
+            "device_id": frame.device_id,
+            "status": "enqueued",
+            "enqueued_at": time.time()
+        }
+        previous = self._entries.pop(frame.frame_id, None)
+        if previous is not None:
+            self.counts[previous["status"]] -= 1
+        self._entries[frame.frame_id] = entry
+        self.counts["enqueued"] += 1
+        self.stats["added"] += 1
+        await self._emit("added", entry)
+
+    async def started(self, frame_id: str) -> None:
+        """Record a worker picking up a queued frame."""
+        entry = self._entries.get(frame_id)
+        if entry is None:
+            return
+        if entry["status"] == "enqueued":
+            self.counts["enqueued"] -= 1
+            self.counts["processing"] += 1
+        entry["status"] = "processing"
+        entry["started_at"] = time.time()
+        self.stats["started"] += 1
+        await self._emit("started", entry)
+
+    async def finished(self, frame_id: str, outcome: str = "processed") -> None:
+        """
+        Record a frame leaving the queue.
+
+        Args:
+            frame_id: Frame identifier
+            outcome: Why it left, e.g. "processed", "failed", "dropped" or "superseded"
+        """
+        entry = self._entries.pop(frame_id, None)
+        if entry is None:
+            return
+        self.counts[entry["status"]] -= 1
+        self.stats["finished"] += 1
+        await self._emit("finished", {
+            "frame_id": frame_id,
+            "device_id": entry["device_id"],
+            "status": outcome
+        })
+
+    async def _emit(self, op: str, entry: Dict[str, Any]) -> None:
+        """Publish one delta event."""
+        self._seq += 1
+        if not self.event_sink:
+            return
+        delta = {
+            "seq": self._seq,
+            "op": op,
+            "frame_id": entry["frame_id"],
+            "device_id": entry.get("device_id"),
+            "status": entry["status"],
+            "queue_size": self.counts["enqueued"],
+            "in_progress": self.counts["processing"]
+        }
+        if op == "added":
+            delta["overflow_policy"] = self.overflow_policy
+        await self.event_sink("queue_delta", delta)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Full queue state; deltas with a higher `seq` apply on top of it."""
+        return {
+            "seq": self._seq,
+            "overflow_policy": self.overflow_policy,
+            "queue_size": self.counts["enqueued"],
+            "in_progress": self.counts["processing"],
+            "queue_contents": [
+                {
+                    "frame_id": entry["frame_id"],
+                    "timestamp": entry["timestamp"],
+                    "device_id": entry["device_id"],
+                    "status": entry["status"]
+                }
+                for entry in self._entries.values()
+            ]
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get tracker statistics."""
+        return {
+            "queue_size": self.counts["enqueued"],
+            "in_progress": self.counts["processing"],
+            "frames_added": self.stats["added"],
+            "frames_started": self.stats["started"],
+            "frames_finished": self.stats["finished"]
+        }
+
+    def clear(self) -> None:
+        """Forget all tracked frames."""
+        self._entries.clear()
+        self.counts = {
+            "enqueued": 0,
+            "processing": 0
+        }
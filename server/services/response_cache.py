@@ -0,0 +1,116 @@
+"""Cache of LLM results keyed by normalized prompt inputs."""
+import copy
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from utils.logger import get_logger
+from config import settings
+
+logger = get_logger(__name__)
+
+SCOPES = ("device", "global")
+
+class ResponseCache:
+    """Size-bounded LRU cache with a TTL for LLM results.
+
+    Entries are keyed by a fingerprint of the normalized prompt inputs. With scope
+    "device" each device only sees its own entries; with scope "global" all devices
+    share them. Expired entries are dropped when they are looked up, and the least
+    recently used entry is evicted once the cache is full.
+    """
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        ttl: Optional[float] = None,
+        scope: Optional[str] = None
+    ):
+        """
+        Initialize response cache.
+
+        Args:
+            max_entries: Maximum cached results (0 disables caching)
+            ttl: Seconds a result stays valid
+            scope: "device" or "global"
+        """
+        self.max_entries = settings.RESPONSE_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.ttl = settings.RESPONSE_CACHE_TTL if ttl is None else ttl
+        self.scope = scope or settings.RESPONSE_CACHE_SCOPE
+        if self.scope not in SCOPES:
+            raise ValueError(f"scope must be one of: {', '.join(SCOPES)}")
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Any]]" = OrderedDict()
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "evictions": 0
+        }
+
+    @staticmethod
+    def fingerprint(*parts: Any) -> str:
+        """Stable digest of JSON-serializable prompt inputs."""
+        canonical = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, fingerprint: str, device_id: Optional[str] = None, scope: Optional[str] = None) -> Optional[Any]:
+        """
+        Look up a cached result.
+
+        Args:
+            fingerprint: Fingerprint of the prompt inputs
+            device_id: Device asking (ignored with scope "global")
+            scope: Overrides the cache's scope for this entry; pass the same to put
+
+        Returns:
+            A copy of the cached result, or None
+        """
+        if self.max_entries <= 0:
+            return None
+        key = self._key(fingerprint, device_id, scope)
+        entry = self._entries.get(key)
+        if entry is not None and time.time() - entry[0] > self.ttl:
+            del self._entries[key]
+            self.stats["expired"] += 1
+            entry = None
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return copy.deepcopy(entry[1])
+
+    def put(self, fingerprint: str, value: Any, device_id: Optional[str] = None, scope: Optional[str] = None) -> None:
+        """Store a result, evicting the least recently used entries beyond the size bound."""
+        if self.max_entries <= 0:
+            return
+        key = self._key(fingerprint, device_id, scope)
+        self._entries[key] = (time.time(), copy.deepcopy(value))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _key(self, fingerprint: str, device_id: Optional[str], scope: Optional[str] = None) -> Tuple[str, str]:
+        return ((device_id or "") if (scope or self.scope) == "device" else "*", fingerprint)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics."""
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "scope": self.scope,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.stats["hits"],
+            "misses": self.stats["misses"],
+            "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+            "expired": self.stats["expired"],
+            "evictions": self.stats["evictions"]
+        }
+
+    def clear(self) -> None:
+        """Drop all cached results."""
+        self._entries.clear()
@@ -0,0 +1,175 @@
+"""Change detection that decides whether a frame needs a fresh LLM scene analysis."""
+import copy
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from utils.logger import get_logger
+from config import settings
+
+logger = get_logger(__name__)
+
+class _SceneState:
+    """What the gate remembers about the last analyzed frame of a device."""
+
+    __slots__ = ("labels", "track_ids", "boxes", "description_tokens", "result", "analyzed_at", "reuse_count")
+
+    def __init__(self, vision_analysis: Dict[str, Any], result: Dict[str, Any]):
+        detections = vision_analysis.get("detections", [])
+        self.labels = Counter(d["label"] for d in detections)
+        self.track_ids = _track_ids(detections)
+        self.boxes = _boxes_by_key(detections)
+        self.description_tokens = _tokens(vision_analysis.get("description"))
+        self.result = result
+        self.analyzed_at = time.time()
+        self.reuse_count = 0
+
+class SceneChangeGate:
+    """Skips LLM scene analysis when a frame looks the same as the last analyzed one.
+
+    A frame is compared with the last frame of the same device that actually went
+    to the LLM. Four signals are scored between 0 (identical) and 1 (completely
+    different): label multiset, track IDs, bounding-box movement and VLM description
+    wording. If the largest of them stays below the threshold, the previous
+    AnalysisResult is reused. A reused result is refreshed anyway after
+    SCENE_CHANGE_MAX_REUSE frames or SCENE_CHANGE_MAX_AGE seconds.
+    """
+
+    def __init__(
+        self,
+        threshold: Optional[float] = None,
+        max_reuse: Optional[int] = None,
+        max_age: Optional[float] = None
+    ):
+        """
+        Initialize scene change gate.
+
+        Args:
+            threshold: Change score below which the previous result is reused (0 disables the gate)
+            max_reuse: Consecutive reuses allowed before forcing a new analysis
+            max_age: Seconds after which a cached analysis is no longer reused
+        """
+        self.threshold = settings.SCENE_CHANGE_THRESHOLD if threshold is None else threshold
+        self.max_reuse = settings.SCENE_CHANGE_MAX_REUSE if max_reuse is None else max_reuse
+        self.max_age = settings.SCENE_CHANGE_MAX_AGE if max_age is None else max_age
+        self._states: Dict[str, _SceneState] = {}
+        self.stats = {
+            "frames_checked": 0,
+            "analyses_reused": 0,
+            "analyses_requested": 0
+        }
+
+    def check(self, device_key: str, vision_analysis: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], float]:
+        """
+        Compare a frame with the device's last analyzed frame.
+
+        Args:
+            device_key: Device whose history to compare against
+            vision_analysis: Vision results for the current frame
+
+        Returns:
+            (reusable result or None, change score)
+        """
+        self.stats["frames_checked"] += 1
+        state = self._states.get(device_key)
+        if state is None or self.threshold <= 0:
+            self.stats["analyses_requested"] += 1
+            return None, 1.0
+
+        score = self.change_score(state, vision_analysis)
+        stale = (
+            state.reuse_count >= self.max_reuse or
+            time.time() - state.analyzed_at > self.max_age
+        )
+        if score >= self.threshold or stale:
+            self.stats["analyses_requested"] += 1
+            return None, score
+
+        state.reuse_count += 1
+        self.stats["analyses_reused"] += 1
+        return copy.deepcopy(state.result), score
+
+    def record(self, device_key: str, vision_analysis: Dict[str, Any], result: Dict[str, Any]) -> None:
+        """Remember a freshly analyzed frame as the device's new reference."""
+        self._states[device_key] = _SceneState(vision_analysis, copy.deepcopy(result))
+
+    def forget(self, device_key: str) -> None:
+        """Drop the reference frame of a device."""
+        self._states.pop(device_key, None)
+
+    @staticmethod
+    def change_score(state: _SceneState, vision_analysis: Dict[str, Any]) -> float:
+        """Largest of the label, track, movement and description change scores."""
+        detections = vision_analysis.get("detections", [])
+
+        labels = Counter(d["label"] for d in detections)
+        label_change = _multiset_distance(state.labels, labels)
+
+        track_ids = _track_ids(detections)
+        track_change = _set_distance(state.track_ids, track_ids)
+
+        boxes = _boxes_by_key(detections)
+        movement = 0.0
+        for key, bbox in boxes.items():
+            previous = state.boxes.get(key)
+            if previous is not None:
+                movement = max(movement, max(abs(a - b) for a, b in zip(previous, bbox)))
+
+        description_change = _set_distance(
+            state.description_tokens,
+            _tokens(vision_analysis.get("description"))
+        )
+
+        return max(label_change, track_change, min(1.0, movement), description_change)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get gate statistics."""
+        checked = self.stats["frames_checked"]
+        return {
+            "threshold": self.threshold,
+            "devices_tracked": len(self._states),
+            "frames_checked": checked,
+            "analyses_reused": self.stats["analyses_reused"],
+            "analyses_requested": self.stats["analyses_requested"],
+            "reuse_rate": self.stats["analyses_reused"] / checked if checked else 0.0
+        }
+
+    def clear(self) -> None:
+        """Forget all reference frames."""
+        self._states.clear()
+
+def _tokens(text: Optional[str]) -> Set[str]:
+    """Lowercased word set of a description."""
+    if not text:
+        return set()
+    return {word.strip(".,;:!?\"'()") for word in text.lower().split()} - {""}
+
+def _track_ids(detections: List[Dict[str, Any]]) -> Set[Tuple[str, int]]:
+    return {(d["label"], d["track_id"]) for d in detections if d.get("track_id") is not None}
+
+def _boxes_by_key(detections: List[Dict[str, Any]]) -> Dict[Tuple[str, Any], List[float]]:
+    """Boxes keyed by track ID, or by label and position in the list for untracked detections."""
+    boxes: Dict[Tuple[str, Any], List[float]] = {}
+    untracked: Counter = Counter()
+    for d in detections:
+        if d.get("track_id") is not None:
+            key = (d["label"], d["track_id"])
+        else:
+            key = (d["label"], f"#{untracked[d['label']]}")
+            untracked[d["label"]] += 1
+        boxes[key] = d["bbox"]
+    return boxes
+
+def _set_distance(a: Set[Any], b: Set[Any]) -> float:
+    """1 - Jaccard similarity; two empty sets are identical."""
+    union = a | b
+    if not union:
+        return 0.0
+    return 1.0 - len(a & b) / len(union)
+
+def _multiset_distance(a: Counter, b: Counter) -> float:
+    """1 - weighted Jaccard similarity of two label counts."""
+    union = sum((a | b).values())
+    if not union:
+        return 0.0
+    return 1.0 - sum((a & b).values()) / union
@@ -0,0 +1,101 @@
+"""Per-request generation budgets for the language model."""
+from typing import Any, Dict, Optional
+
+from services.inference_scheduler import InferenceScheduler
+from utils.logger import get_logger
+from config import settings
+
+logger = get_logger(__name__)
+
+class TokenBudgetController:
+    """Chooses max_tokens and stop conditions for each kind of LLM request.
+
+    Scene summaries get a small budget and stop at the end of their first sentence;
+    questions get a larger one. While requests pile up in the inference scheduler,
+    every budget shrinks linearly with queue depth, down to TOKEN_BUDGET_MIN_FACTOR
+    of its base at TOKEN_BUDGET_QUEUE_DEPTH waiting requests, so the backlog drains
+    faster. The tokens each request actually generated are recorded to show how
+    much of its budget it used and how often it was cut off.
+    """
+
+    def __init__(self, scheduler: Optional[InferenceScheduler] = None):
+        """
+        Initialize token budget controller.
+
+        Args:
+            scheduler: Scheduler whose queue depth tightens budgets (budgets stay at
+                their base when omitted)
+        """
+        self.scheduler = scheduler
+        self.base_budgets = {
+            "scene": settings.SCENE_MAX_TOKENS,
+            "question": settings.QUESTION_MAX_TOKENS
+        }
+        self.stop_at_sentence_end = {"scene": True, "question": False}
+        self.stats = {
+            request_type: {
+                "requests": 0,
+                "tokens_generated": 0,
+                "tokens_budgeted": 0,
+                "truncated": 0,
+                "stopped_at_sentence_end": 0
+            }
+            for request_type in self.base_budgets
+        }
+
+    def budget(self, request_type: str) -> Dict[str, Any]:
+        """
+        Get generation limits for a request.
+
+        Args:
+            request_type: "scene" or "question"
+
+        Returns:
+            Keyword arguments for process_text: max_tokens and stop_at_sentence_end
+        """
+        return {
+            "max_tokens": max(settings.TOKEN_BUDGET_FLOOR, int(self.base_budgets[request_type] * self.load_factor())),
+            "stop_at_sentence_end": self.stop_at_sentence_end[request_type]
+        }
+
+    def load_factor(self) -> float:
+        """Share of the base budgets granted at the current queue depth."""
+        if self.scheduler is None:
+            return 1.0
+        min_factor = settings.TOKEN_BUDGET_MIN_FACTOR
+        pressure = min(1.0, self.scheduler.queue_depth() / max(1, settings.TOKEN_BUDGET_QUEUE_DEPTH))
+        return 1.0 - (1.0 - min_factor) * pressure
+
+    def record(self, request_type: str, budget: Dict[str, Any], result: Dict[str, Any]) -> None:
+        """
+        Record how much of its budget a request used.
+
+        Args:
+            request_type: "scene" or "question"
+            budget: Limits the request was given (from budget())
+            result: process_text result
+        """
+        stats = self.stats[request_type]
+        stats["requests"] += 1
+        stats["tokens_generated"] += result.get("tokens_generated", 0)
+        stats["tokens_budgeted"] += budget["max_tokens"]
+        if result.get("finish_reason") == "length":
+            stats["truncated"] += 1
+        elif result.get("finish_reason") == "sentence_end":
+            stats["stopped_at_sentence_end"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get budget statistics."""
+        stats = {"load_factor": self.load_factor()}
+        for request_type, type_stats in self.stats.items():
+            requests = type_stats["requests"]
+            budgeted = type_stats["tokens_budgeted"]
+            stats[request_type] = {
+                "base_budget": self.base_budgets[request_type],
+                "requests": requests,
+                "average_tokens": type_stats["tokens_generated"] / requests if requests else 0.0,
+                "budget_utilization": type_stats["tokens_generated"] / budgeted if budgeted else 0.0,
+                "truncated": type_stats["truncated"],
+                "stopped_at_sentence_end": type_stats["stopped_at_sentence_end"]
+            }
+        return stats
@@ -23,30 +23,9 @@ class VisionProcessor:
         
     async def analyze_frame(self, frame: FrameDataMessage) -> Dict[str, Any]:
         try:
-            detections: List[Detection] = []
-            vlm_description: Optional[str] = None
-            vlm_confidence: Optional[float] = None
-
             if settings.PROCESSING_MODE == "full":
-                if not frame.image_data:
-                    raise ValueError("Image data is required for full processing mode.")
-                
-                # Simulate YOLO processing delay
-                await asyncio.sleep(0.1)
-                yolo_results = await self.model_manager.process_image_for_yolo(frame.image_data)
-                detections = [Detection(**d) for d in yolo_results]
-
-                # The prompt for VLM is now dynamic and based on the YOLO detections
-                vlm_prompt = self._build_vlm_prompt(detections)
-                
-                # Simulate VLM processing delay
-                await asyncio.sleep(1.0)
-                vlm_results = await self.model_manager.process_image_for_vlm(frame.image_data, vlm_prompt)
-                vlm_description = vlm_results.get("description")
-                
-
-                logger.info(f"Server-side YOLO Detections Count: {len(detections)}")
-                logger.info(f"Server-side VLM Description: {vlm_description}")
+                detections = await self.detect_objects(frame)
+                vlm_description = await self.describe_scene(frame, detections)
 
             else: # split mode
                 detections = frame.detections or []
@@ -55,34 +34,74 @@ class VisionProcessor:
                 logger.info(f"Received iOS YOLO Detections Count: {len(detections)}")
                 logger.info(f"Received iOS VLM Description: {vlm_description}")
             
-            detection_info = [f"{d.label} ({d.confidence:.2f})" for d in detections]
-            logger.debug(f"Detections: {', '.join(detection_info)}")
-            
-            analysis = {
-                "description": vlm_description,
-                "detections": [self._enhance_detection(d) for d in detections],
-                "scene_features": [],
-                "ios_frame_summary": {
-                    "image_data": frame.image_data
-                },
-                "error": None
-            }
-                
-            self.stats["frames_processed"] += 1
-            if detections:
-                self.stats["total_detections"] += len(detections)
-                
-            logger.info(f"Vision analysis complete for frame {frame.frame_id}. Detections count: {len(detections)}. VLM Description: {vlm_description}")
-            return analysis
+            return self.build_analysis(frame, detections, vlm_description)
             
         except Exception as e:
             logger.error(f"Error analyzing frame {frame.frame_id}: {e}")
-            return {
-                "description": "Error processing frame",
-                "detections": [],
-                "scene_features": [],
-                "error": str(e)
-            }
+            return self.build_error_analysis(e)
+
+    async def detect_objects(self, frame: FrameDataMessage) -> List[Detection]:
+        """Run server-side YOLO detection (full mode)."""
+        if not frame.image_data:
+            raise ValueError("Image data is required for full processing mode.")
+        
+        # Simulate YOLO processing delay
+        await asyncio.sleep(0.1)
+        yolo_results = await self.model_manager.process_image_for_yolo(frame.image_data)
+        detections = [Detection(**d) for d in yolo_results]
+        logger.info(f"Server-side YOLO Detections Count: {len(detections)}")
+        return detections
+
+    async def describe_scene(self, frame: FrameDataMessage, detections: List[Detection]) -> Optional[str]:
+        """Run server-side VLM captioning (full mode), prompted with the YOLO detections."""
+        if not frame.image_data:
+            raise ValueError("Image data is required for full processing mode.")
+
+        # The prompt for VLM is now dynamic and based on the YOLO detections
+        vlm_prompt = self._build_vlm_prompt(detections)
+        
+        # Simulate VLM processing delay
+        await asyncio.sleep(1.0)
+        vlm_results = await self.model_manager.process_image_for_vlm(frame.image_data, vlm_prompt)
+        vlm_description = vlm_results.get("description")
+        logger.info(f"Server-side VLM Description: {vlm_description}")
+        return vlm_description
+
+    def build_analysis(
+        self,
+        frame: FrameDataMessage,
+        detections: List[Detection],
+        vlm_description: Optional[str]
+    ) -> Dict[str, Any]:
+        """Assemble the vision analysis dict and update stats."""
+        detection_info = [f"{d.label} ({d.confidence:.2f})" for d in detections]
+        logger.debug(f"Detections: {', '.join(detection_info)}")
+        
+        analysis = {
+            "description": vlm_description,
+            "detections": [self._enhance_detection(d) for d in detections],
+            "scene_features": [],
+            "ios_frame_summary": {
+                "image_data": frame.image_data
+            },
+            "error": None
+        }
+            
+        self.stats["frames_processed"] += 1
+        if detections:
+            self.stats["total_detections"] += len(detections)
+            
+        logger.info(f"Vision analysis complete for frame {frame.frame_id}. Detections count: {len(detections)}. VLM Description: {vlm_description}")
+        return analysis
+
+    def build_error_analysis(self, error: Exception) -> Dict[str, Any]:
+        """Analysis dict returned when a frame cannot be analyzed."""
+        return {
+            "description": "Error processing frame",
+            "detections": [],
+            "scene_features": [],
+            "error": str(error)
+        }
 
     def _build_vlm_prompt(self, detections: List[Detection]) -> str:
         """Builds a concise prompt for the VLM based on YOLO detections."""
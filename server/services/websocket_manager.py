@@ -49,12 +49,13 @@ class WebSocketManager:
         Args:
             client_id: Client to remove
         """
-        if client_id in self.ios_clients:
+        # Pop before awaiting close so concurrent senders cannot remove the same client twice
+        websocket = self.ios_clients.pop(client_id, None)
+        if websocket is not None:
             try:
-                await self.ios_clients[client_id].close()
+                await websocket.close()
             except:
                 pass
-            del self.ios_clients[client_id]
             # self.active_connections.discard(client_id)
             if self.stats["active_ios_clients"] > 0: # Ensure it doesn't go negative
                 self.stats["active_ios_clients"] -= 1
@@ -75,17 +76,17 @@ class WebSocketManager:
         """
         Remove dashboard client connection.
         """
-        if client_id in self.dashboard_clients:
+        # Pop before awaiting close so concurrent broadcasts cannot remove the same client twice
+        websocket = self.dashboard_clients.pop(client_id, None)
+        if websocket is not None:
             try:
                 # Check if connection is still open before trying to close
-                websocket = self.dashboard_clients[client_id]
                 if websocket.client_state.name != 'DISCONNECTED':
                     await websocket.close()
             except Exception as e:
                 # Log but don't raise - connection might already be closed
                 logger.debug(f"Error closing dashboard client {client_id}: {e}")
             
-            del self.dashboard_clients[client_id]
             if self.stats["active_dashboard_clients"] > 0:
                 self.stats["active_dashboard_clients"] -= 1
             self.stats["active_clients"] = self.stats["active_ios_clients"] + self.stats["active_dashboard_clients"]
@@ -177,7 +178,7 @@ class WebSocketManager:
         }
         
         disconnected = []
-        for client_id in self.ios_clients:
+        for client_id in list(self.ios_clients):
             try:
                 await self.send_to_ios_client(client_id, error_msg)
             except:
@@ -192,7 +193,7 @@ class WebSocketManager:
         Broadcast message to all connected dashboard clients.
         """
         disconnected_dashboards = []
-        for client_id, websocket in self.dashboard_clients.items():
+        for client_id, websocket in list(self.dashboard_clients.items()):
             try:
                 await websocket.send_json(message)
             except WebSocketDisconnect:
@@ -0,0 +1,141 @@
+"""On-disk context log: segments, lookups, compaction and restore."""
+import os
+
+from services.context_log import INDEX_DTYPE, ContextLog
+from services.context_memory import ContextMemory
+from models import Detection, DetectionFrame
+
+def frame(frame_id, timestamp, labels=("cup", "person")):
+    return DetectionFrame(
+        frame_id=frame_id,
+        timestamp=timestamp,
+        image_data="aGVsbG8=",
+        detections=[Detection(label=label, confidence=0.8, bbox=[0.1, 0.2, 0.4, 0.5], track_id=i) for i, label in enumerate(labels)]
+    )
+
+def fill(memory, count, device_id="phone", start=0):
+    for i in range(start, start + count):
+        memory.add_frame(frame(f"f{i}", 100.0 + i * 0.1), device_id)
+        if i % 2 == 0:
+            memory.add_analysis(f"f{i}", {"scene_description": f"scene {i}", "contextual_insights": ["working"]}, device_id)
+
+def test_records_are_written_only_on_flush(tmp_path):
+    log = ContextLog(str(tmp_path), segment_bytes=1 << 20, max_segments=4)
+    log.append("analysis", {"device": "phone", "frame_id": "f1", "analysis": {"scene_description": "desk"}})
+
+    assert log.tail(10) == []
+    assert log.flush() == 1
+    assert log.tail(10) == [("analysis", {"device": "phone", "frame_id": "f1", "analysis": {"scene_description": "desk"}})]
+    log.close()
+
+def test_frames_are_stored_without_images(tmp_path):
+    memory = ContextMemory(max_frames=10, log=ContextLog(str(tmp_path)))
+    memory.add_frame(frame("f1", 1.0), "phone")
+    memory.log.flush()
+
+    [(kind, record)] = memory.log.tail(1)
+    assert kind == "frame"
+    assert record["device"] == "phone"
+    assert record["frame"]["image_data"] is None
+    assert [d["label"] for d in record["frame"]["detections"]] == ["cup", "person"]
+    memory.close()
+
+def test_find_and_since_use_the_index(tmp_path):
+    log = ContextLog(str(tmp_path), segment_bytes=200, max_segments=100)
+    for i in range(20):
+        log.append("analysis", {"device": "phone", "frame_id": f"f{i}", "analysis": {"n": i}})
+        log.flush()
+    cutoff = log._load_index(log._segments()[-1])["logged_at"][-1]
+
+    assert len(log._segments()) > 1
+    assert [record["analysis"]["n"] for _, record in log.find("f7")] == [7]
+    assert log.find("missing") == []
+    assert [record["analysis"]["n"] for _, record in log.since(cutoff)][-1] == 19
+    log.close()
+
+def test_tail_spans_segments_and_stops_at_the_requested_frames(tmp_path):
+    memory = ContextMemory(max_frames=100, log=ContextLog(str(tmp_path), segment_bytes=1024, max_segments=100))
+    fill(memory, 30)
+    memory.log.flush()
+
+    records = memory.log.tail(12)
+    frames = [record["frame_id"] for kind, record in records if kind == "frame"]
+    assert len(memory.log._segments()) > 2
+    assert frames == [f"f{i}" for i in range(18, 30)]
+    memory.close()
+
+def test_compaction_keeps_newest_segments(tmp_path):
+    log = ContextLog(str(tmp_path), segment_bytes=100, max_segments=3)
+    for i in range(30):
+        log.append("analysis", {"device": "phone", "frame_id": f"f{i}", "analysis": {"text": "x" * 50}})
+    log.flush()
+    segments = log._segments()
+
+    deleted = log.compact()
+
+    assert deleted == len(segments) - 3
+    assert log._segments() == segments[-3:]
+    assert sorted(os.listdir(tmp_path)) == sorted(f"{n:08d}.{suffix}" for n in segments[-3:] for suffix in ("log", "idx"))
+    log.close()
+
+def test_partial_writes_are_ignored(tmp_path):
+    log = ContextLog(str(tmp_path))
+    log.append("analysis", {"device": "phone", "frame_id": "f1", "analysis": {}})
+    log.flush()
+    log.close()
+    sequence = log._segments()[-1]
+    # A crash mid-write leaves a partial record and a partial index row
+    with open(log._path(sequence, "log"), "ab") as data:
+        data.write(b'{"device": "pho')
+    with open(log._path(sequence, "idx"), "ab") as index:
+        index.write(b"\x00" * (INDEX_DTYPE.itemsize // 2))
+
+    assert [record["frame_id"] for _, record in ContextLog(str(tmp_path)).tail(10)] == ["f1"]
+
+def test_restore_rebuilds_window_analyses_and_objects(tmp_path):
+    memory = ContextMemory(max_frames=100, log=ContextLog(str(tmp_path), segment_bytes=4096))
+    fill(memory, 40, "phone-a")
+    fill(memory, 10, "phone-b", start=100)
+    memory.snapshot_objects()
+    before = {
+        device_id: (
+            memory.get_recent_context("none", limit=5, device_id=device_id),
+            memory.shard(device_id).object_tracker.snapshot()
+        )
+        for device_id in ("phone-a", "phone-b")
+    }
+    memory.close()
+
+    restored = ContextMemory(max_frames=100, log=ContextLog(str(tmp_path)))
+    result = restored.restore(frames=60)
+
+    assert result["devices"] == 2
+    for device_id, (context, objects) in before.items():
+        after = restored.get_recent_context("none", limit=5, device_id=device_id)
+        assert [e["frame_id"] for e in after] == [e["frame_id"] for e in context]
+        assert [e["analysis"] for e in after] == [e["analysis"] for e in context]
+        assert restored.shard(device_id).object_tracker.snapshot() == objects
+    assert restored.get_image("f39", "phone-a") is None  # Images are not logged
+    restored.close()
+
+def test_restore_does_not_log_replayed_records(tmp_path):
+    memory = ContextMemory(max_frames=100, log=ContextLog(str(tmp_path)))
+    fill(memory, 5)
+    memory.close()
+
+    restored = ContextMemory(max_frames=100, log=ContextLog(str(tmp_path)))
+    restored.restore()
+
+    assert restored.log.stats["appended"] == 0
+    assert restored.snapshot_objects() == 0
+    restored.close()
+
+def test_objects_are_only_snapshot_when_changed(tmp_path):
+    memory = ContextMemory(max_frames=100, log=ContextLog(str(tmp_path)))
+    fill(memory, 3)
+
+    assert memory.snapshot_objects() == 1
+    assert memory.snapshot_objects() == 0
+    memory.add_frame(frame("f9", 200.0), "phone")
+    assert memory.snapshot_objects() == 1
+    memory.close()
@@ -0,0 +1,88 @@
+"""Per-device context memory: frames, analyses and their bounds."""
+from services import context_memory as context_memory_module
+from services.context_memory import ContextMemory, DEFAULT_DEVICE
+from models import Detection, DetectionFrame
+
+def frame(frame_id, timestamp, labels=("cup",), device_id=None):
+    return DetectionFrame(
+        frame_id=frame_id,
+        timestamp=timestamp,
+        device_id=device_id,
+        detections=[Detection(label=label, confidence=0.9, bbox=[0.1, 0.1, 0.3, 0.3], track_id=i) for i, label in enumerate(labels)]
+    )
+
+def test_analysis_is_added_to_its_context_entry():
+    memory = ContextMemory(max_frames=10)
+    memory.add_frame(frame("f1", 1.0), "phone")
+    memory.add_analysis("f1", {"scene_description": "A cup on a desk.", "contextual_insights": ["working"]}, "phone")
+
+    [entry] = memory.get_recent_context("other", device_id="phone")
+    assert entry["analysis"]["scene_description"] == "A cup on a desk."
+    assert entry["ongoing_activities"] == ["working"]
+
+def test_devices_are_kept_apart():
+    memory = ContextMemory(max_frames=10)
+    memory.add_frame(frame("a1", 1.0, ("cup",)), "phone-a")
+    memory.add_frame(frame("b1", 2.0, ("dog",)), "phone-b")
+
+    assert [e["frame_id"] for e in memory.get_recent_context("x", device_id="phone-a")] == ["a1"]
+    assert memory.seen_labels("phone-b") == {"dog"}
+    assert [e["frame_id"] for e in memory.get_recent_context("x")] == ["a1", "b1"]
+    assert memory.latest_frame().frame_id == "b1"
+
+def test_frames_without_device_go_to_default_shard():
+    memory = ContextMemory(max_frames=10)
+    memory.add_frame(frame("f1", 1.0))
+
+    assert memory.shard(DEFAULT_DEVICE) is not None
+
+def test_analysis_leaves_with_its_frame():
+    memory = ContextMemory(max_frames=3)
+    for i in range(5):
+        memory.add_frame(frame(f"f{i}", float(i)), "phone")
+        memory.add_analysis(f"f{i}", {"scene_description": f"scene {i}"}, "phone")
+
+    shard = memory.shard("phone")
+    assert list(shard.scene_analysis) == ["f2", "f3", "f4"]
+    assert shard.stats["analyses_evicted"] == 2
+
+def test_analyses_without_frames_are_bounded():
+    memory = ContextMemory(max_frames=3)
+    memory.add_frame(frame("f0", 0.0), "phone")
+    for i in range(10):
+        memory.add_analysis(f"orphan{i}", {"scene_description": "?"}, "phone")
+
+    assert len(memory.shard("phone").scene_analysis) == 3
+
+def test_maintenance_removes_aged_analyses_in_batches(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(context_memory_module.time, "time", lambda: now[0])
+    memory = ContextMemory(max_frames=100, device_idle_ttl=0)
+    for i in range(10):
+        memory.add_frame(frame(f"f{i}", float(i)), "phone")
+        memory.add_analysis(f"f{i}", {"scene_description": f"scene {i}"}, "phone")
+        now[0] += 1
+
+    # Analyses made at 1000..1009; at 1020 those older than 15s are the first five
+    now[0] = 1020.0
+    first = memory.run_maintenance(max_age=15, limit=3)
+    second = memory.run_maintenance(max_age=15, limit=3)
+
+    assert (first["removed"], second["removed"]) == (3, 2)
+    assert list(memory.shard("phone").scene_analysis)[0] == "f5"
+    assert memory.get_stats()["maintenance"]["runs"] == 2
+
+def test_maintenance_drops_idle_devices(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(context_memory_module.time, "time", lambda: now[0])
+    memory = ContextMemory(max_frames=10, device_idle_ttl=60)
+    memory.add_frame(frame("a1", 1.0), "phone-a")
+    now[0] += 50
+    memory.add_frame(frame("b1", 2.0), "phone-b")
+    now[0] += 20
+
+    result = memory.run_maintenance()
+
+    assert result["devices_dropped"] == 1
+    assert memory.shard("phone-a") is None
+    assert memory.shard("phone-b") is not None
@@ -0,0 +1,53 @@
+"""Direct answers to counting, presence and last-seen questions."""
+import time
+
+from services.context_memory import ContextMemory
+from services.context_query import ContextQueryEngine
+from models import Detection, DetectionFrame
+
+def frame(frame_id, timestamp, labels):
+    return DetectionFrame(
+        frame_id=frame_id,
+        timestamp=timestamp,
+        detections=[Detection(label=label, confidence=0.9, bbox=[0.1, 0.1, 0.3, 0.3], track_id=i) for i, label in enumerate(labels)]
+    )
+
+def engine():
+    memory = ContextMemory(max_frames=10)
+    now = time.time()
+    memory.add_frame(frame("f1", now - 120, ["dog", "person"]), "phone")
+    memory.add_frame(frame("f2", now, ["person", "person", "cup", "dining table"]), "phone")
+    memory.add_frame(frame("t1", now, ["cat"]), "tablet")
+    return ContextQueryEngine(memory)
+
+def answer(question, device_id="phone", queries=None):
+    result = (queries or engine()).answer(question, device_id)
+    return result and (result["intent"], result["answer"])
+
+def test_count_questions():
+    assert answer("How many people are there?") == ("count", "I see 2 people.")
+    assert answer("how many cups do you see") == ("count", "I see 1 cup.")
+    assert answer("How many dogs are in the room?") == ("count", "I don't see any dogs right now.")
+
+def test_presence_questions():
+    assert answer("Is there a cup?") == ("presence", "Yes, I see 1 cup.")
+    assert answer("Is anyone here?") == ("presence", "Yes, I see 2 people.")
+    assert answer("Is there a table?") == ("presence", "Yes, I see 1 dining table.")
+    assert answer("Do you see a laptop?") == ("presence", "No, I don't see a laptop right now.")
+
+def test_last_seen_questions():
+    assert answer("When did the dog last appear?") == ("last_seen", "I last saw a dog 2 minutes ago.")
+    assert answer("When was the cup last seen?") == ("last_seen", "A cup is in view right now.")
+    assert answer("When did you last see a bicycle?") == ("last_seen", "I haven't seen a bicycle.")
+
+def test_questions_are_answered_per_device():
+    assert answer("Is there a cat?") == ("presence", "No, I don't see a cat right now.")
+    assert answer("Is there a cat?", device_id="tablet") == ("presence", "Yes, I see 1 cat.")
+
+def test_other_questions_fall_back_to_the_llm():
+    queries = engine()
+
+    assert answer("What is the person doing?", queries=queries) is None
+    assert answer("Is there a unicorn?", queries=queries) is None  # Not a detection label
+    assert answer("Is there a cup?", device_id="watch", queries=queries) is None  # Nothing seen yet
+    assert queries.get_stats()["fallbacks"] == 3
@@ -0,0 +1,154 @@
+"""Frame dispatching: per-device ordering on a worker pool, overflow policies and queue deltas."""
+import asyncio
+import time
+
+import pytest
+
+from services.frame_dispatcher import FrameDispatcher, FrameQueueFullError
+from services.frame_pipeline import FrameJob
+from services.queue_state import QueueStateTracker
+from models import FrameDataMessage
+
+def job(frame_id, device_id="phone", client_id="client"):
+    return FrameJob(client_id, FrameDataMessage(type="frame_data", frame_id=frame_id, timestamp=time.time(), device_id=device_id))
+
+async def run_until_idle(dispatcher, jobs, handler):
+    await dispatcher.start(handler)
+    for frame_job in jobs:
+        await dispatcher.put(frame_job)
+    while dispatcher.qsize() or dispatcher.get_stats()["frames_in_flight"]:
+        await asyncio.sleep(0.001)
+    await dispatcher.shutdown()
+
+def test_frames_of_one_device_are_processed_in_order():
+    processed = []
+    running = set()
+
+    async def handler(frame_job):
+        assert frame_job.device_key not in running  # Never two frames of a device at once
+        running.add(frame_job.device_key)
+        await asyncio.sleep(0.002)
+        processed.append(frame_job.frame.frame_id)
+        running.discard(frame_job.device_key)
+
+    dispatcher = FrameDispatcher(num_workers=4, max_per_device=10, overflow_policy="drop_oldest")
+    asyncio.run(run_until_idle(dispatcher, [job(f"f{i}") for i in range(6)], handler))
+
+    assert processed == [f"f{i}" for i in range(6)]
+
+def test_devices_are_processed_concurrently():
+    active = []
+    peak = [0]
+
+    async def handler(frame_job):
+        active.append(frame_job)
+        peak[0] = max(peak[0], len(active))
+        await asyncio.sleep(0.01)
+        active.remove(frame_job)
+
+    dispatcher = FrameDispatcher(num_workers=3, max_per_device=10, overflow_policy="drop_oldest")
+    jobs = [job(f"{device}-{i}", device) for i in range(2) for device in ("a", "b", "c")]
+    asyncio.run(run_until_idle(dispatcher, jobs, handler))
+
+    assert peak[0] == 3
+    assert dispatcher.stats["frames_processed"] == 6
+
+def test_busy_device_does_not_starve_others():
+    processed = []
+
+    async def handler(frame_job):
+        processed.append(frame_job.frame.frame_id)
+        await asyncio.sleep(0)
+
+    dispatcher = FrameDispatcher(num_workers=1, max_per_device=10, overflow_policy="drop_oldest")
+    jobs = [job(f"a{i}", "a") for i in range(4)] + [job("b0", "b")]
+    asyncio.run(run_until_idle(dispatcher, jobs, handler))
+
+    assert processed.index("b0") < processed.index("a3")
+
+def test_failing_frame_does_not_stop_the_device():
+    processed = []
+
+    async def handler(frame_job):
+        if frame_job.frame.frame_id == "f1":
+            raise RuntimeError("model failed")
+        processed.append(frame_job.frame.frame_id)
+
+    dispatcher = FrameDispatcher(num_workers=2, max_per_device=10, overflow_policy="drop_oldest")
+    asyncio.run(run_until_idle(dispatcher, [job(f"f{i}") for i in range(3)], handler))
+
+    assert processed == ["f0", "f2"]
+    assert dispatcher.stats["frames_failed"] == 1
+
+def test_frames_without_device_id_are_ordered_per_connection():
+    assert job("f0", device_id=None, client_id="conn-1").device_key == "conn-1"
+    assert job("f0", device_id="phone", client_id="conn-1").device_key == "phone"
+
+def pending_ids(dispatcher, device_id="phone"):
+    return [frame_job.frame.frame_id for frame_job in dispatcher._pending.get(device_id, [])]
+
+def test_drop_oldest_makes_room_for_the_new_frame():
+    async def fill():
+        dispatcher = FrameDispatcher(num_workers=1, max_per_device=2, overflow_policy="drop_oldest")
+        dropped = [await dispatcher.put(job(f"f{i}")) for i in range(4)]
+        return dispatcher, dropped
+
+    dispatcher, dropped = asyncio.run(fill())
+
+    assert [[d.frame.frame_id for d in evicted] for evicted in dropped] == [[], [], ["f0"], ["f1"]]
+    assert pending_ids(dispatcher) == ["f2", "f3"]
+    assert dispatcher.qsize() == 2
+    assert dispatcher.stats["frames_dropped"] == 2
+
+def test_latest_wins_keeps_only_the_newest_frame():
+    async def fill():
+        dispatcher = FrameDispatcher(num_workers=1, max_per_device=4, overflow_policy="latest_wins")
+        for i in range(3):
+            await dispatcher.put(job(f"f{i}"))
+        await dispatcher.put(job("other", "tablet"))
+        return dispatcher
+
+    dispatcher = asyncio.run(fill())
+
+    assert pending_ids(dispatcher) == ["f2"]
+    assert pending_ids(dispatcher, "tablet") == ["other"]
+    assert dispatcher.qsize() == 2
+
+def test_reject_refuses_frames_once_full():
+    async def fill():
+        dispatcher = FrameDispatcher(num_workers=1, max_per_device=2, overflow_policy="reject")
+        await dispatcher.put(job("f0"))
+        await dispatcher.put(job("f1"))
+        with pytest.raises(FrameQueueFullError):
+            await dispatcher.put(job("f2"))
+        return dispatcher
+
+    dispatcher = asyncio.run(fill())
+
+    assert pending_ids(dispatcher) == ["f0", "f1"]
+    assert dispatcher.stats["frames_rejected"] == 1
+
+def test_unknown_overflow_policy_is_refused():
+    with pytest.raises(ValueError):
+        FrameDispatcher(overflow_policy="drop_newest")
+
+def test_queue_deltas_report_the_overflow_policy():
+    events = []
+
+    async def sink(event_type, data):
+        events.append((event_type, data))
+
+    async def track():
+        tracker = QueueStateTracker(sink, "latest_wins")
+        await tracker.added(job("f0").frame)
+        await tracker.started("f0")
+        await tracker.finished("f0", "dropped")
+        return tracker
+
+    tracker = asyncio.run(track())
+
+    assert [data["op"] for _, data in events] == ["added", "started", "finished"]
+    assert events[0][1]["overflow_policy"] == "latest_wins"
+    assert [data["seq"] for _, data in events] == [1, 2, 3]
+    assert events[2][1]["status"] == "dropped"
+    assert tracker.snapshot()["overflow_policy"] == "latest_wins"
@@ -0,0 +1,93 @@
+"""Byte-budgeted image store and its spill file."""
+import base64
+import os
+
+from services.image_store import ImageStore
+
+def image(n, size=100):
+    return bytes([n % 256]) * size
+
+def test_images_are_stored_decoded():
+    store = ImageStore(max_bytes=1000, spill_path="")
+    store.put("f1", base64.b64encode(image(1)).decode("ascii"))
+
+    assert store.get("f1") == image(1)
+    assert store.get_base64("f1") == base64.b64encode(image(1)).decode("ascii")
+
+def test_invalid_base64_is_not_stored():
+    store = ImageStore(max_bytes=1000, spill_path="")
+    store.put("f1", "not base64!")
+
+    assert "f1" not in store
+    assert store.stats["invalid"] == 1
+
+def test_least_recently_used_images_are_evicted_over_budget():
+    store = ImageStore(max_bytes=300, spill_path="")
+    for i in range(3):
+        store.put(f"f{i}", image(i))
+    store.get("f0")
+    store.put("f3", image(3))
+
+    assert store.get("f1") is None
+    assert [store.get(f"f{i}") is not None for i in (0, 2, 3)] == [True, True, True]
+    assert store.get_stats()["bytes_in_memory"] <= 300
+
+def test_eviction_does_not_touch_the_disk(tmp_path):
+    path = tmp_path / "spill.bin"
+    store = ImageStore(max_bytes=300, spill_path=str(path))
+    for i in range(6):
+        store.put(f"f{i}", image(i))
+
+    assert not path.exists()
+    assert store.spill_pending == 3
+    assert store.get("f0") == image(0)  # Readable while waiting to be spilled
+    store.close()
+
+def test_spill_writes_pending_images_and_reads_them_back(tmp_path):
+    path = tmp_path / "spill.bin"
+    store = ImageStore(max_bytes=300, spill_path=str(path))
+    for i in range(6):
+        store.put(f"f{i}", image(i))
+
+    assert store.spill() == 3
+    assert store.spill_pending == 0
+    assert os.path.getsize(path) == 300
+    assert [store.get(f"f{i}") for i in range(6)] == [image(i) for i in range(6)]
+    assert store.stats["spill_hits"] == 3
+    store.close()
+    assert not path.exists()
+
+def test_pending_images_are_bounded_by_the_budget(tmp_path):
+    store = ImageStore(max_bytes=200, spill_path=str(tmp_path / "spill.bin"))
+    for i in range(10):
+        store.put(f"f{i}", image(i))
+
+    assert store.get_stats()["bytes_pending_spill"] <= 200
+    assert store.get("f0") is None
+    assert store.stats["spill_dropped"] == 6
+    store.close()
+
+def test_full_spill_file_starts_over(tmp_path):
+    store = ImageStore(max_bytes=200, spill_path=str(tmp_path / "spill.bin"), spill_max_bytes=250)
+    for i in range(3):
+        store.put(f"f{i}", image(i))
+    store.spill()  # f0
+    for i in range(3, 6):
+        store.put(f"f{i}", image(i))
+    store.spill()  # f2 fits, f3 does not: the file starts over and f2 goes with it
+
+    assert store.stats["spill_resets"] == 1
+    assert [store.get(f"f{i}") for i in range(3)] == [None, None, None]
+    assert store.get("f3") == image(3)
+    assert store.get_stats()["spill_file_bytes"] <= 250
+    store.close()
+
+def test_discarded_images_are_not_spilled(tmp_path):
+    store = ImageStore(max_bytes=100, spill_path=str(tmp_path / "spill.bin"))
+    store.put("f0", image(0))
+    store.put("f1", image(1))
+    store.discard("f0")
+
+    assert store.spill() == 0
+    assert "f0" not in store
+    store.close()
@@ -0,0 +1,48 @@
+"""Inference scheduling: lane priority and the number of calls in flight."""
+import asyncio
+from types import SimpleNamespace
+
+from config import settings
+from services.inference_scheduler import InferenceScheduler
+
+def model_manager(text_workers=1):
+    return SimpleNamespace(text_workers=text_workers)
+
+def test_concurrency_is_capped_at_the_text_threads_without_batching(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_BATCH_MAX_SIZE", 1)
+    monkeypatch.setattr(settings, "INFERENCE_CONCURRENCY", 4)
+
+    assert InferenceScheduler(model_manager()).concurrency == 1
+    assert InferenceScheduler(model_manager(text_workers=2)).concurrency == 2
+    assert InferenceScheduler(model_manager(), concurrency=3).concurrency == 1
+
+def test_concurrency_fills_a_batch_when_batching(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_BATCH_MAX_SIZE", 4)
+    monkeypatch.setattr(settings, "INFERENCE_CONCURRENCY", 1)
+
+    assert InferenceScheduler(model_manager()).concurrency == 4
+
+def test_interactive_requests_run_before_queued_scene_requests(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_BATCH_MAX_SIZE", 1)
+    monkeypatch.setattr(settings, "INFERENCE_CONCURRENCY", 4)
+    order = []
+
+    def call(name):
+        async def run():
+            order.append(name)
+            await asyncio.sleep(0.001)
+            return name
+        return run
+
+    async def schedule():
+        scheduler = InferenceScheduler(model_manager())
+        await scheduler.start()
+        scene = [asyncio.create_task(scheduler.submit("scene", call(f"scene-{i}"))) for i in range(3)]
+        await asyncio.sleep(0)  # The first scene request starts running
+        question = asyncio.create_task(scheduler.submit("interactive", call("question")))
+        await asyncio.gather(question, *scene)
+        await scheduler.shutdown()
+
+    asyncio.run(schedule())
+
+    assert order == ["scene-0", "question", "scene-1", "scene-2"]
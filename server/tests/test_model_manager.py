@@ -0,0 +1,80 @@
+"""Streaming text generation through the model manager."""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from config import settings
+from services.cancellation import CancellationToken, GenerationCancelled
+from services.model_manager import ModelManager
+
+class SlowBackend:
+    """Emits one token every few milliseconds until it runs out or is cancelled."""
+
+    def __init__(self, tokens=200):
+        self.tokens = tokens
+        self.generated = 0
+        self.stopped = threading.Event()
+
+    def generate(self, prompt, emit=None, max_tokens=None, stop_at_sentence_end=False, model="main", cancel_token=None):
+        try:
+            for _ in range(self.tokens):
+                if cancel_token is not None and cancel_token.cancelled:
+                    raise GenerationCancelled(cancel_token.reason)
+                time.sleep(0.002)
+                self.generated += 1
+                if emit is not None:
+                    emit(" token")
+            return {"response": " token" * self.generated, "tokens_generated": self.generated, "finish_reason": "length"}
+        finally:
+            self.stopped.set()
+
+def model_manager(monkeypatch, backend):
+    monkeypatch.setattr(settings, "LLM_BATCH_MAX_SIZE", 1)
+    manager = ModelManager(backend)
+    manager.models_loaded["gemma"] = True
+    return manager
+
+def test_streamed_chunks_add_up_to_the_response(monkeypatch):
+    manager = model_manager(monkeypatch, SlowBackend(tokens=20))
+    chunks = []
+
+    async def on_token(text):
+        chunks.append(text)
+
+    result = asyncio.run(manager.process_text("prompt", on_token=on_token))
+
+    assert "".join(chunks) == result["response"]
+    manager.executor.shutdown()
+
+def test_failing_on_token_stops_the_generation(monkeypatch):
+    backend = SlowBackend()
+    manager = model_manager(monkeypatch, backend)
+
+    async def on_token(text):
+        raise ConnectionError("client went away")
+
+    async def stream():
+        with pytest.raises(ConnectionError):
+            await manager.process_text("prompt", on_token=on_token)
+        return await asyncio.to_thread(backend.stopped.wait, 1)  # The event loop stays open meanwhile
+
+    assert asyncio.run(stream())
+    assert backend.generated < backend.tokens
+    manager.executor.shutdown()
+
+def test_caller_token_still_cancels_a_stream(monkeypatch):
+    backend = SlowBackend()
+    manager = model_manager(monkeypatch, backend)
+    cancel_token = CancellationToken()
+
+    async def on_token(text):
+        cancel_token.cancel("superseded")
+
+    with pytest.raises(GenerationCancelled, match="superseded"):
+        asyncio.run(manager.process_text("prompt", on_token=on_token, cancel_token=cancel_token))
+
+    assert backend.generated < backend.tokens
+    assert manager.text_model_stats["main"]["cancelled"] == 1
+    manager.executor.shutdown()
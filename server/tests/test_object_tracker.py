@@ -0,0 +1,63 @@
+"""Object tracker bounds: TTL expiry, trajectory ring buffer and stride."""
+from services.object_tracker import ObjectTracker
+from models import Detection
+
+def detection(label, track_id, x=0.1, confidence=0.8):
+    return Detection(label=label, confidence=confidence, bbox=[x, 0.1, x + 0.2, 0.3], track_id=track_id)
+
+def test_objects_expire_once_unseen_for_the_ttl():
+    tracker = ObjectTracker(ttl=5.0)
+    tracker.update(0.0, [detection("cup", 1), detection("dog", 2)])
+    tracker.update(3.0, [detection("cup", 1)])
+    tracker.update(6.0, [detection("person", 3)])
+
+    assert "dog_2" not in tracker
+    assert "cup_1" in tracker
+    assert tracker.expire(8.5) == 1
+    assert list(tracker._objects) == ["person_3"]
+    assert tracker.stats == {"objects_created": 3, "objects_expired": 2}
+
+def test_detections_without_track_id_are_ignored():
+    tracker = ObjectTracker()
+
+    assert tracker.update(0.0, [Detection(label="cup", confidence=0.9, bbox=[0, 0, 1, 1])]) == []
+    assert len(tracker) == 0
+
+def test_trajectory_keeps_the_newest_boxes():
+    tracker = ObjectTracker(ttl=100.0, trajectory_length=4)
+    for i in range(10):
+        tracker.update(float(i), [detection("cup", 1, x=i / 16, confidence=0.5 + i / 100)])
+
+    obj = tracker.get("cup_1")
+    assert obj.detection_count == 10
+    assert obj.trajectory[:, 0].tolist() == [i / 16 for i in (6, 7, 8, 9)]
+    assert abs(obj.average_confidence - 0.545) < 1e-9
+    assert tracker.get_stats()["trajectory_bytes"] == 4 * 4 * 4
+
+def test_stride_records_every_nth_box():
+    tracker = ObjectTracker(ttl=100.0, trajectory_length=8, trajectory_stride=3)
+    for i in range(7):
+        tracker.update(float(i), [detection("cup", 1, x=i / 16)])
+
+    assert tracker.get("cup_1").trajectory[:, 0].tolist() == [i / 16 for i in (0, 3, 6)]
+
+def test_snapshot_and_load_round_trip():
+    tracker = ObjectTracker(ttl=100.0, trajectory_length=4)
+    for i in range(6):
+        tracker.update(float(i), [detection("cup", 1, x=i / 100), detection("dog", 2 + i % 2)])
+
+    restored = ObjectTracker(ttl=100.0, trajectory_length=4)
+    restored.load(tracker.snapshot())
+
+    assert restored.snapshot() == tracker.snapshot()
+    assert list(restored._objects) == list(tracker._objects)
+
+def test_version_changes_only_with_the_objects():
+    tracker = ObjectTracker(ttl=5.0)
+    tracker.update(0.0, [detection("cup", 1)])
+    version = tracker.version
+
+    tracker.update(1.0, [])
+    assert tracker.version == version
+    tracker.update(10.0, [])
+    assert tracker.version > version
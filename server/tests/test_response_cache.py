@@ -0,0 +1,150 @@
+"""Keying, scoping and bounds of the LLM response cache."""
+import asyncio
+
+from services import response_cache
+from services.llm_processor import LLMProcessor
+from services.response_cache import ResponseCache
+from models import Detection, DetectionFrame
+
+class FakeModelManager:
+    """Answers every prompt with a numbered response and records the prompts."""
+
+    def __init__(self):
+        self.prompts = []
+
+    def count_tokens(self, text):
+        return len(text.split())
+
+    def get_model_health(self):
+        return {"main": True}
+
+    async def process_text(self, prompt, vision_context=None, on_token=None, **limits):
+        self.prompts.append(prompt)
+        return {"response": f"answer {len(self.prompts)}", "tokens_generated": 2, "finish_reason": "stop"}
+
+def entry(frame_id, labels, timestamp):
+    return {
+        "frame_id": frame_id,
+        "timestamp": timestamp,
+        "detections": [{"label": label} for label in labels],
+        "analysis": {}
+    }
+
+def ask(processor, question, context, device_id):
+    return asyncio.run(processor.answer_question(question, context, device_id=device_id))
+
+def test_fingerprint_is_stable_and_order_sensitive():
+    assert ResponseCache.fingerprint("scene", [("cup", "left")], "a") == ResponseCache.fingerprint("scene", [("cup", "left")], "a")
+    assert ResponseCache.fingerprint("scene", "a", "b") != ResponseCache.fingerprint("scene", "b", "a")
+
+def test_device_scope_separates_devices():
+    cache = ResponseCache(max_entries=8, ttl=60, scope="device")
+    cache.put("key", {"scene_description": "desk"}, "phone-a")
+
+    assert cache.get("key", "phone-a") == {"scene_description": "desk"}
+    assert cache.get("key", "phone-b") is None
+
+def test_global_scope_shares_unless_overridden():
+    cache = ResponseCache(max_entries=8, ttl=60, scope="global")
+    cache.put("scene", "shared", "phone-a")
+    cache.put("question", "private", "phone-a", scope="device")
+
+    assert cache.get("scene", "phone-b") == "shared"
+    assert cache.get("question", "phone-b", scope="device") is None
+    assert cache.get("question", "phone-a", scope="device") == "private"
+
+def test_returns_copies():
+    cache = ResponseCache(max_entries=8, ttl=60)
+    cache.put("key", {"insights": ["a"]}, "phone")
+    cache.get("key", "phone")["insights"].append("b")
+
+    assert cache.get("key", "phone") == {"insights": ["a"]}
+
+def test_expired_entries_miss(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    cache = ResponseCache(max_entries=8, ttl=30)
+    cache.put("key", "value", "phone")
+
+    now[0] += 31
+    assert cache.get("key", "phone") is None
+    assert cache.stats["expired"] == 1
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_entries=2, ttl=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats["evictions"] == 1
+
+def test_disabled_cache_stores_nothing():
+    cache = ResponseCache(max_entries=0, ttl=60)
+    cache.put("key", "value")
+
+    assert cache.get("key") is None
+
+def test_repeated_question_on_same_context_is_cached():
+    manager = FakeModelManager()
+    processor = LLMProcessor(manager)
+    context = [entry("f1", ["cup"], 1.0)]
+
+    first = ask(processor, "What is in front of me?", context, "phone")
+    second = ask(processor, "  what is in FRONT of me?", context, "phone")
+
+    assert first == second == "answer 1"
+    assert len(manager.prompts) == 1
+
+def test_question_is_answered_again_when_the_scene_changes():
+    manager = FakeModelManager()
+    processor = LLMProcessor(manager)
+
+    first = ask(processor, "What is in front of me?", [entry("f1", ["cup"], 1.0)], "phone")
+    second = ask(processor, "What is in front of me?", [entry("f1", ["cup"], 1.0), entry("f2", ["dog"], 2.0)], "phone")
+
+    assert (first, second) == ("answer 1", "answer 2")
+
+def test_question_answers_stay_per_device_with_global_scope(monkeypatch):
+    monkeypatch.setattr(response_cache.settings, "RESPONSE_CACHE_SCOPE", "global")
+    manager = FakeModelManager()
+    processor = LLMProcessor(manager)
+    context = [entry("f1", ["cup"], 1.0)]
+
+    first = ask(processor, "What is in front of me?", context, "phone-a")
+    second = ask(processor, "What is in front of me?", context, "phone-b")
+
+    assert processor.response_cache.scope == "global"
+    assert (first, second) == ("answer 1", "answer 2")
+
+def scene(x, track_id):
+    detections = [Detection(label="cup", confidence=0.9, bbox=[x, 0.1, x + 0.05, 0.2], track_id=track_id)]
+    frame = DetectionFrame(frame_id=f"f{track_id}", timestamp=1.0, detections=detections)
+    vision_analysis = {"detections": [d.model_dump() for d in detections], "description": "A cup on a desk"}
+    return frame, vision_analysis
+
+def analyze(processor, frame, vision_analysis, device_id, context=()):
+    return asyncio.run(processor.analyze_scene(frame, vision_analysis, list(context), device_id=device_id))
+
+def test_cached_scene_response_is_applied_to_the_current_frame():
+    manager = FakeModelManager()
+    processor = LLMProcessor(manager)
+
+    first = analyze(processor, *scene(0.10, 1), "phone")
+    second = analyze(processor, *scene(0.12, 2), "phone")  # Same spatial bucket, moved box, new track
+
+    assert len(manager.prompts) == 1
+    assert second["scene_description"] == first["scene_description"]
+    assert [(d["bbox"][0], d["track_id"]) for d in second["enhanced_detections"]] == [(0.12, 2)]
+
+def test_scene_responses_are_not_shared_between_connections():
+    manager = FakeModelManager()
+    processor = LLMProcessor(manager)
+
+    analyze(processor, *scene(0.10, 1), "client-1")  # Neither frame carries a device_id
+    analyze(processor, *scene(0.10, 1), "client-2")
+
+    assert len(manager.prompts) == 2
@@ -0,0 +1,77 @@
+"""Scene change gate: reusing the last analysis of an unchanged scene, and when not to."""
+from services.scene_change import SceneChangeGate
+
+RESULT = {"scene_description": "A person at a desk with a cup.", "contextual_insights": ["working"]}
+
+def vision(*detections, description="A person sitting at a desk with a cup"):
+    return {
+        "detections": [
+            {"label": label, "confidence": 0.9, "bbox": list(bbox), "track_id": track_id}
+            for label, track_id, bbox in detections
+        ],
+        "description": description
+    }
+
+DESK = vision(("person", 1, (0.1, 0.1, 0.5, 0.9)), ("cup", 2, (0.6, 0.5, 0.7, 0.6)))
+
+def analyzed_gate(**limits):
+    gate = SceneChangeGate(threshold=0.25, max_reuse=limits.get("max_reuse", 15), max_age=limits.get("max_age", 10.0))
+    assert gate.check("phone", DESK) == (None, 1.0)  # Nothing to compare with yet
+    gate.record("phone", DESK, RESULT)
+    return gate
+
+def test_unchanged_scene_reuses_a_copy_of_the_analysis():
+    gate = analyzed_gate()
+    slightly_moved = vision(("person", 1, (0.12, 0.1, 0.52, 0.9)), ("cup", 2, (0.6, 0.5, 0.7, 0.6)))
+
+    result, score = gate.check("phone", slightly_moved)
+
+    assert result == RESULT
+    assert score < 0.25
+    result["contextual_insights"].append("changed by the caller")
+    assert gate.check("phone", DESK)[0] == RESULT
+    assert gate.get_stats()["analyses_reused"] == 2
+
+def test_changed_scene_needs_a_new_analysis():
+    gate = analyzed_gate()
+    new_object = vision(
+        ("person", 1, (0.1, 0.1, 0.5, 0.9)), ("cup", 2, (0.6, 0.5, 0.7, 0.6)), ("laptop", 3, (0.2, 0.5, 0.5, 0.7))
+    )
+    moved = vision(("person", 1, (0.5, 0.1, 0.9, 0.9)), ("cup", 2, (0.6, 0.5, 0.7, 0.6)))
+    new_description = vision(*[
+        (d["label"], d["track_id"], d["bbox"]) for d in DESK["detections"]
+    ], description="Someone holding a phone near a window")
+
+    for frame in (new_object, moved, new_description):
+        result, score = gate.check("phone", frame)
+        assert result is None
+        assert score >= 0.25
+
+def test_reuse_stops_after_max_reuse_frames():
+    gate = analyzed_gate(max_reuse=2)
+
+    assert [gate.check("phone", DESK)[0] is not None for _ in range(3)] == [True, True, False]
+    gate.record("phone", DESK, RESULT)
+    assert gate.check("phone", DESK)[0] == RESULT
+
+def test_stale_analysis_is_not_reused():
+    gate = analyzed_gate(max_age=10.0)
+    gate._states["phone"].analyzed_at -= 11
+
+    result, score = gate.check("phone", DESK)
+
+    assert result is None
+    assert score == 0.0
+
+def test_devices_are_compared_separately():
+    gate = analyzed_gate()
+
+    assert gate.check("tablet", DESK) == (None, 1.0)
+    gate.forget("phone")
+    assert gate.check("phone", DESK) == (None, 1.0)
+
+def test_zero_threshold_disables_the_gate():
+    gate = SceneChangeGate(threshold=0)
+    gate.record("phone", DESK, RESULT)
+
+    assert gate.check("phone", DESK) == (None, 1.0)
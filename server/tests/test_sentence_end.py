@@ -0,0 +1,164 @@
+"""Stopping generation at the end of the first sentence."""
+import asyncio
+import itertools
+from types import SimpleNamespace
+
+from services import inference_backends
+from services.batch_engine import TextBatchEngine
+from services.inference_backends import BatchSession, MLXBatchSession, MLXCoreMLBackend, StandInBackend, ends_sentence
+from services.inference_executor import InferenceExecutor
+
+# Token chunks as a real tokenizer emits them: the period is a token of its own
+TOKENS = ["The", " cup", " is", " on", " the", " table", ".", " It", " is", " red", "."]
+
+def test_ends_sentence_needs_more_than_punctuation():
+    assert ends_sentence("The cup is here.")
+    assert ends_sentence("Is it? ")
+    assert not ends_sentence(".")
+    assert not ends_sentence("The cup")
+
+def mlx_backend(monkeypatch):
+    """MLX backend whose mlx_lm.stream_generate yields TOKENS, without MLX or a model."""
+    def stream_generate(model, tokenizer, prompt, max_tokens, **kwargs):
+        for token in TOKENS[:max_tokens]:
+            yield SimpleNamespace(text=token, finish_reason=None)
+
+    monkeypatch.setattr(inference_backends, "mlx_lm", SimpleNamespace(stream_generate=stream_generate))
+    backend = MLXCoreMLBackend.__new__(MLXCoreMLBackend)  # Skips the MLX availability check and model loading
+    backend.text_models = {"main": (object(), object())}
+    backend.prompt_caches = {}
+    return backend
+
+def test_mlx_generate_stops_on_period_token(monkeypatch):
+    emitted = []
+
+    result = mlx_backend(monkeypatch).generate("prompt", emit=emitted.append, max_tokens=64, stop_at_sentence_end=True)
+
+    assert result["response"] == "The cup is on the table."
+    assert result["finish_reason"] == "sentence_end"
+    assert result["tokens_generated"] == 7
+    assert "".join(emitted) == result["response"]
+
+def test_mlx_generate_runs_to_max_tokens_without_stop(monkeypatch):
+    result = mlx_backend(monkeypatch).generate("prompt", max_tokens=len(TOKENS))
+
+    assert result["response"] == "".join(TOKENS)
+    assert result["finish_reason"] == "length"
+
+class TokenBatchSession(BatchSession):
+    """Emits TOKENS for every sequence, one per step."""
+
+    def __init__(self):
+        self.sequences = {}
+
+    def add(self, key, prompt, max_tokens):
+        self.sequences[key] = list(TOKENS[:max_tokens])
+
+    def step(self):
+        results = []
+        for key in list(self.sequences):
+            tokens = self.sequences[key]
+            text = tokens.pop(0)
+            results.append((key, text, 1, None if tokens else "length"))
+            if not tokens:
+                del self.sequences[key]
+        return results
+
+    def cancel(self, key):
+        self.sequences.pop(key, None)
+
+    @property
+    def active(self):
+        return len(self.sequences)
+
+def test_batch_engine_stops_on_period_token():
+    backend = SimpleNamespace(open_batch=lambda max_size, model="main": TokenBatchSession())
+    executor = InferenceExecutor({"text": 1})
+    engine = TextBatchEngine(backend, executor, max_size=4, window=0)
+
+    async def generate():
+        return await asyncio.gather(
+            engine.submit("summary", max_tokens=64, stop_at_sentence_end=True),
+            engine.submit("question", max_tokens=64)
+        )
+
+    try:
+        summary, answer = asyncio.run(generate())
+    finally:
+        executor.shutdown()
+
+    assert summary["response"] == "The cup is on the table."
+    assert summary["finish_reason"] == "sentence_end"
+    assert answer["response"] == "".join(TOKENS)
+    assert answer["finish_reason"] == "length"
+
+class FakeBatchGenerator:
+    """mlx_lm BatchGenerator stand-in: sequence i decodes token ids 0, 1, 2... until removed or at max_tokens."""
+
+    def __init__(self, model, max_tokens, stop_tokens, completion_batch_size, prefill_batch_size):
+        self.sequences = {}  # uid -> [next token, max tokens]
+        self.uids = itertools.count()
+        self.decoded = 0
+
+    def insert(self, prompts, max_tokens):
+        uids = [next(self.uids) for _ in prompts]
+        for uid in uids:
+            self.sequences[uid] = [0, max_tokens]
+        return uids
+
+    def next(self):
+        responses = []
+        for uid, state in list(self.sequences.items()):
+            token = state[0]
+            state[0] += 1
+            self.decoded += 1
+            finish_reason = "length" if state[0] >= state[1] else None
+            responses.append(SimpleNamespace(uid=uid, token=token, finish_reason=finish_reason))
+            if finish_reason is not None:
+                del self.sequences[uid]
+        return responses
+
+    def remove(self, uids):
+        for uid in uids:
+            self.sequences.pop(uid, None)
+
+def test_batched_mlx_sequence_stops_decoding_at_sentence_end():
+    tokenizer = SimpleNamespace(
+        eos_token_ids=[],
+        encode=lambda prompt: [0],
+        decode=lambda tokens: "".join(TOKENS[t % len(TOKENS)] for t in tokens)
+    )
+    sessions = []
+
+    def open_batch(max_size, model="main"):
+        sessions.append(MLXBatchSession(FakeBatchGenerator, object(), tokenizer, max_size))
+        return sessions[-1]
+
+    executor = InferenceExecutor({"text": 1})
+    engine = TextBatchEngine(SimpleNamespace(open_batch=open_batch), executor, max_size=1, window=0)
+
+    async def generate():
+        return await asyncio.gather(*[
+            engine.submit(f"summary {i}", max_tokens=64, stop_at_sentence_end=True) for i in range(2)
+        ])
+
+    try:
+        results = asyncio.run(generate())
+    finally:
+        executor.shutdown()
+
+    assert [result["response"] for result in results] == ["The cup is on the table."] * 2
+    generator = sessions[0].generator
+    assert generator.sequences == {}
+    assert generator.decoded == 2 * 7  # Neither sequence decoded past its sentence end
+
+def test_standin_stops_after_first_sentence(monkeypatch):
+    monkeypatch.setattr(inference_backends.settings, "STANDIN_TEXT_LATENCY", 0.0)
+    backend = StandInBackend()
+    words = backend._response_words("describe the kitchen table and the chairs around it")
+
+    result = backend.generate("describe the kitchen table and the chairs around it", stop_at_sentence_end=True)
+
+    first_sentence = next(index for index, word in enumerate(words) if word.endswith("."))
+    assert result["response"] == " ".join(words[:first_sentence + 1])
+    assert result["finish_reason"] in ("sentence_end", "stop")